@@ -1,9 +1,49 @@
 from django.contrib import admin
-from .models import User, Listing, Bid, Watchlist, Comment
+from .models import User, Listing, Bid, ProxyBid, Watchlist, Comment, ArchivedListing, ArchivedBid, ArchivedComment
+
+
+# The __str__ of bids, watchlist entries and comments reads their listing and
+# user (and a listing's reads its owner), so the change lists join them up front
+
+class ListingAdmin(admin.ModelAdmin):
+    list_select_related = ["user"]
+
+
+class BidAdmin(admin.ModelAdmin):
+    list_select_related = ["user", "listing__user"]
+
+
+class ProxyBidAdmin(admin.ModelAdmin):
+    list_select_related = ["user", "listing__user"]
+
+
+class WatchlistAdmin(admin.ModelAdmin):
+    list_select_related = ["user", "listing__user"]
+
+
+class CommentAdmin(admin.ModelAdmin):
+    list_select_related = ["user", "listing__user"]
+
+
+class ArchivedListingAdmin(admin.ModelAdmin):
+    list_select_related = ["user"]
+
+
+class ArchivedBidAdmin(admin.ModelAdmin):
+    list_select_related = ["user", "listing__user"]
+
+
+class ArchivedCommentAdmin(admin.ModelAdmin):
+    list_select_related = ["user", "listing__user"]
+
 
 # Register your models here.
 admin.site.register(User)
-admin.site.register(Listing)
-admin.site.register(Bid)
-admin.site.register(Watchlist)
-admin.site.register(Comment)
\ No newline at end of file
+admin.site.register(Listing, ListingAdmin)
+admin.site.register(Bid, BidAdmin)
+admin.site.register(ProxyBid, ProxyBidAdmin)
+admin.site.register(Watchlist, WatchlistAdmin)
+admin.site.register(Comment, CommentAdmin)
+admin.site.register(ArchivedListing, ArchivedListingAdmin)
+admin.site.register(ArchivedBid, ArchivedBidAdmin)
+admin.site.register(ArchivedComment, ArchivedCommentAdmin)
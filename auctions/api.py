@@ -0,0 +1,281 @@
+import datetime
+import functools
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET, require_http_methods
+
+try:
+    import orjson
+except ImportError:
+    # Without orjson the standard library encodes the same JSON, only slower
+    orjson = None
+
+from .archive import get_listing
+from .bidding import place_bid, place_proxy_bid
+from .models import Listing, ArchivedListing, Watchlist
+from .pagination import keyset_page
+from .routers import read_from_replica, stick_to_primary
+from .snapshots import get_listing_snapshot
+from .views import bid_history, bid_to_dict, listing_to_dict
+
+
+# Version 1 of the JSON API under /api/v1/. Responses are built from
+# values_list() rows or the cached listing snapshots, never from templates,
+# and every batch endpoint runs a fixed number of queries however many ids it
+# is given, up to AUCTIONS_API_MAX_BATCH
+
+# API name: model field, of the listings returned by id
+LISTING_FIELDS = {
+    "id": "id",
+    "title": "listing_title",
+    "description": "listing_description",
+    "seller": "user__username",
+    "current_bid": "current_bid",
+    "image_url": "listing_image_url",
+    "category": "listing_category",
+    "active": "active",
+    "end_at": "end_at",
+    "bid_count": "bid_count",
+    "comment_count": "comment_count",
+}
+
+PRICE_FIELDS = {
+    "current_bid": "current_bid",
+    "highest_bidder": "highest_bidder__username",
+    "bid_count": "bid_count",
+    "active": "active",
+    "end_at": "end_at",
+    "updated_at": "updated_at",
+}
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def api_response(data, status=200):
+    '''Encodes data as compact JSON, with orjson when it is installed'''
+    if orjson is not None:
+        body = orjson.dumps(data)
+    else:
+        body = json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+    return HttpResponse(body, status=status, content_type="application/json")
+
+
+def api_view(view):
+    '''Turns ApiErrors and 404s raised by view into JSON errors'''
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return api_response({"error": str(error)}, status=error.status)
+        except Http404:
+            return api_response({"error": "Not found"}, status=404)
+    return wrapper
+
+
+def signed_in(view):
+    '''login_required for the API, answering 401 instead of redirecting to the login page'''
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise ApiError("Authentication required", status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _check_batch(ids):
+    maximum = getattr(settings, "AUCTIONS_API_MAX_BATCH", 100)
+    if len(ids) > maximum:
+        raise ApiError(f"At most {maximum} ids at a time")
+    return ids
+
+
+def batch_ids(request):
+    '''The listing ids asked for with ?ids=1,2,3, without repeats, in the order given'''
+    try:
+        ids = [int(value) for value in request.GET.get("ids", "").split(",") if value.strip()]
+    except ValueError:
+        raise ApiError("ids must be a comma separated list of integers")
+    return _check_batch(list(dict.fromkeys(ids)))
+
+
+def _json_ids(data, name):
+    ids = data.get(name, [])
+    if not isinstance(ids, list) or not all(isinstance(value, int) and not isinstance(value, bool) for value in ids):
+        raise ApiError(f"{name} must be a list of integers")
+    return ids
+
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        raise ApiError("The body must be JSON")
+    if not isinstance(data, dict):
+        raise ApiError("The body must be a JSON object")
+    return data
+
+
+def _rows(queryset, fields):
+    '''Rows of queryset as dicts with the API names of fields, without making model instances'''
+    names = list(fields)
+    return [dict(zip(names, row)) for row in queryset.values_list(*fields.values())]
+
+
+def _page(request, queryset, to_dict, *others):
+    page = keyset_page(request, queryset, *others)
+    return {"results": [to_dict(row) for row in page], "next": page.next_cursor, "prev": page.prev_cursor}
+
+
+def comment_to_dict(comment):
+    return {"id": comment.id, "user": comment.user.username, "comment": comment.comment}
+
+
+@require_GET
+@api_view
+@read_from_replica
+def listings(request):
+    '''
+    The listings with the ?ids= given, in that order, with the ids of any
+    that do not exist under "missing". Without ids, one page of the active
+    listings, or the closed ones, archived included, with ?status=inactive
+    '''
+    if "ids" not in request.GET:
+        if request.GET.get("status") == "inactive":
+            return api_response(_page(request, Listing.objects.inactive(), listing_to_dict, ArchivedListing.objects.all()))
+        return api_response(_page(request, Listing.objects.active(), listing_to_dict))
+    ids = batch_ids(request)
+    found = {row["id"]: row for row in _rows(Listing.objects.filter(id__in=ids), LISTING_FIELDS)}
+    archived = [listing_id for listing_id in ids if listing_id not in found]
+    if archived:
+        # Only a batch naming ids missing from Listing reads the archive
+        rows = _rows(ArchivedListing.objects.filter(id__in=archived).annotate(active=Value(False)), LISTING_FIELDS)
+        found.update((row["id"], row) for row in rows)
+    return api_response({
+        "results": [found[listing_id] for listing_id in ids if listing_id in found],
+        "missing": [listing_id for listing_id in ids if listing_id not in found],
+    })
+
+
+@require_GET
+@api_view
+def listing(request, listing_id):
+    '''One listing with its comments, from the cached snapshot'''
+    snapshot = get_listing_snapshot(listing_id)
+    return api_response({
+        **{name: snapshot[field] for name, field in LISTING_FIELDS.items() if field != "user__username"},
+        "seller": snapshot["user"],
+        "highest_bidder_id": snapshot["highest_bidder_id"],
+        "winner_id": snapshot["winner_id"],
+        "comments": snapshot["comments"],
+    })
+
+
+@require_GET
+@api_view
+@read_from_replica
+def prices(request):
+    '''The current price, highest bidder and state of each of the listings with the ?ids= given, keyed by id'''
+    names = list(PRICE_FIELDS)
+    rows = Listing.objects.filter(id__in=batch_ids(request)).values_list("id", *PRICE_FIELDS.values())
+    return api_response({str(listing_id): dict(zip(names, values)) for listing_id, *values in rows})
+
+
+@require_http_methods(["GET", "POST"])
+@api_view
+def listing_bids(request, listing_id):
+    '''
+    GET: the bids on a listing, oldest first, one page at a time.
+    POST {"amount": n}: places a bid, or with "automatic": true a maximum to be bid up to
+    '''
+    if request.method == "POST":
+        return place_listing_bid(request, listing_id)
+    return bid_page(request, listing_id)
+
+
+@read_from_replica
+def bid_page(request, listing_id):
+    listing = get_listing(listing_id, ["id"])
+    return api_response(_page(request, bid_history(listing.bid_on_listing.all()), bid_to_dict))
+
+
+@signed_in
+@stick_to_primary
+def place_listing_bid(request, listing_id):
+    data = _json_body(request)
+    amount = data.get("amount")
+    if not isinstance(amount, int) or isinstance(amount, bool):
+        raise ApiError("amount must be an integer")
+    if not Listing.objects.filter(pk=listing_id).exists():
+        raise Http404
+    place = place_proxy_bid if data.get("automatic") else place_bid
+    result = place(request.user, Listing(pk=listing_id), amount)
+    return api_response({
+        "accepted": result.accepted,
+        "current_bid": result.current_bid,
+        "highest_bidder_id": result.highest_bidder_id,
+        "active": result.active,
+    })
+
+
+@require_GET
+@api_view
+@read_from_replica
+def listing_comments(request, listing_id):
+    '''The comments on a listing, archived or not, oldest first, one page at a time'''
+    comments = get_listing(listing_id, ["id"]).comment_set.select_related("user").only("id", "comment", "user__username")
+    return api_response(_page(request, comments, comment_to_dict))
+
+
+@require_http_methods(["GET", "POST"])
+@api_view
+@signed_in
+def watchlist(request):
+    '''
+    GET: the ids of the listings on the user's watchlist.
+    POST {"add": [ids], "remove": [ids], "toggle": [ids]}: changes many
+    entries at once, in four queries however many ids there are
+    '''
+    if request.method == "POST":
+        return change_watchlist(request)
+    watched = Watchlist.objects.filter(user=request.user).order_by("listing_id").values_list("listing_id", flat=True)
+    return api_response({"listings": list(watched)})
+
+
+@stick_to_primary
+def change_watchlist(request):
+    data = _json_body(request)
+    add, remove, toggle = (set(_json_ids(data, name)) for name in ("add", "remove", "toggle"))
+    requested = _check_batch(add | remove | toggle)
+    with transaction.atomic():
+        existing = set(Listing.objects.filter(id__in=requested).values_list("id", flat=True))
+        watched = set(Watchlist.objects.filter(user=request.user, listing_id__in=existing)
+            .values_list("listing_id", flat=True))
+        added = ((add | toggle) - watched - remove) & existing
+        removed = (remove | (toggle & watched)) & watched
+        if removed:
+            Watchlist.objects.filter(user=request.user, listing_id__in=removed).delete()
+        if added:
+            # Rows added meanwhile by another request from the same user are skipped
+            Watchlist.objects.bulk_create(
+                [Watchlist(user=request.user, listing_id=listing_id) for listing_id in added], ignore_conflicts=True)
+    return api_response({
+        "added": sorted(added),
+        "removed": sorted(removed),
+        "missing": sorted(requested - existing),
+    })
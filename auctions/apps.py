@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals
+        from .sqlite import apply_pragmas
+        connection_created.connect(apply_pragmas)
@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+
+from .models import Listing, Bid, Comment, ArchivedListing, ArchivedBid, ArchivedComment
+
+
+def _copied_fields(model):
+    '''The columns of an archive model that are copied from its hot model'''
+    return [field.attname for field in model._meta.concrete_fields if field.attname != "archived_at"]
+
+
+def archive_closed_listings(older_than=None, now=None, batch_size=500):
+    '''
+    Moves the listings closed for longer than older_than (a timedelta,
+    AUCTIONS_ARCHIVE_AFTER_DAYS days unless given), with their bids and
+    comments, into the archive tables, batch_size listings per transaction,
+    and returns how many were moved.
+
+    A closed listing's updated_at is when it was closed or last commented
+    on, so that is what the age is measured from. The batch is locked while
+    it is copied, so a comment cannot land between the copy and the delete.
+    Deleting the listings drops their watchlist entries and hidden maximums,
+    which mean nothing once an auction is over, and post_delete takes them
+    out of the search index, the snapshot cache and the category counts.
+    '''
+    now = now or timezone.now()
+    if older_than is None:
+        older_than = timedelta(days=getattr(settings, "AUCTIONS_ARCHIVE_AFTER_DAYS", 90))
+    cutoff = now - older_than
+    listing_fields = _copied_fields(ArchivedListing)
+    bid_fields = _copied_fields(ArchivedBid)
+    comment_fields = _copied_fields(ArchivedComment)
+    archived = 0
+    while True:
+        with transaction.atomic():
+            listings = list(
+                Listing.objects.inactive().filter(updated_at__lt=cutoff).select_for_update()
+                .order_by("id").values(*listing_fields)[:batch_size]
+            )
+            if not listings:
+                break
+            ids = [row["id"] for row in listings]
+            ArchivedListing.objects.bulk_create([ArchivedListing(archived_at=now, **row) for row in listings])
+            ArchivedBid.objects.bulk_create(
+                [ArchivedBid(**row) for row in Bid.objects.filter(listing_id__in=ids).values(*bid_fields)])
+            ArchivedComment.objects.bulk_create(
+                [ArchivedComment(**row) for row in Comment.objects.filter(listing_id__in=ids).values(*comment_fields)])
+            Listing.objects.filter(id__in=ids).delete()
+            archived += len(ids)
+    return archived
+
+
+def get_listing(listing_id, fields=None):
+    '''
+    The listing with listing_id, from Listing or else the archive, with only
+    fields loaded when given. Raises Http404 when it is in neither
+    '''
+    for model in (Listing, ArchivedListing):
+        queryset = model.objects.all() if fields is None else model.objects.only(*fields)
+        listing = queryset.filter(pk=listing_id).first()
+        if listing is not None:
+            return listing
+    raise Http404("No Listing matches the given query.")
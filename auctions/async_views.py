@@ -0,0 +1,94 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import render, redirect
+from django.views.decorators.vary import vary_on_cookie
+
+from .conditional import afeed_etag, afeed_last_modified, alisting_etag, alisting_last_modified, alisting_state, async_condition
+from .models import Category, Listing, ArchivedListing, Watchlist
+from .pagination import akeyset_page
+from .routers import read_from_replica
+from .snapshots import aget_listing_snapshot
+from .views import listing_to_dict, render_listing
+
+
+# Native async versions of the read only browse views, routed instead of the
+# ones in views.py when AUCTIONS_ASYNC_VIEWS is set, as commerce/asgi.py does.
+# They answer the same urls with the same pages. Rendering a template is
+# synchronous, so each view loads the user before it renders: the lazy
+# request.user would otherwise query the database from the event loop
+
+
+async def arender_feed(request, template, context_name, queryset, context=None, to_dict=listing_to_dict, archived=None):
+    '''render_feed, fetching the page with the async ORM'''
+    others = [archived] if archived is not None else []
+    page = await akeyset_page(request, queryset, *others)
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "results": [to_dict(row) for row in page],
+            "next": page.next_cursor,
+            "prev": page.prev_cursor,
+        })
+    request.user = await request.auser()
+    context = dict(context or {})
+    context[context_name] = page.object_list
+    context["page"] = page
+    return render(request, template, context)
+
+
+@read_from_replica
+@vary_on_cookie
+@async_condition(etag_func=afeed_etag, last_modified_func=afeed_last_modified)
+async def index(request):
+    '''Gives back the active listings in the database, one page at a time'''
+    return await arender_feed(request, "auctions/index.html", "active_listings",
+        Listing.objects.active())
+
+
+@read_from_replica
+async def inactive(request):
+    '''Gives back the inactive listings in the database, archived ones included, one page at a time'''
+    return await arender_feed(request, "auctions/inactive.html", "inactive_listings",
+        Listing.objects.inactive(), archived=ArchivedListing.objects.all())
+
+
+@read_from_replica
+async def categories(request):
+    '''Displays links to all listing categories available'''
+    categories = [category async for category in Category.objects.filter(total_count__gt=0).order_by('name')]
+    request.user = await request.auser()
+    return render(request, "auctions/categories.html", {
+        "categories": categories
+    })
+
+
+@read_from_replica
+async def category_view(request, category=None):
+    '''Returns the listings under a specific category, one page at a time'''
+    if category is None:
+        return redirect('categories')
+    return await arender_feed(request, "auctions/category_view.html", "category_listings",
+        Listing.objects.filter(category__key=Category.clean_name(category).casefold()), {"category": category})
+
+
+@login_required
+@read_from_replica
+async def watchlist_view(request):
+    '''Shows the items on the current user's watchlist, one page at a time'''
+    user = await request.auser()
+    listed_in_watchlist = Watchlist.objects.filter(user=user).values('listing')
+    return await arender_feed(request, "auctions/watchlist_view.html", "watchlist",
+        Listing.objects.filter(id__in=listed_in_watchlist))
+
+
+@vary_on_cookie
+@async_condition(etag_func=alisting_etag, last_modified_func=alisting_last_modified)
+async def listing(request, listing_id):
+    '''Presents a listing, from its cached snapshot'''
+    user = request.user = await request.auser()
+    listing = await aget_listing_snapshot(listing_id)
+    on_watchlist = False
+    if user.is_authenticated:
+        # Read along with the ETag, in the same query
+        state = await alisting_state(request, listing_id)
+        on_watchlist = bool(state and state[1])
+    return render_listing(request, listing, user, on_watchlist)
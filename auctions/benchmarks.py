@@ -0,0 +1,147 @@
+import importlib
+import random
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import clear_url_caches
+
+
+@contextmanager
+def scratch_database(name=None):
+    '''
+    Runs the benchmark commands against a throwaway test database, created
+    and migrated the same way the test runner does, so db.sqlite3 is never touched.
+    SQLite test databases live in memory unless a file name is given
+    '''
+    setup_test_environment()
+    test_settings = connection.settings_dict["TEST"]
+    old_test_name = test_settings["NAME"]
+    if name:
+        test_settings["NAME"] = name
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings["NAME"] = old_test_name
+        teardown_test_environment()
+
+
+def _reload_urls():
+    from commerce import urls as project_urls
+    from . import urls as auction_urls
+    # The project urls hold on to the patterns of the app urls they include
+    importlib.reload(auction_urls)
+    importlib.reload(project_urls)
+    clear_url_caches()
+
+
+@contextmanager
+def browse_views(async_views):
+    '''
+    Routes the browse urls to the async views, or the sync ones, until the
+    block ends. AUCTIONS_ASYNC_VIEWS is otherwise only read when the urls are imported
+    '''
+    try:
+        with override_settings(AUCTIONS_ASYNC_VIEWS=async_views):
+            _reload_urls()
+            yield
+    finally:
+        _reload_urls()
+
+
+
+WORDS = (
+    "antique brass oak lamp vintage chair table desk mirror clock vase rug bicycle guitar camera "
+    "watch ring necklace painting print poster book record radio phone laptop console keyboard "
+    "jacket boots scarf hat bag wallet sofa shelf cabinet bench stool kettle teapot bowl plate"
+).split()
+
+
+def percentiles(timings):
+    '''Returns the p50, p95 and p99 of a list of durations in seconds, in milliseconds'''
+    timings = sorted(timings)
+    def at(fraction):
+        return round(timings[min(len(timings) - 1, int(len(timings) * fraction))] * 1000, 3)
+    return {"p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99)}
+
+
+def seed(users=1000, listings=10000, bids=5, comments=2, watchers=3, categories=50,
+        batch_size=5000, random_seed=0, log=None):
+    '''
+    Fills the database with generated users, listings, bids, comments and
+    watchlist entries using bulk_create, batch_size listings (and their rows)
+    per transaction. bids, comments and watchers are per listing averages.
+    Returns the ids of the users created.
+
+    bulk_create skips save() and its signals, so the category counts and the
+    search index are rebuilt once at the end.
+    '''
+    from .models import User, Category, Listing, Bid, Watchlist, Comment
+    from .search import get_search_backend
+
+    rng = random.Random(random_seed)
+    log = log or (lambda message: None)
+    run = f"{time.time_ns():x}"
+
+    def words(count):
+        return " ".join(rng.choices(WORDS, k=count))
+
+    with transaction.atomic():
+        Category.objects.bulk_create(
+            [Category(name=f"category {i}", key=f"category {i}") for i in range(categories)],
+            ignore_conflicts=True,
+        )
+    category_list = list(Category.objects.filter(key__startswith="category ").values_list("id", "name"))
+
+    for start in range(0, users, batch_size):
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(username=f"seed {run} {i}", password="!")
+                for i in range(start, min(users, start + batch_size))
+            ])
+    user_ids = list(User.objects.filter(username__startswith=f"seed {run} ").values_list("id", flat=True))
+    log(f"{len(user_ids)} users")
+
+    for start in range(0, listings, batch_size):
+        with transaction.atomic():
+            batch, bid_plans = [], []
+            for i in range(start, min(listings, start + batch_size)):
+                category_id, category_name = rng.choice(category_list)
+                owner = rng.choice(user_ids)
+                listing = Listing(
+                    user_id=owner, listing_title=f"{words(2)} {run} {i}", listing_description=words(12),
+                    starting_bid=rng.randint(1, 500), category_id=category_id,
+                    listing_category=category_name, active=rng.random() < 0.9, highest_bidder_id=owner,
+                )
+                # Decide the bids up front so the listing is inserted with its final price
+                listing.current_bid = listing.starting_bid
+                plan = []
+                for _ in range(rng.randint(0, 2 * bids)):
+                    listing.current_bid += rng.randint(1, 20)
+                    listing.highest_bidder_id = rng.choice(user_ids)
+                    plan.append((listing.highest_bidder_id, listing.current_bid))
+                listing.bid_count = len(plan)
+                listing.comment_count = rng.randint(0, 2 * comments)
+                batch.append(listing)
+                bid_plans.append(plan)
+            created = Listing.objects.bulk_create(batch)
+
+            bid_rows, comment_rows, watch_rows = [], [], []
+            for listing, plan in zip(created, bid_plans):
+                bid_rows.extend(Bid(user_id=user_id, listing=listing, amount=amount) for user_id, amount in plan)
+                for _ in range(listing.comment_count):
+                    comment_rows.append(Comment(user_id=rng.choice(user_ids), listing=listing, comment=words(6)))
+                for user_id in set(rng.choices(user_ids, k=rng.randint(0, 2 * watchers))):
+                    watch_rows.append(Watchlist(user_id=user_id, listing=listing))
+            Bid.objects.bulk_create(bid_rows, batch_size=batch_size)
+            Comment.objects.bulk_create(comment_rows, batch_size=batch_size)
+            Watchlist.objects.bulk_create(watch_rows, batch_size=batch_size)
+        log(f"{min(listings, start + batch_size)} listings")
+
+    Category.recount()
+    get_search_backend().rebuild()
+    return user_ids
@@ -0,0 +1,163 @@
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from .events import publish_listing_event
+from .models import Listing, Bid, ProxyBid
+from .snapshots import invalidate_listing_snapshot
+from .sqlite import retry_on_locked
+
+
+BidResult = namedtuple("BidResult", ["accepted", "current_bid", "highest_bidder_id", "active", "bid"])
+
+
+def _open(now):
+    return Q(end_at__isnull=True) | Q(end_at__gt=now)
+
+
+def _extend_end(now):
+    '''Moves an end time closer than AUCTIONS_SOFT_CLOSE_SECONDS out to that far from now'''
+    extended_end = now + timedelta(seconds=getattr(settings, "AUCTIONS_SOFT_CLOSE_SECONDS", 300))
+    return Case(When(end_at__lt=extended_end, then=Value(extended_end)), default=F("end_at"))
+
+
+def settle_proxies(listing_id, current_bid, highest_bidder_id):
+    '''
+    Works out how the proxy bids on a listing answer its price of current_bid,
+    held by highest_bidder_id. Only the two highest maximums matter, read with
+    one seek on the proxybid_listing_max_idx index however many proxies there
+    are: the higher one wins at one AUCTIONS_BID_INCREMENT above the other, or
+    the current bid, but never above its own maximum. Earlier proxies win ties.
+
+    Returns (price, highest bidder id, highest bidder username, bids), where
+    bids are the unsaved Bid rows the bidding war would have left, or None
+    when the proxies change nothing
+    '''
+    top = list(ProxyBid.objects.filter(listing_id=listing_id).order_by("-max_amount", "id")
+        .values_list("user_id", "user__username", "max_amount")[:2])
+    if not top:
+        return None
+    leader_id, leader_name, leader_max = top[0]
+    runner_id, _, runner_max = top[1] if len(top) > 1 else (None, None, None)
+    increment = getattr(settings, "AUCTIONS_BID_INCREMENT", 1)
+    # The runner up is pushed all the way to their maximum
+    runner_bids = [Bid(user_id=runner_id, listing_id=listing_id, amount=runner_max)] \
+        if runner_max is not None and runner_max > current_bid else []
+
+    if leader_id == highest_bidder_id:
+        if not runner_bids:
+            return None
+        price = min(leader_max, runner_max + increment)
+    else:
+        if leader_max <= current_bid:
+            return None
+        price = min(leader_max, max(current_bid, runner_max or current_bid) + increment)
+    bids = runner_bids + [Bid(user_id=leader_id, listing_id=listing_id, amount=price)]
+    return price, leader_id, leader_name, bids
+
+
+def _save_settled(listing_id, settled, now, extra_bids=()):
+    '''
+    Writes the bids of a settled bidding war in one INSERT and the listing's
+    new state in one UPDATE. extra_bids are written along with them but were
+    already counted in bid_count by the caller
+    '''
+    price, highest_bidder_id, highest_bidder_name, bids = settled
+    bids = Bid.objects.bulk_create([*extra_bids, *bids])
+    Listing.objects.filter(pk=listing_id).update(
+        current_bid=price,
+        highest_bidder_id=highest_bidder_id,
+        bid_count=F("bid_count") + len(bids) - len(extra_bids),
+        updated_at=now,
+        end_at=_extend_end(now),
+    )
+    # bulk_create and update() send no signals
+    invalidate_listing_snapshot(listing_id)
+    transaction.on_commit(lambda: publish_listing_event(
+        listing_id, "bid", current_bid=price, highest_bidder=highest_bidder_name))
+    return bids
+
+
+@retry_on_locked
+def place_bid(user, listing, amount):
+    '''
+    Places a bid of amount by user on listing and returns a BidResult.
+
+    The price check and the price update are one conditional UPDATE, so two
+    bidders racing on the same listing can never both win or overwrite each
+    other with a lower amount; a bid that is not higher than the current one,
+    or lands on a closed listing, gets accepted=False and the state it lost to.
+
+    A bid landing within AUCTIONS_SOFT_CLOSE_SECONDS of the end time pushes the
+    end time out to that far from now, so there is always time to answer it.
+
+    Proxy bids on the listing answer an accepted bid straight away, in the
+    same transaction, and the result carries the price and highest bidder after that.
+    '''
+    now = timezone.now()
+    with transaction.atomic():
+        updated = Listing.objects.filter(
+            _open(now),
+            pk=listing.pk, active=True, current_bid__lt=amount,
+        ).update(
+            current_bid=amount,
+            highest_bidder=user,
+            bid_count=F("bid_count") + 1,
+            updated_at=now,
+            end_at=_extend_end(now),
+        )
+        if updated:
+            # The UPDATE holds the write lock, so no proxy can be added meanwhile
+            settled = settle_proxies(listing.pk, amount, user.pk)
+            if settled is not None:
+                bid = _save_settled(listing.pk, settled, now, [Bid(user=user, listing_id=listing.pk, amount=amount)])[0]
+                return BidResult(True, settled[0], settled[1], True, bid)
+            bid = Bid.objects.create(user=user, listing_id=listing.pk, amount=amount)
+            transaction.on_commit(lambda: publish_listing_event(
+                listing.pk, "bid", current_bid=amount, highest_bidder=user.username))
+            return BidResult(True, amount, user.pk, True, bid)
+
+    current = Listing.objects.values("current_bid", "highest_bidder", "active", "end_at").get(pk=listing.pk)
+    active = bool(current["active"]) and (current["end_at"] is None or current["end_at"] > now)
+    return BidResult(False, current["current_bid"], current["highest_bidder"], active, None)
+
+
+@retry_on_locked
+def place_proxy_bid(user, listing, max_amount):
+    '''
+    Registers max_amount as the most user will pay for listing, or raises
+    their earlier maximum, and settles the bidding war it starts in one
+    transaction: the bids it leaves are written in one INSERT and the listing
+    is updated once, however many increments the war would have taken by hand.
+
+    Returns a BidResult. accepted is False when the maximum is not above the
+    current bid (or the user's earlier maximum) or the listing is closed;
+    otherwise the maximum is kept, whether or not it is the highest. bid is
+    the user's bid left by the war, if any
+    '''
+    now = timezone.now()
+    with transaction.atomic():
+        # Locks the listing row where the database can, SQLite serialises the writes below instead
+        current = Listing.objects.select_for_update().filter(_open(now), pk=listing.pk, active=True) \
+            .values("current_bid", "highest_bidder").first()
+        if current is None:
+            current = Listing.objects.values("current_bid", "highest_bidder").get(pk=listing.pk)
+            return BidResult(False, current["current_bid"], current["highest_bidder"], False, None)
+        proxy, created = ProxyBid.objects.get_or_create(user=user, listing_id=listing.pk,
+            defaults={"max_amount": max_amount})
+        if max_amount <= current["current_bid"] or (not created and max_amount <= proxy.max_amount):
+            transaction.set_rollback(True)
+            return BidResult(False, current["current_bid"], current["highest_bidder"], True, None)
+        if not created:
+            ProxyBid.objects.filter(pk=proxy.pk).update(max_amount=max_amount)
+
+        settled = settle_proxies(listing.pk, current["current_bid"], current["highest_bidder"])
+        if settled is None:
+            return BidResult(True, current["current_bid"], current["highest_bidder"], True, None)
+        bids = _save_settled(listing.pk, settled, now)
+        own = [bid for bid in bids if bid.user_id == user.pk]
+        return BidResult(True, settled[0], settled[1], True, own[-1] if own else None)
@@ -0,0 +1,68 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .events import publish_listing_event
+from .models import Category, Listing
+from .snapshots import snapshot_key
+
+
+def close_due_auctions(now=None, batch_size=1000):
+    '''
+    Closes every active listing whose end time has passed, batch_size at a
+    time, and returns how many were closed.
+
+    Each batch is one indexed read of the due ids and one UPDATE that closes
+    them and copies highest_bidder into winner. The UPDATE re-checks that each
+    listing is still active and due, so one its owner closed or a late bid
+    extended in the meantime is left alone.
+    '''
+    now = now or timezone.now()
+    closed = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Listing.objects.due(now).order_by("end_at").values_list("id", "current_bid", "category_id")[:batch_size]
+            )
+            if not batch:
+                break
+            ids = [listing_id for listing_id, _, _ in batch]
+            category_ids = [category_id for _, _, category_id in batch]
+            updated = Listing.objects.due(now).filter(id__in=ids).update(
+                active=False, winner=F("highest_bidder"), updated_at=now)
+            if updated == len(batch):
+                Category.count_closed(category_ids)
+            else:
+                # Some were closed or extended meanwhile, count those categories again
+                Category.recount(set(category_ids))
+            closed += updated
+            # update() does not send post_save, so tell the cache and the viewers ourselves
+            transaction.on_commit(lambda batch=batch: _announce_closed(batch))
+    return closed
+
+
+def close_listing(listing_id, now=None):
+    '''
+    Closes one listing now, as its owner does, and returns whether it was
+    still open. The conditional UPDATE lets only one of several racing
+    closes (or the auction closer) through, so the category is counted once
+    '''
+    now = now or timezone.now()
+    with transaction.atomic():
+        closed = Listing.objects.active().filter(pk=listing_id).update(
+            active=False, winner=F("highest_bidder"), updated_at=now)
+        if not closed:
+            return False
+        current_bid, category_id = Listing.objects.values_list("current_bid", "category_id").get(pk=listing_id)
+        Category.count_closed([category_id])
+        # update() does not send post_save, so tell the cache and the viewers ourselves
+        cache.delete(snapshot_key(listing_id))
+        transaction.on_commit(lambda: _announce_closed([(listing_id, current_bid, category_id)]))
+    return True
+
+
+def _announce_closed(batch):
+    cache.delete_many([snapshot_key(listing_id) for listing_id, _, _ in batch])
+    for listing_id, current_bid, _ in batch:
+        publish_listing_event(listing_id, "close", current_bid=current_bid)
@@ -0,0 +1,156 @@
+import functools
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.db.models import Exists, Max, OuterRef, Value
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import http_date, quote_etag
+
+from .models import Listing, ArchivedListing, Watchlist
+
+
+def _once_per_request(request, name, compute):
+    '''condition() asks for the ETag and Last-Modified separately, this makes them share one query'''
+    if not hasattr(request, name):
+        setattr(request, name, compute())
+    return getattr(request, name)
+
+
+def viewer_tag(request):
+    '''
+    Tells apart the people a page may have been rendered for without loading
+    the user. Logging in or out starts a new session, so a page rendered
+    before it can never be confirmed afterwards
+    '''
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return "anonymous"
+    return hashlib.sha256(session_key.encode()).hexdigest()[:16]
+
+
+# When an active listing was last deleted. Deleting one leaves the newest
+# updated_at as it was, so the feed version is the later of the two. A
+# missing entry is taken as a delete just now, so losing it only makes the
+# index render again
+FEED_DELETED_KEY = "feed-deleted-at"
+
+
+def feed_listing_deleted():
+    cache.set(FEED_DELETED_KEY, timezone.now(), None)
+
+
+def _feed_version(last_changed, last_deleted):
+    return max(last_changed, last_deleted) if last_changed else last_deleted
+
+
+def feed_last_modified(request, *args, **kwargs):
+    '''When the feeds last changed, from the updated_at index and the cache'''
+    return _once_per_request(request, "_feed_last_modified", lambda: _feed_version(
+        Listing.objects.aggregate(last=Max("updated_at"))["last"],
+        cache.get_or_set(FEED_DELETED_KEY, timezone.now, None)))
+
+
+def _feed_etag(request, last_modified):
+    return f"feed-{last_modified.timestamp()}-{viewer_tag(request)}"
+
+
+def feed_etag(request, *args, **kwargs):
+    return _feed_etag(request, feed_last_modified(request))
+
+
+def _listing_state_query(listing_id, user_id):
+    watched = Exists(Watchlist.objects.filter(user_id=user_id, listing_id=OuterRef("pk"))) if user_id else Value(False)
+    return Listing.objects.filter(pk=listing_id).annotate(watched=watched).values_list("updated_at", "watched")
+
+
+def _archived_state_query(listing_id):
+    # Archiving deletes the watchlist entries, so nobody watches an archived listing
+    return ArchivedListing.objects.filter(pk=listing_id).annotate(watched=Value(False)).values_list("updated_at", "watched")
+
+
+def listing_state(request, listing_id):
+    '''
+    Returns when the listing last changed and whether the signed in user is
+    watching it, in one query, or None when there is no such listing.
+    Archived listings are looked for only when it is not in Listing
+    '''
+    def compute():
+        user_id = request.session.get(SESSION_KEY) if viewer_tag(request) != "anonymous" else None
+        return _listing_state_query(listing_id, user_id).first() or _archived_state_query(listing_id).first()
+    return _once_per_request(request, "_listing_state", compute)
+
+
+def listing_last_modified(request, listing_id):
+    state = listing_state(request, listing_id)
+    return state[0] if state else None
+
+
+def _listing_etag(request, listing_id, state):
+    if state is None:
+        return None
+    watched = "watched" if state[1] else ""
+    return f"listing-{listing_id}-{state[0].timestamp()}-{watched}-{viewer_tag(request)}"
+
+
+def listing_etag(request, listing_id):
+    return _listing_etag(request, listing_id, listing_state(request, listing_id))
+
+
+# The same, for async views
+
+async def afeed_last_modified(request, *args, **kwargs):
+    if not hasattr(request, "_feed_last_modified"):
+        request._feed_last_modified = _feed_version(
+            (await Listing.objects.aaggregate(last=Max("updated_at")))["last"],
+            await cache.aget_or_set(FEED_DELETED_KEY, timezone.now, None))
+    return request._feed_last_modified
+
+
+async def afeed_etag(request, *args, **kwargs):
+    return _feed_etag(request, await afeed_last_modified(request))
+
+
+async def alisting_state(request, listing_id):
+    if not hasattr(request, "_listing_state"):
+        user_id = await request.session.aget(SESSION_KEY) if viewer_tag(request) != "anonymous" else None
+        request._listing_state = (await _listing_state_query(listing_id, user_id).afirst()
+            or await _archived_state_query(listing_id).afirst())
+    return request._listing_state
+
+
+async def alisting_last_modified(request, listing_id):
+    state = await alisting_state(request, listing_id)
+    return state[0] if state else None
+
+
+async def alisting_etag(request, listing_id):
+    return _listing_etag(request, listing_id, await alisting_state(request, listing_id))
+
+
+def async_condition(etag_func, last_modified_func):
+    '''
+    condition() for async views. Django's calls etag_func and
+    last_modified_func synchronously, which cannot query the database from
+    an event loop, this awaits them instead
+    '''
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            last_modified = await last_modified_func(request, *args, **kwargs)
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+            etag = await etag_func(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD"):
+                if last_modified and not response.has_header("Last-Modified"):
+                    response.headers["Last-Modified"] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault("ETag", etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    '''A single viewer of a listing, holding the queue its events are delivered to'''
+
+    def __init__(self, listing_id, loop, maxsize):
+        self.listing_id = listing_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, event):
+        # A viewer that fell behind only needs the newest state, so drop its oldest event
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class BaseBroker:
+    '''
+    Fans listing events out to the viewers subscribed to them.
+    subscribe and unsubscribe are called from the event loop serving the
+    viewer, publish from any thread (usually a sync view that just wrote).
+    A backend for several server processes would relay publish through
+    something like Redis pub/sub and deliver in each process.
+    '''
+
+    def subscribe(self, listing_id):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, listing_id, event):
+        raise NotImplementedError
+
+
+class InProcessBroker(BaseBroker):
+    '''Delivers events to the viewers connected to this process only'''
+
+    def __init__(self, queue_size=16):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, listing_id):
+        subscription = Subscription(listing_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers[listing_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            viewers = self._subscribers.get(subscription.listing_id)
+            if viewers is not None:
+                viewers.discard(subscription)
+                if not viewers:
+                    del self._subscribers[subscription.listing_id]
+
+    def publish(self, listing_id, event):
+        with self._lock:
+            viewers = list(self._subscribers.get(listing_id, ()))
+        # Hand each event loop its viewers in one callback instead of one per viewer
+        by_loop = defaultdict(list)
+        for subscription in viewers:
+            by_loop[subscription.loop].append(subscription)
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, subscriptions, event)
+            except RuntimeError:
+                # The loop serving these viewers has shut down
+                pass
+        return len(viewers)
+
+
+def _deliver_all(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.deliver(event)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    '''Returns the process wide broker named by AUCTIONS_EVENT_BROKER'''
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, "AUCTIONS_EVENT_BROKER", "auctions.events.InProcessBroker")
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish_listing_event(listing_id, event_type, **data):
+    '''Publishes an event about a listing to everyone watching its page'''
+    return get_broker().publish(listing_id, {"type": event_type, "listing": listing_id, **data})
+
+
+def format_sse(event):
+    '''Encodes an event as a Server-Sent Events message'''
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,87 @@
+import csv
+import heapq
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Value
+
+from .models import Listing, Bid, Comment, ArchivedListing, ArchivedBid, ArchivedComment
+
+
+# Rows fetched from the database, and written out, at a time
+CHUNK_SIZE = 2000
+
+# The models each table is exported from, the hot one and its archive,
+# and the columns exported, in order. The rows of both come out as one table in id order
+EXPORTS = {
+    "bids": ((Bid, ArchivedBid), ["id", "listing_id", "user_id", "user__username", "amount"]),
+    "listings": ((Listing, ArchivedListing), [
+        "id", "listing_title", "listing_description", "user_id", "starting_bid", "current_bid",
+        "listing_category", "active", "winner_id", "highest_bidder_id", "end_at", "bid_count", "comment_count",
+    ]),
+    "comments": ((Comment, ArchivedComment), ["id", "listing_id", "user_id", "user__username", "comment"]),
+}
+
+# Exported columns an archive model has no field for, and their value there
+ARCHIVED_VALUES = {
+    ArchivedListing: {"active": Value(False)},
+}
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class _Line:
+    '''File-like object csv.writer can write to that hands back the line instead of storing it'''
+
+    def write(self, value):
+        return value
+
+
+def _rows(table):
+    models, fields = EXPORTS[table]
+    # iterator() fetches CHUNK_SIZE rows at a time instead of loading the whole table,
+    # and merging the id ordered tables keeps it that way
+    return fields, heapq.merge(*(
+        model.objects.annotate(**ARCHIVED_VALUES.get(model, {})).order_by("id")
+        .values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+        for model in models
+    ), key=lambda row: row[0])
+
+
+def _in_chunks(lines):
+    '''Joins lines into CHUNK_SIZE line strings so the server is not handed one tiny write per row'''
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def csv_lines(table):
+    fields, rows = _rows(table)
+    writer = csv.writer(_Line())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(table):
+    fields, rows = _rows(table)
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def stream_export(table, export_format):
+    '''
+    Returns the content type and a generator of the chunks of an export of
+    table ("bids", "listings" or "comments") as "csv" or "ndjson". Memory use
+    stays the same however many rows there are
+    '''
+    lines = csv_lines(table) if export_format == "csv" else ndjson_lines(table)
+    return CONTENT_TYPES[export_format], _in_chunks(lines)
@@ -0,0 +1,341 @@
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+try:
+    from PIL import Image
+except ImportError:
+    # Without Pillow images are cached and served at their original size
+    Image = None
+
+
+# Widths, in pixels, thumbnails are made at
+THUMBNAIL_SIZES = {
+    "card": 400,
+    "small": 200,
+}
+
+# Only raster formats are passed through, an SVG could carry script
+ALLOWED_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+# Shown instead of an image that could not be fetched
+PLACEHOLDER = (
+    b'<svg xmlns="http://www.w3.org/2000/svg" width="400" height="300" viewBox="0 0 400 300">'
+    b'<rect width="400" height="300" fill="#e9ecef"/>'
+    b'<text x="200" y="155" font-family="sans-serif" font-size="18" fill="#6c757d" text-anchor="middle">'
+    b'Image unavailable</text></svg>'
+)
+
+
+class FetchError(Exception):
+    pass
+
+
+class BaseFetcher:
+    '''Gets the bytes and content type of a remote image, raising FetchError when it cannot'''
+
+    def fetch(self, url):
+        raise NotImplementedError
+
+
+def public_address(host, port):
+    '''
+    Resolves host and returns the address to connect to, raising FetchError
+    when any address it resolves to is loopback, private, link-local,
+    reserved or otherwise not on the public internet
+    '''
+    try:
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError) as error:
+        raise FetchError(f"Cannot resolve {host}: {error}") from error
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise FetchError(f"{host} resolves to {address}, which is not a public address")
+    return addresses[0][4][0]
+
+
+def _connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None, **kwargs):
+    # Connects to the address that was checked, so the host cannot resolve
+    # to a public address for the check and an internal one for the connection
+    host, port = address
+    return socket.create_connection((public_address(host, port), port), timeout, source_address, **kwargs)
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+
+    def http_open(self, request):
+        return self.do_open(_PublicHTTPConnection, request)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+
+    def https_open(self, request):
+        return self.do_open(_PublicHTTPSConnection, request, context=self._context)
+
+
+class _HTTPRedirectHandler(urllib.request.HTTPRedirectHandler):
+
+    def redirect_request(self, request, fp, code, message, headers, url):
+        # Each hop connects through the handlers above, this keeps it to http(s)
+        if urllib.parse.urlsplit(url).scheme not in ("http", "https"):
+            raise FetchError(f"Redirected to a non http(s) url: {url}")
+        return super().redirect_request(request, fp, code, message, headers, url)
+
+
+class URLFetcher(BaseFetcher):
+    '''
+    Fetches over HTTP(S) with a timeout and a size limit, so a slow or huge
+    image cannot hold a worker. Listing image urls are typed in by users, so
+    every connection, redirects included, is refused unless it goes to a
+    public address, and environment proxies are not used
+    '''
+
+    def __init__(self, timeout=None, max_bytes=None):
+        self.timeout = timeout or getattr(settings, "AUCTIONS_IMAGE_FETCH_TIMEOUT", 3)
+        self.max_bytes = max_bytes or getattr(settings, "AUCTIONS_IMAGE_MAX_SOURCE_BYTES", 10 * 1024 * 1024)
+        self.opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}), _PublicHTTPHandler, _PublicHTTPSHandler, _HTTPRedirectHandler)
+
+    def fetch(self, url):
+        if not url.startswith(("http://", "https://")):
+            raise FetchError(f"Not an http(s) url: {url}")
+        request = urllib.request.Request(url, headers={"User-Agent": "auctions-thumbnailer"})
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                content_type = response.headers.get_content_type()
+                data = response.read(self.max_bytes + 1)
+        except (OSError, ValueError) as error:
+            raise FetchError(str(error)) from error
+        if len(data) > self.max_bytes:
+            raise FetchError(f"Image larger than {self.max_bytes} bytes")
+        return data, content_type
+
+
+class ImageCache:
+    '''
+    Thumbnails on disk, named by the hash of their contents so identical
+    images are stored once. Small ref files map a source url and size to a
+    thumbnail, and each thumbnail has an index of the refs made to it.
+    Reading a thumbnail touches its modification time. put() keeps a running
+    total of the thumbnails' size, scanned from disk the first time, and once
+    it passes max_bytes the least recently used thumbnails are deleted, with
+    their refs, down to EVICT_TO of max_bytes
+    '''
+
+    # Evicting a little more than needed saves walking the cache again on the next put
+    EVICT_TO = 0.9
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None
+
+    def _ref_key(self, url, size):
+        return hashlib.sha256(f"{size}:{url}".encode()).hexdigest()
+
+    def _ref_path(self, key):
+        return os.path.join(self.directory, "refs", key[:2], key)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, "blobs", digest[:2], digest)
+
+    def _index_path(self, digest):
+        return os.path.join(self.directory, "index", digest[:2], digest)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed into place, so a reader never sees half a file
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+
+    def _read_ref(self, key):
+        with open(self._ref_path(key)) as ref:
+            digest, content_type = ref.read().split()
+        return digest, content_type
+
+    def get(self, url, size):
+        '''Returns (data, content_type) of the cached thumbnail, or None'''
+        try:
+            digest, content_type = self._read_ref(self._ref_key(url, size))
+            path = self._blob_path(digest)
+            with open(path, "rb") as blob:
+                data = blob.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return data, content_type
+
+    def put(self, url, size, data, content_type):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        added = 0
+        if not os.path.exists(path):
+            self._write(path, data)
+            added = len(data)
+        key = self._ref_key(url, size)
+        self._write(self._ref_path(key), f"{digest} {content_type}".encode())
+        with self._lock:
+            index = self._index_path(digest)
+            os.makedirs(os.path.dirname(index), exist_ok=True)
+            with open(index, "a") as file:
+                file.write(key + "\n")
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._blobs())
+            else:
+                self._total += added
+            full = self._total > self.max_bytes
+        if full:
+            self.evict()
+
+    def _blobs(self):
+        '''(modification time, size, digest) of every thumbnail on disk'''
+        blobs = []
+        for root, _, names in os.walk(os.path.join(self.directory, "blobs")):
+            for name in names:
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, name))
+        return blobs
+
+    def _remove(self, digest):
+        '''Deletes a thumbnail and the refs still pointing at it'''
+        index = self._index_path(digest)
+        try:
+            with open(index) as file:
+                keys = set(file.read().split())
+        except OSError:
+            keys = set()
+        for key in keys:
+            try:
+                # A ref rewritten since to another thumbnail is left alone
+                if self._read_ref(key)[0] == digest:
+                    os.remove(self._ref_path(key))
+            except (OSError, ValueError):
+                pass
+        for path in (index, self._blob_path(digest)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        '''
+        Deletes the least recently used thumbnails until they fit in
+        EVICT_TO of max_bytes, once they take more than max_bytes. The walk
+        also puts the running total right, counting what other processes wrote
+        '''
+        with self._lock:
+            blobs = self._blobs()
+            total = sum(size for _, size, _ in blobs)
+            if total > self.max_bytes:
+                for _, size, digest in sorted(blobs):
+                    self._remove(digest)
+                    total -= size
+                    if total <= self.max_bytes * self.EVICT_TO:
+                        break
+            self._total = total
+
+
+def make_thumbnail(data, content_type, width):
+    '''
+    Scales an image down to width pixels wide, keeping its aspect ratio,
+    and returns (data, content_type). Images already narrower are only re-encoded
+    '''
+    if Image is None:
+        if content_type not in ALLOWED_TYPES:
+            raise FetchError(f"Not an image: {content_type}")
+        return data, content_type
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail((width, width * 4))
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise FetchError(f"Unreadable image: {error}") from error
+    output = io.BytesIO()
+    if image.mode in ("RGBA", "LA", "P"):
+        image.save(output, "PNG", optimize=True)
+        return output.getvalue(), "image/png"
+    image.convert("RGB").save(output, "JPEG", quality=82, optimize=True, progressive=True)
+    return output.getvalue(), "image/jpeg"
+
+
+_fetcher = None
+_image_cache = None
+_lock = threading.Lock()
+
+
+def get_fetcher():
+    '''Returns the fetcher named by AUCTIONS_IMAGE_FETCHER'''
+    global _fetcher
+    path = getattr(settings, "AUCTIONS_IMAGE_FETCHER", "auctions.images.URLFetcher")
+    if _fetcher is None or _fetcher[0] != path:
+        with _lock:
+            _fetcher = (path, import_string(path)())
+    return _fetcher[1]
+
+
+def get_image_cache():
+    '''Returns the ImageCache in AUCTIONS_IMAGE_CACHE_DIR'''
+    global _image_cache
+    directory = settings.AUCTIONS_IMAGE_CACHE_DIR
+    if _image_cache is None or _image_cache.directory != directory:
+        with _lock:
+            _image_cache = ImageCache(directory, getattr(settings, "AUCTIONS_IMAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    return _image_cache
+
+
+def get_thumbnail(url, size):
+    '''
+    Returns (data, content_type) of the size thumbnail of the image at url,
+    from the disk cache or fetched and made now, or None when the image cannot
+    be had. A failed url is not tried again for AUCTIONS_IMAGE_RETRY_SECONDS,
+    so a host that is down does not cost a timeout per request
+    '''
+    image_cache = get_image_cache()
+    cached = image_cache.get(url, size)
+    if cached is not None:
+        return cached
+    failed_key = "image-failed:" + hashlib.sha256(url.encode()).hexdigest()
+    if cache.get(failed_key):
+        return None
+    try:
+        data, content_type = get_fetcher().fetch(url)
+        thumbnail = make_thumbnail(data, content_type, THUMBNAIL_SIZES[size])
+    except FetchError:
+        cache.set(failed_key, time.time(), getattr(settings, "AUCTIONS_IMAGE_RETRY_SECONDS", 300))
+        return None
+    image_cache.put(url, size, *thumbnail)
+    return thumbnail
@@ -0,0 +1,167 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+# Upper bounds, in seconds, of the request time histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+
+
+class QueryRecorder:
+    '''Database execute wrapper that notes every query run and how long it took'''
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((context["connection"].alias, sql, repr(params), time.perf_counter() - start))
+
+    @property
+    def sql_time(self):
+        return sum(duration for _, _, _, duration in self.queries)
+
+    def duplicates(self):
+        '''Number of queries that repeat an earlier one with the same SQL and parameters'''
+        seen = Counter((alias, sql, params) for alias, sql, params, _ in self.queries)
+        return sum(count - 1 for count in seen.values())
+
+
+class ViewStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.wall_time = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.duplicates = 0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, wall_time, recorder):
+        self.requests += 1
+        self.wall_time += wall_time
+        self.queries += len(recorder.queries)
+        self.sql_time += recorder.sql_time
+        self.duplicates += recorder.duplicates()
+        for i, bound in enumerate(BUCKETS):
+            if wall_time <= bound:
+                self.buckets[i] += 1
+                break
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "wall_time": self.wall_time,
+            "queries": self.queries,
+            "sql_time": self.sql_time,
+            "duplicate_queries": self.duplicates,
+            "buckets": {str(bound): count for bound, count in zip(BUCKETS, self.buckets)},
+        }
+
+
+class RequestStats:
+    '''Aggregated request statistics per view, plus the slowest requests seen, for this process'''
+
+    def __init__(self, keep_slowest=50):
+        self.keep_slowest = keep_slowest
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.views = defaultdict(ViewStats)
+            self._slowest = []
+
+    def record(self, view, path, status, wall_time, recorder):
+        with self._lock:
+            self.views[view].add(wall_time, recorder)
+            # Min-heap on wall time, so the fastest of the kept requests is the one pushed out
+            if len(self._slowest) < self.keep_slowest or wall_time > self._slowest[0][0]:
+                entry = (wall_time, next(self._order), {
+                    "view": view,
+                    "path": path,
+                    "status": status,
+                    "wall_time": wall_time,
+                    "sql_time": recorder.sql_time,
+                    "queries": [
+                        {"alias": alias, "sql": sql, "params": params, "time": duration}
+                        for alias, sql, params, duration in recorder.queries
+                    ],
+                })
+                if len(self._slowest) < self.keep_slowest:
+                    heapq.heappush(self._slowest, entry)
+                else:
+                    heapq.heapreplace(self._slowest, entry)
+
+    def summary(self):
+        with self._lock:
+            return {view: stats.as_dict() for view, stats in sorted(self.views.items())}
+
+    def slowest(self, count):
+        with self._lock:
+            return [entry for _, _, entry in heapq.nlargest(count, self._slowest)]
+
+    def prometheus(self):
+        '''Renders the per view statistics in the Prometheus text exposition format'''
+        lines = [
+            "# HELP auctions_request_seconds Wall time of requests per view.",
+            "# TYPE auctions_request_seconds histogram",
+        ]
+        summary = self.summary()
+        for view, stats in summary.items():
+            cumulative = 0
+            for bound, count in stats["buckets"].items():
+                cumulative += count
+                le = "+Inf" if bound == "inf" else bound
+                lines.append(f'auctions_request_seconds_bucket{{view="{view}",le="{le}"}} {cumulative}')
+            lines.append(f'auctions_request_seconds_sum{{view="{view}"}} {stats["wall_time"]}')
+            lines.append(f'auctions_request_seconds_count{{view="{view}"}} {stats["requests"]}')
+        for name, key, help_text in (
+            ("auctions_request_queries_total", "queries", "Database queries run by requests per view."),
+            ("auctions_request_sql_seconds_total", "sql_time", "Time spent in the database per view."),
+            ("auctions_request_duplicate_queries_total", "duplicate_queries", "Repeated identical queries per view."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for view, stats in summary.items():
+                lines.append(f'{name}{{view="{view}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+
+stats = RequestStats(keep_slowest=getattr(settings, "AUCTIONS_INSTRUMENTATION_SLOWEST", 50))
+
+
+class InstrumentationMiddleware:
+    '''
+    Records wall time, query count, SQL time and duplicated queries of every
+    request into the process wide stats. Only active when AUCTIONS_INSTRUMENTATION is set
+    '''
+
+    def __init__(self, get_response):
+        if not getattr(settings, "AUCTIONS_INSTRUMENTATION", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall_time = time.perf_counter() - start
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else "unresolved"
+        stats.record(view, request.path, response.status_code, wall_time, recorder)
+        return response
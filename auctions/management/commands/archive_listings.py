@@ -0,0 +1,28 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auctions.archive import archive_closed_listings
+
+
+class Command(BaseCommand):
+    help = "Moves listings closed for longer than --older-than days, with their bids and comments, into the archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=float, default=None,
+            help="Days a listing has been closed for, AUCTIONS_ARCHIVE_AFTER_DAYS by default")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        days = options["older_than"]
+        if days is None:
+            days = getattr(settings, "AUCTIONS_ARCHIVE_AFTER_DAYS", 90)
+        start = time.perf_counter()
+        archived = archive_closed_listings(older_than=timedelta(days=days), batch_size=options["batch_size"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Archived {archived} listings closed for over {days:g} days in {elapsed:.2f}s "
+            f"({archived / elapsed if elapsed else 0:.0f}/s)"
+        )
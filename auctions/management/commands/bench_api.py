@@ -0,0 +1,81 @@
+import json
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from auctions import api
+from auctions.benchmarks import percentiles, scratch_database, seed
+from auctions.models import User, Listing
+
+
+class Command(BaseCommand):
+    help = (
+        "Times every /api/v1/ endpoint, and fetching a batch of listings through the API "
+        "against scraping their HTML pages one by one, on a seeded scratch database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+        parser.add_argument("--batch", type=int, default=50, help="Listings per batch request")
+        parser.add_argument("--listings", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch = options["batch"]
+        with scratch_database():
+            seed(users=200, listings=options["listings"])
+            User.objects.create_user("bench viewer", password="password")
+            ids = list(Listing.objects.active().values_list("id", flat=True)[:batch])
+            joined = ",".join(map(str, ids))
+            client = Client()
+            client.login(username="bench viewer", password="password")
+            toggle = json.dumps({"toggle": ids})
+
+            endpoints = {
+                "GET listings (page of 20)": lambda: client.get("/api/v1/listings"),
+                f"GET listings?ids= ({batch})": lambda: client.get("/api/v1/listings", {"ids": joined}),
+                f"GET prices?ids= ({batch})": lambda: client.get("/api/v1/prices", {"ids": joined}),
+                "GET listing": lambda: client.get(f"/api/v1/listings/{ids[0]}"),
+                "GET listing bids": lambda: client.get(f"/api/v1/listings/{ids[0]}/bids"),
+                "GET listing comments": lambda: client.get(f"/api/v1/listings/{ids[0]}/comments"),
+                "GET watchlist": lambda: client.get("/api/v1/watchlist"),
+                f"POST watchlist toggle ({batch})": lambda: client.post(
+                    "/api/v1/watchlist", toggle, content_type="application/json"),
+            }
+            self.stdout.write(f"{'endpoint':<32}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+            for name, request in endpoints.items():
+                self.report(name, self.time(request, options["requests"]))
+
+            # What the mobile client does today against what the batch endpoint does
+            rounds = max(1, options["requests"] // 20)
+            self.stdout.write(f"\n{batch} listings, {rounds} rounds")
+            cache.clear()
+            self.report(f"{batch} HTML listing pages", self.time(
+                lambda: [client.get(f"/listing/{listing_id}") for listing_id in ids], rounds))
+            self.report(f"{batch} API listing requests", self.time(
+                lambda: [client.get(f"/api/v1/listings/{listing_id}") for listing_id in ids], rounds))
+            self.report("1 API batch request", self.time(
+                lambda: client.get("/api/v1/listings", {"ids": joined}), rounds))
+
+            if api.orjson is not None:
+                payload = json.loads(client.get("/api/v1/listings", {"ids": joined}).content)
+                self.stdout.write(f"\nEncoding {batch} listings")
+                self.report("orjson", self.time(lambda: api.api_response(payload), options["requests"]))
+                encoder, api.orjson = api.orjson, None
+                try:
+                    self.report("json", self.time(lambda: api.api_response(payload), options["requests"]))
+                finally:
+                    api.orjson = encoder
+
+    def time(self, request, count):
+        request()
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            request()
+            timings.append(time.perf_counter() - start)
+        return percentiles(timings)
+
+    def report(self, name, result):
+        self.stdout.write(f"{name:<32}{result['p50_ms']:>9.3f}{result['p95_ms']:>9.3f}{result['p99_ms']:>9.3f}")
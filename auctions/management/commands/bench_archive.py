@@ -0,0 +1,110 @@
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F, Max
+from django.test import RequestFactory
+from django.utils import timezone
+
+from auctions.archive import archive_closed_listings
+from auctions.benchmarks import percentiles, scratch_database, seed
+from auctions.bidding import place_bid
+from auctions.models import User, Category, Listing, ArchivedListing, Bid, Comment, Watchlist
+from auctions.pagination import keyset_page
+from auctions.snapshots import build_listing_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the queries the open auctions are served by, and reads of the closed listings, "
+        "on a seeded on-disk scratch database with 90%% of its listings closed, before and "
+        "after archiving those"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=20000)
+        parser.add_argument("--repeat", type=int, default=200, help="Runs of each query per phase")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as directory:
+            with scratch_database(os.path.join(directory, "bench.sqlite3")):
+                user_ids = seed(users=1000, listings=options["listings"])
+                ids = list(Listing.objects.values_list("id", flat=True))
+                open_ids = rng.sample(ids, len(ids) // 10)
+                closed_ids = sorted(set(ids) - set(open_ids))
+                Listing.objects.filter(id__in=open_ids).update(active=True)
+                Listing.objects.exclude(id__in=open_ids).update(
+                    active=False, winner=F("highest_bidder"), updated_at=timezone.now() - timedelta(days=100))
+                Category.recount()
+
+                queries = self.queries(rng, open_ids, closed_ids, user_ids)
+                before = self.measure(queries, options["repeat"])
+                rows_before = self.row_counts()
+
+                start = time.perf_counter()
+                archived = archive_closed_listings(older_than=timedelta(days=30), batch_size=options["batch_size"])
+                elapsed = time.perf_counter() - start
+                after = self.measure(queries, options["repeat"])
+                rows_after = self.row_counts()
+
+        self.stdout.write(f"Archived {archived} listings in {elapsed:.2f}s ({archived / elapsed:.0f}/s)\n")
+        self.stdout.write(f"{'hot rows':<24}{'before':>10}{'after':>10}")
+        for table in rows_before:
+            self.stdout.write(f"{table:<24}{rows_before[table]:>10}{rows_after[table]:>10}")
+        self.stdout.write(f"\n{'query':<24}{'before p50':>12}{'after p50':>12}{'before p95':>12}{'after p95':>12}{'speedup':>9}")
+        for name in queries:
+            self.stdout.write(
+                f"{name:<24}{before[name]['p50_ms']:>12.3f}{after[name]['p50_ms']:>12.3f}"
+                f"{before[name]['p95_ms']:>12.3f}{after[name]['p95_ms']:>12.3f}"
+                f"{before[name]['p50_ms'] / after[name]['p50_ms']:>8.1f}x"
+            )
+        self.stdout.write("The last two read closed listings, from the archive once it is filled")
+
+    def queries(self, rng, open_ids, closed_ids, user_ids):
+        now = timezone.now()
+        keys = list(Category.objects.values_list("key", flat=True))
+        bidder = User.objects.create(username="bench bidder")
+        amounts = iter(range(10 ** 6, 10 ** 9))
+        factory = RequestFactory()
+        return {
+            "index page": lambda: list(Listing.objects.active().order_by("id")[:21]),
+            "index page, deep": lambda: list(
+                Listing.objects.active().filter(id__gt=rng.choice(open_ids)).order_by("id")[:21]),
+            "category page": lambda: list(
+                Listing.objects.filter(category__key=rng.choice(keys)).order_by("id")[:21]),
+            "feed version": lambda: Listing.objects.aggregate(Max("updated_at")),
+            "due auctions": lambda: list(Listing.objects.due(now).values_list("id")[:1000]),
+            "listing snapshot": lambda: build_listing_snapshot(rng.choice(open_ids)),
+            "bids on a listing": lambda: list(
+                Bid.objects.filter(listing_id=rng.choice(open_ids)).order_by("id")[:21]),
+            "bids by a user": lambda: list(Bid.objects.filter(user_id=rng.choice(user_ids)).order_by("id")[:21]),
+            "place a bid": lambda: place_bid(bidder, Listing(pk=rng.choice(open_ids)), next(amounts)),
+            "category recount": Category.recount,
+            "inactive page": lambda: list(keyset_page(
+                factory.get("/inactive", {"after": rng.choice(closed_ids)}),
+                Listing.objects.inactive(), ArchivedListing.objects.all())),
+            "closed listing snapshot": lambda: build_listing_snapshot(rng.choice(closed_ids)),
+        }
+
+    def measure(self, queries, repeat):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        results = {}
+        for name, query in queries.items():
+            query()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                query()
+                timings.append(time.perf_counter() - start)
+            results[name] = percentiles(timings)
+        return results
+
+    def row_counts(self):
+        return {model._meta.db_table: model.objects.count() for model in (Listing, Bid, Comment, Watchlist)}
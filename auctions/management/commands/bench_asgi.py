@@ -0,0 +1,158 @@
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import RequestFactory
+
+from auctions.benchmarks import browse_views, percentiles, scratch_database, seed
+from auctions.models import Listing
+
+
+# name: (server interface, browse views)
+DEPLOYMENTS = {
+    "wsgi, sync views": ("wsgi", False),
+    "asgi, sync views": ("asgi", False),
+    "asgi, async views": ("asgi", True),
+}
+
+
+async def asgi_get(application, path):
+    '''Sends a GET for path straight to an ASGI application and returns the status'''
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"testserver")], "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    sent = []
+
+    async def receive():
+        if not sent:
+            sent.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client stays connected, the handler stops listening once it has responded
+        await asyncio.Event().wait()
+
+    status = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves the browse pages to concurrent in-process clients through the WSGI handler "
+        "with the sync views and the ASGI handler with the sync and the async views, on a "
+        "seeded on-disk scratch database, and compares requests/sec, latency and the Python "
+        "memory held per concurrent connection"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", default="1,10,50", help="Comma separated concurrent connections to try")
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per deployment and concurrency")
+        parser.add_argument("--listings", type=int, default=2000)
+        parser.add_argument("--memory-requests", type=int, default=5,
+            help="Requests per connection while measuring memory")
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options["concurrency"].split(",")]
+        with tempfile.TemporaryDirectory() as directory:
+            with scratch_database(os.path.join(directory, "bench.sqlite3")):
+                seed(users=200, listings=options["listings"])
+                listing_ids = list(Listing.objects.values_list("id", flat=True)[:500])
+                connection.close()
+                paths = ["/", "/inactive", "/categories"] + [f"/listing/{id}" for id in listing_ids]
+                results = {}
+                for name, (interface, async_views) in DEPLOYMENTS.items():
+                    with browse_views(async_views):
+                        handler = WSGIHandler() if interface == "wsgi" else ASGIHandler()
+                        run = self.run_wsgi if interface == "wsgi" else self.run_asgi
+                        # Warm the template and snapshot caches
+                        run(handler, paths, 1, deadline=None, requests=len(paths) // 4)
+                        for level in levels:
+                            results[name, level] = self.measure(run, handler, paths, level, options)
+
+        self.stdout.write(f"{'':<20}{'conns':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'KiB/conn':>10}")
+        for (name, level), result in results.items():
+            self.stdout.write(
+                f"{name:<20}{level:>6}{result['rate']:>9.0f}{result['p50_ms']:>9.1f}"
+                f"{result['p95_ms']:>9.1f}{result['memory'] / 1024:>10.1f}"
+            )
+        self.stdout.write("KiB/conn is the Python heap peak over the idle heap, per connection, from tracemalloc. "
+            "Thread stacks are not included")
+
+    def measure(self, run, handler, paths, level, options):
+        timings = run(handler, paths, level, deadline=time.perf_counter() + options["duration"])
+        result = percentiles(timings)
+        result["rate"] = len(timings) / options["duration"]
+
+        tracemalloc.start()
+        try:
+            idle, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            run(handler, paths, level, deadline=None, requests=options["memory_requests"])
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["memory"] = (peak - idle) / level
+        return result
+
+    def run_wsgi(self, handler, paths, concurrency, deadline, requests=None):
+        '''One thread per connection, as a threaded WSGI server runs them'''
+        factory = RequestFactory()
+        timings, lock = [], threading.Lock()
+
+        def client(seed):
+            rng = random.Random(seed)
+            own = []
+            try:
+                while (deadline and time.perf_counter() < deadline) or (requests and len(own) < requests):
+                    start = time.perf_counter()
+                    status = []
+                    response = handler(factory.get(rng.choice(paths)).environ, lambda *args: status.append(args[0]))
+                    b"".join(response)
+                    response.close()
+                    assert status[0].startswith("200"), status[0]
+                    own.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+            with lock:
+                timings.extend(own)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings
+
+    def run_asgi(self, handler, paths, concurrency, deadline, requests=None):
+        '''One task per connection on a single event loop, as an ASGI server runs them'''
+        timings = []
+
+        async def client(seed):
+            rng = random.Random(seed)
+            count = 0
+            while (deadline and time.perf_counter() < deadline) or (requests and count < requests):
+                start = time.perf_counter()
+                status = await asgi_get(handler, rng.choice(paths))
+                assert status == 200, status
+                timings.append(time.perf_counter() - start)
+                count += 1
+
+        async def main():
+            await asyncio.gather(*(client(i) for i in range(concurrency)))
+
+        asyncio.run(main())
+        return timings
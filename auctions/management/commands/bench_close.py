@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from auctions.benchmarks import scratch_database
+from auctions.closing import close_due_auctions
+from auctions.models import User, Listing
+
+
+class Command(BaseCommand):
+    help = "Measures how fast close_auctions closes a backlog of due auctions, on a scratch database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=100000)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            count = options["listings"]
+            user = User.objects.create(username="seller")
+            bidder = User.objects.create(username="bidder")
+            ended = timezone.now() - timedelta(minutes=1)
+            Listing.objects.bulk_create(
+                [
+                    Listing(user=user, listing_title=f"listing {i}", listing_description="", starting_bid=1,
+                        current_bid=2, active=True, highest_bidder=bidder, end_at=ended)
+                    for i in range(count)
+                ],
+                batch_size=5000,
+            )
+
+            start = time.perf_counter()
+            closed = close_due_auctions(batch_size=options["batch_size"])
+            elapsed = time.perf_counter() - start
+
+            assert closed == count
+            assert not Listing.objects.filter(winner__isnull=True).exists()
+            self.stdout.write(f"Closed {closed} auctions in {elapsed:.2f}s ({closed / elapsed:.0f}/s)")
@@ -0,0 +1,52 @@
+import asyncio
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.events import InProcessBroker
+
+
+class Command(BaseCommand):
+    help = "Measures how long a bid event takes to reach every viewer of one listing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=10000)
+        parser.add_argument("--events", type=int, default=10)
+
+    def handle(self, *args, **options):
+        latencies = asyncio.run(self.run(options["clients"], options["events"]))
+        latencies.sort()
+        for label, value in (
+            ("p50", latencies[len(latencies) // 2]),
+            ("p95", latencies[int(len(latencies) * 0.95)]),
+            ("max", latencies[-1]),
+            ("mean", statistics.mean(latencies)),
+        ):
+            self.stdout.write(f"{label}: {value * 1000:.2f} ms")
+
+    async def run(self, clients, events):
+        broker = InProcessBroker()
+        subscriptions = [broker.subscribe(1) for _ in range(clients)]
+        latencies = []
+
+        async def viewer(subscription):
+            for _ in range(events):
+                event = await subscription.get()
+                latencies.append(time.perf_counter() - event["sent"])
+
+        viewers = [asyncio.ensure_future(viewer(subscription)) for subscription in subscriptions]
+
+        def bidder():
+            # Publish from another thread, the way a sync bid view would
+            for amount in range(events):
+                broker.publish(1, {"type": "bid", "current_bid": amount, "sent": time.perf_counter()})
+                time.sleep(0.2)
+
+        thread = threading.Thread(target=bidder)
+        thread.start()
+        await asyncio.gather(*viewers)
+        thread.join()
+        self.stdout.write(f"{clients} clients, {events} events, {len(latencies)} deliveries")
+        return latencies
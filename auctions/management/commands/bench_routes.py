@@ -0,0 +1,119 @@
+import json
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from auctions import urls
+from auctions.benchmarks import percentiles, scratch_database, seed
+from auctions.models import User, Category, Listing
+
+
+# Routes that are not timed: the event stream never finishes, logging out
+# would end the benchmark session and closing would empty the active feed
+SKIPPED = {"listing/<int:listing_id>/events", "logout", "close/<int:listing_id>", "close/<str:listing>"}
+
+# A <converter:name> parameter in a route
+PARAMETER = re.compile(r"<\w+:(\w+)>")
+
+
+class Command(BaseCommand):
+    help = (
+        "Times every route in auctions/urls.py through the test client on a seeded scratch "
+        "database and writes p50/p95/p99 latency and query counts to a JSON report"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--listings", type=int, default=20000)
+        parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+        parser.add_argument("--report", default="bench_report.json")
+        parser.add_argument("--compare", help="An earlier report to print the change against")
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            seed(users=options["users"], listings=options["listings"])
+            results = self.run_routes(options["requests"])
+
+        report = {
+            "scale": {"users": options["users"], "listings": options["listings"]},
+            "requests_per_route": options["requests"],
+            "routes": results,
+        }
+        with open(options["report"], "w") as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+
+        previous = {}
+        if options["compare"]:
+            with open(options["compare"]) as previous_file:
+                previous = json.load(previous_file)["routes"]
+        for route, result in results.items():
+            line = f"{route:<32} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  " \
+                f"p99 {result['p99_ms']:>8.2f} ms  {result['queries']:>3} queries"
+            if route in previous:
+                line += f"  (p95 {result['p95_ms'] - previous[route]['p95_ms']:+.2f} ms, " \
+                    f"{result['queries'] - previous[route]['queries']:+d} queries)"
+            self.stdout.write(line)
+        self.stdout.write(f"Report written to {options['report']}")
+
+    def run_routes(self, count):
+        rng = random.Random(0)
+        user = User.objects.order_by("id").first()
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        listings = list(Listing.objects.active().values_list("id", "listing_title")[:1000])
+        category_names = list(Category.objects.values_list("name", flat=True))
+        usernames = list(User.objects.values_list("username", flat=True)[:1000])
+
+        # What each route parameter is filled with
+        values = {
+            "listing_id": lambda: rng.choice(listings)[0],
+            "listing": lambda: rng.choice(listings)[1],
+            "category": lambda: rng.choice(category_names),
+            "username": lambda: rng.choice(usernames),
+            "table": lambda: "bids",
+            "size": lambda: "card",
+        }
+
+        def fill(route):
+            return "/" + PARAMETER.sub(lambda match: str(values[match.group(1)]()), route)
+
+        scenarios = {}
+        for pattern in urls.urlpatterns:
+            route = str(pattern.pattern)
+            if route in SKIPPED:
+                continue
+            missing = sorted(set(PARAMETER.findall(route)) - set(values))
+            if missing:
+                raise CommandError(
+                    f"No value to fill {', '.join(missing)} in the route {route!r} with, "
+                    "add one to the values in run_routes() or the route to SKIPPED"
+                )
+            scenarios[route or "/"] = lambda route=route: client.get(fill(route), {"q": rng.choice(listings)[1][:4]})
+
+        def place_bid():
+            listing_id, _ = rng.choice(listings)
+            return client.post(f"/bid/{listing_id}", {"bid": rng.randint(1, 10 ** 6)})
+        scenarios["POST bid/<int:listing_id>"] = place_bid
+
+        results = {}
+        for name, request in scenarios.items():
+            timings, queries, statuses = [], [], set()
+            for _ in range(count):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = request()
+                    timings.append(time.perf_counter() - start)
+                queries.append(len(captured))
+                statuses.add(response.status_code)
+            results[name] = {
+                **percentiles(timings),
+                "queries": sorted(queries)[len(queries) // 2],
+                "max_queries": max(queries),
+                "status": sorted(statuses),
+            }
+        return results
@@ -0,0 +1,73 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from auctions.benchmarks import scratch_database
+from auctions.models import User
+from auctions.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Measures search latency over a generated corpus of listings, on a scratch database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=1000000)
+        parser.add_argument("--queries", type=int, default=2000)
+        parser.add_argument("--vocabulary", type=int, default=50000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        vocabulary = list({
+            "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+            for _ in range(options["vocabulary"])
+        })
+        categories = vocabulary[:50]
+
+        with scratch_database():
+            user = User.objects.create(username="seller")
+            start = time.perf_counter()
+            self.load_listings(rng, vocabulary, categories, user.id, options["listings"])
+            backend = get_search_backend()
+            backend.rebuild()
+            self.stdout.write(f"Indexed {options['listings']} listings in {time.perf_counter() - start:.1f}s")
+
+            queries = {
+                "one word": lambda: rng.choice(vocabulary) + " ",
+                "two words": lambda: f"{rng.choice(vocabulary)} {rng.choice(vocabulary)} ",
+                "prefix": lambda: rng.choice(vocabulary)[:rng.randint(3, 5)],
+                "category": lambda: rng.choice(categories) + " ",
+            }
+            for label, make_query in queries.items():
+                timings = []
+                for _ in range(options["queries"]):
+                    query = make_query()
+                    begin = time.perf_counter()
+                    backend.search(query, 20)
+                    timings.append(time.perf_counter() - begin)
+                timings.sort()
+                self.stdout.write(
+                    f"{label:>10}: p50 {timings[len(timings) // 2] * 1000:.2f} ms, "
+                    f"p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} ms, "
+                    f"max {timings[-1] * 1000:.2f} ms"
+                )
+
+    def load_listings(self, rng, vocabulary, categories, user_id, count):
+        sql = (
+            "INSERT INTO auctions_listing (user_id, listing_title, listing_description, starting_bid, "
+            "current_bid, listing_category, active, highest_bidder_id, bid_count, comment_count, updated_at) "
+            "VALUES (%s, %s, %s, 1, 1, %s, 1, %s, 0, 0, CURRENT_TIMESTAMP)"
+        )
+        batch = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            for i in range(count):
+                title = f"{' '.join(rng.choices(vocabulary, k=3))} {i}"
+                description = " ".join(rng.choices(vocabulary, k=12))
+                batch.append((user_id, title, description, rng.choice(categories), user_id))
+                if len(batch) == 10000:
+                    cursor.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
@@ -0,0 +1,70 @@
+import importlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from auctions.benchmarks import percentiles, scratch_database, seed
+from auctions.instrumentation import QueryRecorder
+from auctions.models import User, Listing, Watchlist
+
+
+class Command(BaseCommand):
+    help = (
+        "Counts the queries and times authenticated page views with database sessions and "
+        "the stock authentication middleware, then with the cached sessions and cached user "
+        "of the production profile, on a seeded scratch database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Page views per page and profile")
+        parser.add_argument("--production-settings", default="commerce.settings_production")
+
+    def handle(self, *args, **options):
+        production = importlib.import_module(options["production_settings"])
+        profiles = {
+            "database": {"SESSION_ENGINE": settings.SESSION_ENGINE, "MIDDLEWARE": settings.MIDDLEWARE},
+            "production": {"SESSION_ENGINE": production.SESSION_ENGINE, "MIDDLEWARE": production.MIDDLEWARE},
+        }
+
+        with scratch_database():
+            seed(users=100, listings=2000)
+            user = User.objects.create_user("bench viewer", password="password")
+            listings = list(Listing.objects.active()[:20])
+            Watchlist.objects.bulk_create([Watchlist(user=user, listing=listing) for listing in listings])
+            pages = {
+                "index": "/",
+                "listing": f"/listing/{listings[0].id}",
+                "watchlist": "/watchlist_view",
+                "categories": "/categories",
+            }
+            results = {}
+            for profile, overrides in profiles.items():
+                with override_settings(**overrides):
+                    cache.clear()
+                    client = Client()
+                    client.login(username="bench viewer", password="password")
+                    for page, url in pages.items():
+                        # Fill the snapshot, session and user caches
+                        client.get(url)
+                        queries = QueryRecorder()
+                        with connection.execute_wrapper(queries):
+                            client.get(url)
+                        timings = []
+                        for _ in range(options["requests"]):
+                            start = time.perf_counter()
+                            client.get(url)
+                            timings.append(time.perf_counter() - start)
+                        results[profile, page] = (len(queries.queries), percentiles(timings))
+
+        self.stdout.write(f"{'':<12}{'database':>26}{'production':>26}")
+        for page in pages:
+            line = f"{page:<12}"
+            for profile in profiles:
+                count, timing = results[profile, page]
+                line += f"{count:>10} queries {timing['p50_ms']:>6.2f} ms"
+            saved = results["database", page][0] - results["production", page][0]
+            self.stdout.write(f"{line}   {saved} fewer")
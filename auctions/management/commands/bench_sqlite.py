@@ -0,0 +1,141 @@
+import importlib
+import itertools
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections, OperationalError
+from django.test import RequestFactory, override_settings
+
+from auctions.benchmarks import percentiles, scratch_database, seed
+from auctions.bidding import place_bid
+from auctions.models import User, Listing
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs reader and bidder threads against a seeded on-disk scratch SQLite database, "
+        "first with the settings in use and then with the production profile, and compares throughput"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--bidders", type=int, default=4)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per profile")
+        parser.add_argument("--listings", type=int, default=2000)
+        parser.add_argument("--hot-listings", type=int, default=20, help="Listings the bidders fight over")
+        parser.add_argument("--production-settings", default="commerce.settings_production")
+
+    def handle(self, *args, **options):
+        production = importlib.import_module(options["production_settings"])
+        profiles = {
+            # journal_mode is stored in the database file, so it has to be set back explicitly
+            "current": {
+                "CONN_MAX_AGE": connection.settings_dict["CONN_MAX_AGE"],
+                "OPTIONS": dict(connection.settings_dict["OPTIONS"]),
+                "AUCTIONS_SQLITE_PRAGMAS": {"journal_mode": "delete", **settings.AUCTIONS_SQLITE_PRAGMAS},
+                "AUCTIONS_SQLITE_LOCKED_RETRIES": settings.AUCTIONS_SQLITE_LOCKED_RETRIES,
+            },
+            "production": {
+                "CONN_MAX_AGE": production.DATABASES["default"].get("CONN_MAX_AGE", 0),
+                "OPTIONS": production.DATABASES["default"].get("OPTIONS", {}),
+                "AUCTIONS_SQLITE_PRAGMAS": production.AUCTIONS_SQLITE_PRAGMAS,
+                "AUCTIONS_SQLITE_LOCKED_RETRIES": production.AUCTIONS_SQLITE_LOCKED_RETRIES,
+            },
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            with scratch_database(os.path.join(directory, "bench.sqlite3")):
+                seed(users=200, listings=options["listings"])
+                results = {name: self.run_profile(profile, options) for name, profile in profiles.items()}
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<11} reads {result['reads'] / options['duration']:>8.0f}/s "
+                f"(p95 {result['read']['p95_ms']:.1f} ms)  bids {result['bids'] / options['duration']:>7.0f}/s "
+                f"(p95 {result['bid']['p95_ms']:.1f} ms)  errors {result['errors']}"
+            )
+        current, tuned = results["current"], results["production"]
+        self.stdout.write(
+            f"production vs current: reads x{tuned['reads'] / max(current['reads'], 1):.2f}, "
+            f"bids x{tuned['bids'] / max(current['bids'], 1):.2f}"
+        )
+
+    def run_profile(self, profile, options):
+        connections.close_all()
+        connection.settings_dict.update(CONN_MAX_AGE=profile["CONN_MAX_AGE"], OPTIONS=profile["OPTIONS"])
+        with override_settings(
+            AUCTIONS_SQLITE_PRAGMAS=profile["AUCTIONS_SQLITE_PRAGMAS"],
+            AUCTIONS_SQLITE_LOCKED_RETRIES=profile["AUCTIONS_SQLITE_LOCKED_RETRIES"],
+        ):
+            # Open one connection up front so the journal mode is switched before the threads start
+            connection.ensure_connection()
+            connection.close()
+
+            users = list(User.objects.all()[:100])
+            listing_ids = list(Listing.objects.active().values_list("id", flat=True)[:options["hot_listings"]])
+            connection.close()
+            handler = WSGIHandler()
+            factory = RequestFactory()
+            amounts = itertools.count(10 ** 6)
+            deadline = time.perf_counter() + options["duration"]
+            lock = threading.Lock()
+            totals = {"read": [], "bid": [], "errors": 0}
+
+            def reader(seed):
+                rng = random.Random(seed)
+                def request():
+                    path = rng.choice(["/", f"/listing/{rng.choice(listing_ids)}"])
+                    response = handler(factory.get(path).environ, lambda status, headers: None)
+                    b"".join(response)
+                    response.close()
+                run(request)
+
+            def bidder(seed):
+                rng = random.Random(seed)
+                def request():
+                    # Behave like a request so CONN_MAX_AGE decides when the connection closes
+                    request_started.send(sender=None)
+                    try:
+                        place_bid(rng.choice(users), Listing(pk=rng.choice(listing_ids)), next(amounts))
+                    finally:
+                        request_finished.send(sender=None)
+                run(request, "bid")
+
+            def run(request, kind="read"):
+                timings, errors = [], 0
+                try:
+                    while time.perf_counter() < deadline:
+                        start = time.perf_counter()
+                        try:
+                            request()
+                        except OperationalError:
+                            errors += 1
+                            continue
+                        timings.append(time.perf_counter() - start)
+                finally:
+                    connection.close()
+                with lock:
+                    totals[kind].extend(timings)
+                    totals["errors"] += errors
+
+            threads = [threading.Thread(target=reader, args=(i,)) for i in range(options["readers"])]
+            threads += [threading.Thread(target=bidder, args=(i,)) for i in range(options["bidders"])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        return {
+            "reads": len(totals["read"]),
+            "bids": len(totals["bid"]),
+            "errors": totals["errors"],
+            "read": percentiles(totals["read"] or [0]),
+            "bid": percentiles(totals["bid"] or [0]),
+        }
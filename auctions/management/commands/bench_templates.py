@@ -0,0 +1,70 @@
+import copy
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from auctions.benchmarks import percentiles, scratch_database, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Times rendering a page of listing cards on the index with and without the cached "
+        "template loader and the listing card fragment cache, on a seeded scratch database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cards", type=int, default=500, help="Listings on the page")
+        parser.add_argument("--requests", type=int, default=50)
+
+    def handle(self, *args, **options):
+        cards = options["cards"]
+        loaders = {
+            "filesystem": [
+                "django.template.loaders.filesystem.Loader",
+                "django.template.loaders.app_directories.Loader",
+            ],
+        }
+        loaders["cached"] = [("django.template.loaders.cached.Loader", loaders["filesystem"])]
+        fragments = {
+            "off": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+            "on": settings.CACHES["template_fragments"],
+        }
+        profiles = [
+            ("filesystem loader, no fragments", "filesystem", "off"),
+            ("cached loader, no fragments", "cached", "off"),
+            ("cached loader, fragments", "cached", "on"),
+        ]
+
+        with scratch_database():
+            seed(users=100, listings=cards * 2)
+            results = {}
+            for name, loader, fragment_cache in profiles:
+                templates = copy.deepcopy(settings.TEMPLATES)
+                templates[0]["APP_DIRS"] = False
+                templates[0]["OPTIONS"]["loaders"] = loaders[loader]
+                with override_settings(
+                    TEMPLATES=templates,
+                    CACHES={**settings.CACHES, "template_fragments": fragments[fragment_cache]},
+                    AUCTIONS_MAX_PAGE_SIZE=cards,
+                ):
+                    caches["template_fragments"].clear()
+                    client = Client()
+                    # The first request compiles the templates and fills the fragment cache
+                    client.get("/", {"page_size": cards})
+                    timings = []
+                    for _ in range(options["requests"]):
+                        start = time.perf_counter()
+                        response = client.get("/", {"page_size": cards})
+                        timings.append(time.perf_counter() - start)
+                    assert len(response.context["active_listings"]) == cards
+                results[name] = percentiles(timings)
+
+        baseline = results[profiles[0][0]]["p50_ms"]
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<32} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+                f"x{baseline / result['p50_ms']:.2f}"
+            )
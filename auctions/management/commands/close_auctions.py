@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.closing import close_due_auctions
+
+
+class Command(BaseCommand):
+    help = "Closes every auction whose end time has passed and declares its winner"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--loop", action="store_true", help="Keep running, checking every --interval seconds")
+        parser.add_argument("--interval", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            closed = close_due_auctions(batch_size=options["batch_size"])
+            elapsed = time.perf_counter() - start
+            if closed or not options["loop"]:
+                self.stdout.write(
+                    f"Closed {closed} auctions in {elapsed:.2f}s ({closed / elapsed if elapsed else 0:.0f}/s)"
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Recomputes the bid and comment counts of every listing from the bids and comments"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000, help="Listings updated per transaction")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        last_id = Listing.objects.aggregate(last=Max("id"))["last"] or 0
+        batch_size = options["batch_size"]
+        updated = 0
+        # Whole id ranges rather than id lists keep every batch a single indexed UPDATE
+        for first in range(0, last_id + 1, batch_size):
+            with transaction.atomic():
+                updated += Listing.objects.filter(id__gte=first, id__lt=first + batch_size).recount_activity()
+        self.stdout.write(f"Recounted {updated} listings in {time.perf_counter() - start:.2f}s")
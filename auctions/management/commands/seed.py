@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.benchmarks import seed
+
+
+class Command(BaseCommand):
+    help = "Fills the database with generated users, listings, bids, comments and watchlist entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--listings", type=int, default=100000)
+        parser.add_argument("--bids", type=int, default=5, help="Average bids per listing")
+        parser.add_argument("--comments", type=int, default=2, help="Average comments per listing")
+        parser.add_argument("--watchers", type=int, default=3, help="Average watchlist entries per listing")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--random-seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        seed(
+            users=options["users"], listings=options["listings"], bids=options["bids"],
+            comments=options["comments"], watchers=options["watchers"], batch_size=options["batch_size"],
+            random_seed=options["random_seed"], log=self.stdout.write,
+        )
+        self.stdout.write(f"Seeded in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+def remove_duplicate_watchlist_rows(apps, schema_editor):
+    """Keeps only the newest watchlist row per user and listing so the unique constraint can be added"""
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+    db = schema_editor.connection.alias
+    seen = set()
+    duplicates = []
+    for row in Watchlist.objects.using(db).order_by('-id').values('id', 'user_id', 'listing_id'):
+        key = (row['user_id'], row['listing_id'])
+        if key in seen:
+            duplicates.append(row['id'])
+        seen.add(key)
+    Watchlist.objects.using(db).filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0007_comment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', 'id'], name='bid_listing_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['listing', 'id'], name='comment_listing_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['active', 'id'], name='listing_active_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['listing_category', 'id'], name='listing_category_id_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_watchlist_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='watchlist',
+            constraint=models.UniqueConstraint(fields=('user', 'listing'), name='unique_watchlist_user_listing'),
+        ),
+    ]
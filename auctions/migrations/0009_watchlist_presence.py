@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:30
+
+from django.db import migrations
+
+
+def delete_unwatched_rows(apps, schema_editor):
+    """Rows that only recorded a listing was viewed, not watched, are no longer kept"""
+    Watchlist = apps.get_model('auctions', 'Watchlist')
+    db = schema_editor.connection.alias
+    Watchlist.objects.using(db).filter(on_watchlist=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_unwatched_rows, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='watchlist',
+            name='on_watchlist',
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0009_watchlist_presence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='end_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['active', 'end_at'], name='listing_active_end_at_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE auctions_listing_fts USING fts5("
+            "listing_title, listing_description, listing_category, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        # Makes ORDER BY rank weigh title matches over category and description ones
+        schema_editor.execute(
+            "INSERT INTO auctions_listing_fts (auctions_listing_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 5.0)')"
+        )
+        schema_editor.execute(
+            "INSERT INTO auctions_listing_fts (rowid, listing_title, listing_description, listing_category) "
+            "SELECT id, listing_title, listing_description, coalesce(listing_category, '') FROM auctions_listing"
+        )
+    elif vendor == 'postgresql':
+        # Must stay the same expression as PostgresSearchBackend.vector for the index to be used
+        schema_editor.execute(
+            "CREATE INDEX listing_search_idx ON auctions_listing USING GIN (("
+            "setweight(to_tsvector('simple', listing_title), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(listing_category, '')), 'B') || "
+            "setweight(to_tsvector('simple', listing_description), 'D')))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE auctions_listing_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX listing_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0010_listing_end_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fold_categories(apps, schema_editor):
+    """Gives every spelling of a category name that differs only in case or spacing one Category"""
+    Category = apps.get_model('auctions', 'Category')
+    Listing = apps.get_model('auctions', 'Listing')
+    db = schema_editor.connection.alias
+    names = Listing.objects.using(db).exclude(listing_category__isnull=True).values_list('listing_category', flat=True).distinct()
+    for raw_name in list(names):
+        name = " ".join(raw_name.split())
+        if not name:
+            continue
+        category, created = Category.objects.using(db).get_or_create(key=name.casefold(), defaults={'name': name})
+        Listing.objects.using(db).filter(listing_category=raw_name).update(category=category, listing_category=category.name)
+    counts = Category.objects.using(db).annotate(
+        active=Count('listings', filter=Q(listings__active=True)),
+        total=Count('listings'),
+    ).values_list('id', 'active', 'total')
+    for category_id, active, total in counts:
+        Category.objects.using(db).filter(pk=category_id).update(active_count=active, total_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_listing_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32)),
+                ('key', models.CharField(max_length=32, unique=True)),
+                ('active_count', models.IntegerField(default=0)),
+                ('total_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_category_id_idx',
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='listings', to='auctions.category'),
+        ),
+        migrations.RunPython(fold_categories, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['category', 'id'], name='listing_category_id_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_existing_activity(apps, schema_editor):
+    """Fills the new counters from the bids and comments already there"""
+    Listing = apps.get_model('auctions', 'Listing')
+    db = schema_editor.connection.alias
+
+    def count(model_name):
+        rows = apps.get_model('auctions', model_name).objects.using(db).filter(listing=OuterRef('pk')).order_by().values('listing')
+        return Coalesce(Subquery(rows.annotate(count=Count('id')).values('count')), Value(0))
+
+    Listing.objects.using(db).update(bid_count=count('Bid'), comment_count=count('Comment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0012_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0016_proxybid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedListing',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('listing_title', models.CharField(max_length=64)),
+                ('listing_description', models.CharField(max_length=256)),
+                ('starting_bid', models.IntegerField()),
+                ('current_bid', models.IntegerField()),
+                ('listing_image_url', models.URLField(blank=True, null=True)),
+                ('listing_category', models.CharField(blank=True, max_length=32, null=True)),
+                ('end_at', models.DateTimeField(blank=True, null=True)),
+                ('bid_count', models.PositiveIntegerField(default=0)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='auctions.category')),
+                ('highest_bidder', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('winner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('comment', models.CharField(max_length=256)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comment_set', to='auctions.archivedlisting')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['listing', 'id'], name='archivedcomment_listing_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBid',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('amount', models.IntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bid_on_listing', to='auctions.archivedlisting')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['listing', 'id'], name='archivedbid_listing_id_idx')],
+            },
+        ),
+    ]
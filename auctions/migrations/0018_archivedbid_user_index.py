@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0017_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedbid',
+            index=models.Index(fields=['user', 'id'], name='archivedbid_user_id_idx'),
+        ),
+    ]
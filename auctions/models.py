@@ -1,10 +1,101 @@
+from collections import Counter
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 
 class User(AbstractUser):
     pass
 
+
+class Category(models.Model):
+    '''
+    A listing category, matched case and whitespace insensitively through key.
+    The listing counts are kept up to date as listings are created, edited,
+    closed and deleted so the categories page never has to count listings
+    '''
+    name = models.CharField(max_length=32)
+    key = models.CharField(max_length=32, unique=True)
+    active_count = models.IntegerField(default=0)
+    total_count = models.IntegerField(default=0)
+
+    @staticmethod
+    def clean_name(name):
+        return " ".join((name or "").split())
+
+    @classmethod
+    def for_name(cls, name):
+        '''Returns the category called name, creating it if needed, or None for a blank name'''
+        name = cls.clean_name(name)
+        if not name:
+            return None
+        category, created = cls.objects.get_or_create(key=name.casefold(), defaults={"name": name})
+        return category
+
+    @classmethod
+    def count_created(cls, listing):
+        if listing.category_id is not None:
+            cls.objects.filter(pk=listing.category_id).update(
+                total_count=F("total_count") + 1,
+                active_count=F("active_count") + (1 if listing.active else 0),
+            )
+
+    @classmethod
+    def count_closed(cls, category_ids):
+        '''Takes one active listing off its category's count per entry in category_ids'''
+        for category_id, closed in Counter(category_ids).items():
+            if category_id is not None:
+                cls.objects.filter(pk=category_id).update(active_count=F("active_count") - closed)
+
+    @classmethod
+    def count_deleted(cls, listing):
+        if listing.category_id is not None:
+            cls.objects.filter(pk=listing.category_id).update(
+                total_count=F("total_count") - 1,
+                active_count=F("active_count") - (1 if listing.active else 0),
+            )
+
+    @classmethod
+    def recount(cls, category_ids=None):
+        '''Recomputes the counts from the listings, for all categories or just the ones given'''
+        categories = cls.objects.all() if category_ids is None else cls.objects.filter(pk__in=category_ids)
+        counts = categories.annotate(
+            active=Count("listings", filter=Q(listings__active=True)),
+            total=Count("listings"),
+        ).values_list("id", "active", "total")
+        for category_id, active, total in counts:
+            cls.objects.filter(pk=category_id).update(active_count=active, total_count=total)
+
+    def __str__(self):
+        return self.name
+
+class ListingQuerySet(models.QuerySet):
+
+    # active=True compiles to a bare boolean column test that SQLite will not
+    # match against the (active, id) index, while active__in compiles to an
+    # equality it can seek on
+
+    def active(self):
+        return self.filter(active__in=[True])
+
+    def inactive(self):
+        return self.filter(active__in=[False])
+
+    def due(self, now):
+        '''Active listings whose end time has passed'''
+        return self.active().filter(end_at__lte=now)
+
+    def recount_activity(self):
+        '''Recomputes bid_count and comment_count of these listings in one UPDATE'''
+        def count(model):
+            rows = model.objects.filter(listing=OuterRef("pk")).order_by().values("listing")
+            return Coalesce(Subquery(rows.annotate(count=Count("id")).values("count")), Value(0))
+        return self.update(bid_count=count(Bid), comment_count=count(Comment))
+
+
 class Listing(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="listing_owner")
     listing_title = models.CharField(max_length=64, unique=True)
@@ -12,10 +103,52 @@ class Listing(models.Model):
     starting_bid = models.IntegerField()
     current_bid = models.IntegerField()
     listing_image_url = models.URLField(blank=True, null=True)
+    # Name of the category, copied from it so feeds and search need no join
     listing_category = models.CharField(blank=True, max_length=32, null=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True, related_name="listings")
     active = models.BooleanField(blank=True, null=True)
     winner = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name="listing_winner")
     highest_bidder = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name="highest_bidder")
+    # Listings without an end time stay open until their owner closes them
+    end_at = models.DateTimeField(blank=True, null=True)
+    # Number of bids and comments, kept up to date with F() by place_bid and
+    # Comment.add so pages can show them without counting. `manage.py
+    # recount_listings` puts them right if rows were changed some other way
+    bid_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Touched by every save and by the bid, comment and close updates, so it
+    # tells when anything shown about the listing last changed
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ListingQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        listing = super().from_db(db, field_names, values)
+        # The category and state the category counts hold the listing under,
+        # so saving it can tell whether they change. See auctions.signals
+        loaded = dict(zip(field_names, values))
+        if "category_id" in loaded and "active" in loaded:
+            listing.counted_as = (loaded["category_id"], loaded["active"])
+        return listing
+
+    class Meta:
+        indexes = [
+            # The active/inactive feeds page through listings in id order
+            models.Index(fields=["active", "id"], name="listing_active_id_idx"),
+            # Category feeds filter by category and page in id order
+            models.Index(fields=["category", "id"], name="listing_category_id_idx"),
+            # The auction closer looks for active listings past their end time
+            models.Index(fields=["active", "end_at"], name="listing_active_end_at_idx"),
+            # The newest updated_at is the version of the feeds
+            models.Index(fields=["updated_at"], name="listing_updated_at_idx"),
+        ]
+
+    @property
+    def card_version(self):
+        '''Part of the cache key of the listing cards on the feeds, so any change shows a fresh card'''
+        return self.updated_at.timestamp()
+
     def __str__(self):
         return f"{self.listing_title} By {self.user}"
 
@@ -25,24 +158,56 @@ class Bid(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="bid_on_listing")
     amount = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing", "id"], name="bid_listing_id_idx"),
+            # A user's bid history pages through their bids in id order
+            models.Index(fields=["user", "id"], name="bid_user_id_idx"),
+        ]
+
     def __str__(self):
         return f"A Bid for {self.amount} By {self.user} on {self.listing}"
 
+
+class ProxyBid(models.Model):
+    '''
+    The hidden most a user will pay for a listing. The proxy bidding in
+    auctions.bidding bids for them, only as much as needed to stay ahead,
+    until someone else's maximum is higher. One per user and listing
+    '''
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="proxy_bids")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="proxy_bids")
+    max_amount = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["listing", "user"], name="proxybid_listing_user_unique"),
+        ]
+        indexes = [
+            # Settling a listing reads its two highest maximums, earliest first on a tie
+            models.Index(fields=["listing", "-max_amount", "id"], name="proxybid_listing_max_idx"),
+        ]
+
+    def __str__(self):
+        return f"A proxy bid of up to {self.max_amount} By {self.user} on {self.listing}"
+
 class Watchlist(models.Model):
+    '''A listing is on a user's watchlist exactly when a row for the pair exists'''
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
-    on_watchlist = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "listing"], name="unique_watchlist_user_listing"),
+        ]
 
     @classmethod
-    def create(cls, user, listing, on_watchlist):
-        watchlist = cls(user=user, listing=listing, on_watchlist=on_watchlist)
+    def create(cls, user, listing):
+        watchlist = cls(user=user, listing=listing)
         return watchlist
 
     def __str__(self):
-        if self.on_watchlist == True:
-            return f"{self.listing} is on {self.user}'s watchlist"
-        else:
-            return f"{self.listing} is not on {self.user}'s watchlist"
+        return f"{self.listing} is on {self.user}'s watchlist"
 
 
 class Comment(models.Model):
@@ -50,5 +215,85 @@ class Comment(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
     comment = models.CharField(max_length=256)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing", "id"], name="comment_listing_id_idx"),
+        ]
+
+    @classmethod
+    def add(cls, user, listing, comment):
+        '''Saves a comment on listing and counts it in listing.comment_count'''
+        with transaction.atomic():
+            saved = cls.objects.create(user=user, listing=listing, comment=comment)
+            Listing.objects.filter(pk=listing.pk).update(comment_count=F("comment_count") + 1, updated_at=timezone.now())
+        return saved
+
+    def __str__(self):
+        return f"A comment by {self.user} on {self.listing}"
+
+# The archive. auctions.archive moves listings closed for longer than
+# AUCTIONS_ARCHIVE_AFTER_DAYS, with their bids and comments, out of the tables
+# above into these, so the tables every open auction is read from stay small.
+# Rows keep their ids, and the fields and related names follow the hot
+# models', so the feeds, snapshots and templates take either
+
+
+class ArchivedListing(models.Model):
+    '''A closed listing moved out of Listing, under the id it had there so its urls still work'''
+    id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    listing_title = models.CharField(max_length=64)
+    listing_description = models.CharField(max_length=256)
+    starting_bid = models.IntegerField()
+    current_bid = models.IntegerField()
+    listing_image_url = models.URLField(blank=True, null=True)
+    listing_category = models.CharField(blank=True, max_length=32, null=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True, related_name="+")
+    winner = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name="+")
+    highest_bidder = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name="+")
+    end_at = models.DateTimeField(blank=True, null=True)
+    bid_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
+    # Only closed listings are archived
+    active = False
+
+    @property
+    def card_version(self):
+        return self.updated_at.timestamp()
+
+    def __str__(self):
+        return f"{self.listing_title} By {self.user} (archived)"
+
+
+class ArchivedBid(models.Model):
+    id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name="bid_on_listing")
+    amount = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing", "id"], name="archivedbid_listing_id_idx"),
+            models.Index(fields=["user", "id"], name="archivedbid_user_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"A Bid for {self.amount} By {self.user} on {self.listing}"
+
+
+class ArchivedComment(models.Model):
+    id = models.IntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    listing = models.ForeignKey(ArchivedListing, on_delete=models.CASCADE, related_name="comment_set")
+    comment = models.CharField(max_length=256)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing", "id"], name="archivedcomment_listing_id_idx"),
+        ]
+
     def __str__(self):
-        return f"A comment by {self.user} on {self.listing}"
\ No newline at end of file
+        return f"A comment by {self.user} on {self.listing}"
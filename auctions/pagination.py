@@ -0,0 +1,101 @@
+from itertools import chain
+from operator import attrgetter
+
+from django.conf import settings
+
+
+class KeysetPage:
+    '''One page of a keyset (cursor) paginated feed'''
+
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _int_param(request, name):
+    try:
+        value = int(request.GET.get(name, ""))
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+
+def get_page_size(request):
+    '''
+    Returns the page size asked for with ?page_size=, falling back to
+    AUCTIONS_PAGE_SIZE and never exceeding AUCTIONS_MAX_PAGE_SIZE
+    '''
+    default = getattr(settings, "AUCTIONS_PAGE_SIZE", 20)
+    maximum = getattr(settings, "AUCTIONS_MAX_PAGE_SIZE", 100)
+    page_size = _int_param(request, "page_size") or default
+    return min(page_size, maximum)
+
+
+def _keyset_query(request, queryset):
+    '''
+    Returns the query fetching the rows of the page asked for, plus one to
+    tell whether there is another page, and a function making a KeysetPage of them
+    '''
+    page_size = get_page_size(request)
+    after = _int_param(request, "after")
+    before = _int_param(request, "before")
+
+    if before is not None:
+        def make_page(rows):
+            # Walked backwards from the cursor, flip the rows back in order
+            has_more = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+            prev_cursor = rows[0].id if rows and has_more else None
+            next_cursor = rows[-1].id if rows else None
+            return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
+        return queryset.filter(id__lt=before).order_by("-id")[:page_size + 1], make_page
+
+    def make_page(rows):
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_cursor = rows[-1].id if rows and has_more else None
+        prev_cursor = rows[0].id if rows and after is not None else None
+        return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    return queryset.order_by("id")[:page_size + 1], make_page
+
+
+def _merged(request, pages):
+    '''The rows fetched for one page from several querysets, as the one query would have returned them'''
+    if len(pages) == 1:
+        return pages[0]
+    return sorted(chain.from_iterable(pages), key=attrgetter("id"), reverse=_int_param(request, "before") is not None)
+
+
+def keyset_page(request, queryset, *others):
+    '''
+    Returns a KeysetPage of the queryset ordered by id.
+
+    The cursors are the ids at the edges of the page, so moving between pages
+    is an indexed range scan (id > cursor / id < cursor) instead of an OFFSET
+    and rows inserted meanwhile never shift a page.
+
+    The rows of any other querysets, of models sharing the same ids (the
+    archive tables), are paged through along with them as one feed, at one
+    more query each.
+    '''
+    query, make_page = _keyset_query(request, queryset)
+    pages = [list(query)] + [list(_keyset_query(request, other)[0]) for other in others]
+    return make_page(_merged(request, pages))
+
+
+async def akeyset_page(request, queryset, *others):
+    '''keyset_page for async views, fetching the page with the async ORM'''
+    query, make_page = _keyset_query(request, queryset)
+    pages = [[row async for row in query]]
+    for other in others:
+        pages.append([row async for row in _keyset_query(request, other)[0]])
+    return make_page(_merged(request, pages))
@@ -0,0 +1,78 @@
+import functools
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+
+# Cookie that keeps a user who just wrote something reading from the primary
+PRIMARY_COOKIE = "read_primary"
+
+# The replica the reads of the current request go to, None for the primary
+_replica = ContextVar("replica", default=None)
+
+
+def _pick_replica(request):
+    replicas = getattr(settings, "AUCTIONS_READ_REPLICAS", [])
+    if not replicas or PRIMARY_COOKIE in request.COOKIES:
+        return None
+    return random.choice(replicas)
+
+
+def read_from_replica(view):
+    '''
+    Lets the reads made while rendering view go to a read replica, unless the
+    user wrote something in the last AUCTIONS_REPLICA_LAG_SECONDS and so must
+    see their own change, which the replica may not have yet. One replica is
+    picked per request, so a page is never put together from replicas that
+    lag by different amounts
+    '''
+    if iscoroutinefunction(view):
+        # The async ORM runs queries in a thread that is handed a copy of this context
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _replica.set(_pick_replica(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _replica.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _replica.set(_pick_replica(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica.reset(token)
+    return wrapper
+
+
+def stick_to_primary(view):
+    '''Marks view as one that writes, so the user's next reads stay on the primary for a while'''
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        response.set_cookie(PRIMARY_COOKIE, "1", max_age=getattr(settings, "AUCTIONS_REPLICA_LAG_SECONDS", 5),
+            httponly=True, samesite="Lax")
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    '''
+    Sends reads made inside read_from_replica views to the one of the
+    AUCTIONS_READ_REPLICAS database aliases picked for the request.
+    Everything else, and every write, goes to the default database
+    '''
+
+    def db_for_read(self, model, **hints):
+        return _replica.get() or "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
@@ -0,0 +1,132 @@
+import re
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+
+FTS_TABLE = "auctions_listing_fts"
+
+
+def search_terms(query):
+    '''
+    Splits what a user typed into words. The last word is treated as a prefix
+    unless the query ends in a space, so results follow along while typing
+    '''
+    words = re.findall(r"\w+", query.lower())
+    prefix = bool(words) and not query[-1:].isspace()
+    return words, prefix
+
+
+class BaseSearchBackend:
+    '''
+    Keeps a full-text index of listing titles, descriptions and categories
+    and answers ranked queries against it with listing ids, best match first
+    '''
+
+    def index_listing(self, listing):
+        raise NotImplementedError
+
+    def remove_listing(self, listing_id):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def search(self, query, limit):
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    '''Searches the FTS5 table created by migration 0011'''
+
+    def index_listing(self, listing):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [listing.id])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, listing_title, listing_description, listing_category) "
+                "VALUES (%s, %s, %s, %s)",
+                [listing.id, listing.listing_title, listing.listing_description, listing.listing_category or ""],
+            )
+
+    def remove_listing(self, listing_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [listing_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, listing_title, listing_description, listing_category) "
+                "SELECT id, listing_title, listing_description, coalesce(listing_category, '') FROM auctions_listing"
+            )
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+    def search(self, query, limit):
+        words, prefix = search_terms(query)
+        if not words:
+            return []
+        # Quote every word so nothing typed is read as FTS5 syntax
+        terms = [f'"{word}"' for word in words]
+        if prefix:
+            terms[-1] += "*"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+                [" ".join(terms), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    '''
+    Searches a tsvector over the listing columns, backed by the GIN expression
+    index migration 0011 creates on PostgreSQL. The vector is computed from
+    the row itself, so there is nothing to keep in sync
+    '''
+
+    vector = (
+        "setweight(to_tsvector('simple', listing_title), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(listing_category, '')), 'B') || "
+        "setweight(to_tsvector('simple', listing_description), 'D')"
+    )
+
+    def index_listing(self, listing):
+        pass
+
+    def remove_listing(self, listing_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, limit):
+        words, prefix = search_terms(query)
+        if not words:
+            return []
+        terms = list(words)
+        if prefix:
+            terms[-1] += ":*"
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM auctions_listing, to_tsquery('simple', %s) AS query "
+                f"WHERE ({self.vector}) @@ query ORDER BY ts_rank({self.vector}, query) DESC LIMIT %s",
+                [" & ".join(terms), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    '''Returns the search backend named by AUCTIONS_SEARCH_BACKEND'''
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, "AUCTIONS_SEARCH_BACKEND", "auctions.search.SQLiteSearchBackend")
+                _backend = import_string(path)()
+    return _backend
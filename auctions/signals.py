@@ -0,0 +1,72 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .conditional import feed_listing_deleted
+from .models import User, Category, Listing, Bid, Comment
+from .search import get_search_backend
+from .snapshots import invalidate_listing_snapshot
+from .users import forget_user
+
+
+SEARCHED_FIELDS = {"listing_title", "listing_description", "listing_category"}
+
+
+@receiver([post_save, post_delete], sender=Listing)
+def listing_changed(sender, instance, **kwargs):
+    invalidate_listing_snapshot(instance.id)
+
+
+@receiver(post_save, sender=Listing)
+def index_listing(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCHED_FIELDS & set(update_fields):
+        get_search_backend().index_listing(instance)
+
+
+@receiver(post_delete, sender=Listing)
+def unindex_listing(sender, instance, **kwargs):
+    get_search_backend().remove_listing(instance.id)
+
+
+@receiver(post_delete, sender=Listing)
+def drop_from_feed(sender, instance, **kwargs):
+    # Archiving only deletes closed listings, which the index does not show
+    if instance.active:
+        feed_listing_deleted()
+
+
+@receiver(post_save, sender=Listing)
+def count_saved_listing(sender, instance, created, **kwargs):
+    # Closing and bidding use update(), which keeps the counts itself. An
+    # edit, in the admin say, counts the category it left and the one it is
+    # in again. A listing not loaded from the database only knows the latter
+    counted_as = getattr(instance, "counted_as", None)
+    if created:
+        Category.count_created(instance)
+    elif counted_as != (instance.category_id, instance.active):
+        previous_category_id = counted_as[0] if counted_as else None
+        Category.recount({instance.category_id, previous_category_id} - {None})
+    instance.counted_as = (instance.category_id, instance.active)
+
+
+@receiver(post_delete, sender=Listing)
+def count_deleted_listing(sender, instance, **kwargs):
+    Category.count_deleted(instance)
+
+
+@receiver([post_save, post_delete], sender=Bid)
+@receiver([post_save, post_delete], sender=Comment)
+def listing_activity(sender, instance, **kwargs):
+    invalidate_listing_snapshot(instance.listing_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Covers password changes and the last_login update on every log in
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def logged_out(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
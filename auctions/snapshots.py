@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+
+from .models import Listing, ArchivedListing
+
+
+# Bump when the shape of a snapshot changes so old entries are never read back
+SNAPSHOT_VERSION = 4
+
+
+def snapshot_key(listing_id):
+    return f"listing-snapshot:v{SNAPSHOT_VERSION}:{listing_id}"
+
+
+def _snapshot(listing, comments):
+    '''
+    Puts everything the listing page shows about a listing into a plain dict.
+    The keys follow the model field names so the templates can use it in place of a Listing
+    '''
+    return {
+        "id": listing.id,
+        "listing_title": listing.listing_title,
+        "listing_description": listing.listing_description,
+        "starting_bid": listing.starting_bid,
+        "current_bid": listing.current_bid,
+        "listing_image_url": listing.listing_image_url,
+        "listing_category": listing.listing_category,
+        "active": listing.active,
+        "user_id": listing.user_id,
+        "user": listing.user.username,
+        "winner_id": listing.winner_id,
+        "highest_bidder_id": listing.highest_bidder_id,
+        "end_at": listing.end_at,
+        "updated_at": listing.updated_at,
+        "bid_count": listing.bid_count,
+        "comment_count": listing.comment_count,
+        "comments": [{"user": username, "comment": comment} for username, comment in comments],
+    }
+
+
+def _comments(listing):
+    return listing.comment_set.order_by("id").values_list("user__username", "comment")
+
+
+def build_listing_snapshot(listing_id):
+    '''Reads a listing and its comments into a snapshot, from the archive once the listing is archived'''
+    for model in (Listing, ArchivedListing):
+        listing = model.objects.select_related("user").filter(pk=listing_id).first()
+        if listing is not None:
+            return _snapshot(listing, _comments(listing))
+    raise Http404("No Listing matches the given query.")
+
+
+async def abuild_listing_snapshot(listing_id):
+    '''build_listing_snapshot with the async ORM'''
+    for model in (Listing, ArchivedListing):
+        listing = await model.objects.select_related("user").filter(pk=listing_id).afirst()
+        if listing is not None:
+            return _snapshot(listing, [row async for row in _comments(listing)])
+    raise Http404("No Listing matches the given query.")
+
+
+def get_listing_snapshot(listing_id):
+    '''Returns the cached snapshot of a listing, building and caching it on a miss'''
+    key = snapshot_key(listing_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_listing_snapshot(listing_id)
+        cache.set(key, snapshot, getattr(settings, "LISTING_SNAPSHOT_TIMEOUT", 300))
+    return snapshot
+
+
+async def aget_listing_snapshot(listing_id):
+    '''get_listing_snapshot with the async cache and ORM'''
+    key = snapshot_key(listing_id)
+    snapshot = await cache.aget(key)
+    if snapshot is None:
+        snapshot = await abuild_listing_snapshot(listing_id)
+        await cache.aset(key, snapshot, getattr(settings, "LISTING_SNAPSHOT_TIMEOUT", 300))
+    return snapshot
+
+
+def invalidate_listing_snapshot(listing_id):
+    '''
+    Drops the cached snapshot of a listing now and again once the current
+    transaction commits, so a page rendered before the commit cannot put
+    the old state back in the cache
+    '''
+    key = snapshot_key(listing_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,44 @@
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import connection, OperationalError
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    '''
+    connection_created receiver that runs the AUCTIONS_SQLITE_PRAGMAS on every
+    new SQLite connection, since most pragmas only last as long as the connection
+    '''
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "AUCTIONS_SQLITE_PRAGMAS", {})
+    if pragmas:
+        with connection.cursor() as cursor:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def is_locked_error(error):
+    return "locked" in str(error)
+
+
+def retry_on_locked(func):
+    '''
+    Retries func up to AUCTIONS_SQLITE_LOCKED_RETRIES times, with a short
+    random backoff, when SQLite gives up waiting for a lock with "database is
+    locked". Inside an outer transaction the error is raised straight away,
+    as only the outermost block can safely be run again.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, "AUCTIONS_SQLITE_LOCKED_RETRIES", 0)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if attempt == retries or connection.in_atomic_block or not is_locked_error(error):
+                    raise
+                time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+    return wrapper
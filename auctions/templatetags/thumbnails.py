@@ -0,0 +1,21 @@
+import hashlib
+
+from django import template
+from django.urls import reverse
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(listing, size):
+    '''
+    The url of a listing's size thumbnail. The thumbnail view lets it be
+    cached for good, so ?v= changes with the image url and nothing else:
+    a listing taking bids keeps the same thumbnail url
+    '''
+    if isinstance(listing, dict):
+        listing_id, image_url = listing["id"], listing["listing_image_url"]
+    else:
+        listing_id, image_url = listing.id, listing.listing_image_url
+    version = hashlib.sha256((image_url or "").encode()).hexdigest()[:12]
+    return f"{reverse('thumbnail', args=[listing_id, size])}?v={version}"
@@ -1,3 +1,1485 @@
-from django.test import TestCase
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections, transaction, OperationalError
+from django.db.models import Max
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from commerce import settings_production
+
+from .archive import archive_closed_listings
+from .benchmarks import browse_views, seed
+from .bidding import place_bid, place_proxy_bid
+from .closing import close_due_auctions, close_listing
+from .events import InProcessBroker
+from .images import FetchError, Image, ImageCache, URLFetcher, _HTTPRedirectHandler
+from .instrumentation import stats as instrumentation_stats
+from .models import User, Category, Listing, Bid, ProxyBid, Watchlist, Comment, ArchivedListing, ArchivedBid, ArchivedComment
+from .routers import PRIMARY_COOKIE, ReplicaRouter, read_from_replica
+from .snapshots import get_listing_snapshot
+from .sqlite import retry_on_locked
+from .users import user_cache_key
+from .views import listing_event_stream
+
+
+def make_listing(user, title, **kwargs):
+    fields = dict(listing_description="A description", starting_bid=10, current_bid=10, active=True, highest_bidder=user)
+    fields.update(kwargs)
+    if fields.get("listing_category"):
+        fields["category"] = Category.for_name(fields["listing_category"])
+    return Listing.objects.create(user=user, listing_title=title, **fields)
+
+
+@override_settings(AUCTIONS_PAGE_SIZE=2)
+class FeedPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("seller", "seller@example.com", "password")
+        self.listings = [make_listing(self.user, f"item {i}") for i in range(5)]
+
+    def test_first_page_has_next_cursor_only(self):
+        response = self.client.get(reverse("index"))
+        page = response.context["page"]
+        self.assertEqual(list(response.context["active_listings"]), self.listings[:2])
+        self.assertEqual(page.next_cursor, self.listings[1].id)
+        self.assertIsNone(page.prev_cursor)
+
+    def test_next_and_prev_cursors_walk_the_feed(self):
+        response = self.client.get(reverse("index"), {"after": self.listings[1].id})
+        page = response.context["page"]
+        self.assertEqual(list(page), self.listings[2:4])
+
+        response = self.client.get(reverse("index"), {"before": page.prev_cursor})
+        self.assertEqual(list(response.context["page"]), self.listings[:2])
+        self.assertIsNone(response.context["page"].prev_cursor)
+
+    def test_insert_does_not_shift_the_next_page(self):
+        response = self.client.get(reverse("index"), {"after": self.listings[1].id})
+        first = list(response.context["page"])
+        make_listing(self.user, "late arrival")
+        response = self.client.get(reverse("index"), {"after": self.listings[1].id})
+        self.assertEqual(list(response.context["page"]), first)
+
+    def test_page_size_is_capped(self):
+        with self.settings(AUCTIONS_MAX_PAGE_SIZE=3):
+            response = self.client.get(reverse("index"), {"page_size": 50})
+        self.assertEqual(len(response.context["page"]), 3)
+
+    def test_json_feed(self):
+        response = self.client.get(reverse("index"), {"format": "json", "page_size": 4})
+        data = response.json()
+        self.assertEqual([row["id"] for row in data["results"]], [listing.id for listing in self.listings[:4]])
+        self.assertEqual(data["next"], self.listings[3].id)
+        self.assertIsNone(data["prev"])
+
+    def test_inactive_and_category_feeds(self):
+        make_listing(self.user, "closed", active=False, listing_category="toys")
+        response = self.client.get(reverse("inactive"), {"format": "json"})
+        self.assertEqual([row["title"] for row in response.json()["results"]], ["closed"])
+        response = self.client.get(reverse("category_view", args=["toys"]), {"format": "json"})
+        self.assertEqual([row["title"] for row in response.json()["results"]], ["closed"])
+
+
+class PlaceBidTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = make_listing(self.seller, "hot item")
+
+    def test_higher_bid_is_accepted(self):
+        result = place_bid(self.bidder, self.listing, 15)
+        self.assertTrue(result.accepted)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid, 15)
+        self.assertEqual(self.listing.highest_bidder, self.bidder)
+        self.assertEqual(Bid.objects.get(listing=self.listing).amount, 15)
+
+    def test_stale_bid_is_rejected(self):
+        place_bid(self.bidder, self.listing, 15)
+        result = place_bid(self.seller, self.listing, 15)
+        self.assertFalse(result.accepted)
+        self.assertEqual(result.current_bid, 15)
+        self.assertEqual(result.highest_bidder_id, self.bidder.id)
+        self.assertEqual(Bid.objects.filter(listing=self.listing).count(), 1)
+
+    def test_bid_on_closed_listing_is_rejected(self):
+        Listing.objects.filter(pk=self.listing.pk).update(active=False)
+        result = place_bid(self.bidder, self.listing, 50)
+        self.assertFalse(result.accepted)
+        self.assertFalse(result.active)
+
+    def test_bid_view_uses_stored_price(self):
+        self.client.force_login(self.bidder)
+        stale = self.client.get(reverse("bid_listing", args=[self.listing.id]))
+        self.assertEqual(stale.context["current_bid"], 10)
+        place_bid(self.seller, self.listing, 30)
+        response = self.client.post(reverse("bid_listing", args=[self.listing.id]), {"bid": 20})
+        self.assertEqual(response.context["current_bid"], 30)
+        self.assertEqual(Bid.objects.filter(user=self.bidder).count(), 0)
+
+
+class ProxyBidTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.alice, self.bob, self.carol = [
+            User.objects.create_user(name, f"{name}@example.com", "password") for name in ("alice", "bob", "carol")]
+        self.listing = make_listing(self.seller, "hot item")
+
+    def state(self):
+        self.listing.refresh_from_db()
+        bids = list(Bid.objects.filter(listing=self.listing).order_by("id").values_list("user__username", "amount"))
+        return self.listing.current_bid, self.listing.highest_bidder.username, bids
+
+    def test_highest_maximum_wins_one_increment_above_the_next(self):
+        result = place_proxy_bid(self.alice, self.listing, 50)
+        self.assertEqual((result.accepted, result.current_bid, result.bid.amount), (True, 11, 11))
+        result = place_proxy_bid(self.bob, self.listing, 30)
+        self.assertTrue(result.accepted)
+        self.assertEqual(result.highest_bidder_id, self.alice.id)
+        self.assertEqual(self.state(), (31, "alice", [("alice", 11), ("bob", 30), ("alice", 31)]))
+        self.assertEqual(self.listing.bid_count, 3)
+
+    def test_manual_bids_are_answered_by_proxies(self):
+        place_proxy_bid(self.alice, self.listing, 50)
+        result = place_bid(self.carol, self.listing, 40)
+        self.assertTrue(result.accepted)
+        self.assertEqual((result.current_bid, result.highest_bidder_id), (41, self.alice.id))
+        self.assertEqual(self.state(), (41, "alice", [("alice", 11), ("carol", 40), ("alice", 41)]))
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).bid_count, 3)
+
+        result = place_bid(self.carol, self.listing, 60)
+        self.assertEqual((result.current_bid, result.highest_bidder_id), (60, self.carol.id))
+        # A beaten maximum stays hidden
+        self.assertEqual(self.state()[2][-2:], [("alice", 41), ("carol", 60)])
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).bid_count, Bid.objects.filter(listing=self.listing).count())
+
+    def test_earlier_maximum_wins_a_tie(self):
+        place_proxy_bid(self.alice, self.listing, 50)
+        place_proxy_bid(self.bob, self.listing, 50)
+        self.assertEqual(self.state()[:2], (50, "alice"))
+
+    def test_maximums_only_go_up(self):
+        place_proxy_bid(self.alice, self.listing, 50)
+        self.assertFalse(place_proxy_bid(self.alice, self.listing, 40).accepted)
+        self.assertFalse(place_proxy_bid(self.bob, self.listing, 11).accepted)
+        self.assertFalse(ProxyBid.objects.filter(user=self.bob).exists())
+        result = place_proxy_bid(self.alice, self.listing, 70)
+        self.assertEqual((result.accepted, result.current_bid, result.bid), (True, 11, None))
+        self.assertEqual(ProxyBid.objects.get(user=self.alice).max_amount, 70)
+
+        Listing.objects.filter(pk=self.listing.pk).update(active=False)
+        self.assertFalse(place_proxy_bid(self.bob, self.listing, 100).active)
+
+    def test_settling_cost_does_not_grow_with_the_proxies(self):
+        counts = []
+        for proxies in (3, 60):
+            listing = make_listing(self.seller, f"item with {proxies} proxies")
+            users = User.objects.bulk_create([User(username=f"proxy {proxies} {i}") for i in range(proxies)])
+            ProxyBid.objects.bulk_create([
+                ProxyBid(user=user, listing=listing, max_amount=20 + i) for i, user in enumerate(users)])
+            with CaptureQueriesContext(connection) as queries:
+                result = place_proxy_bid(self.alice, listing, 500)
+            counts.append(len(queries))
+            self.assertEqual(result.current_bid, 20 + proxies)
+            # The runner up and the winner, not one bid per increment
+            self.assertEqual(Bid.objects.filter(listing=listing).count(), 2)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bid_view_tells_an_outbid_user(self):
+        place_proxy_bid(self.alice, self.listing, 50)
+        self.client.force_login(self.bob)
+        url = reverse("bid_listing", args=[self.listing.id])
+        response = self.client.post(url, {"bid": 30, "automatic": "on"})
+        self.assertContains(response, "you have been outbid")
+        self.assertContains(response, "Your maximum: 30")
+        self.assertEqual(response.context["current_bid"], 31)
+        response = self.client.post(url, {"bid": 80, "automatic": "on"})
+        self.assertRedirects(response, reverse("listing", args=[self.listing.id]))
+        self.assertEqual(self.state()[:2], (51, "bob"))
+
+
+class ConcurrentBidTests(TransactionTestCase):
+
+    def test_concurrent_bids_keep_the_highest(self):
+        seller = User.objects.create_user("seller", "seller@example.com", "password")
+        bidders = [User.objects.create(username=f"bidder{i}") for i in range(10)]
+        listing = make_listing(seller, "hot item")
+        amounts = random.sample(range(11, 10000), 2000)
+
+        def bid(amount):
+            try:
+                while True:
+                    try:
+                        return place_bid(random.choice(bidders), listing, amount)
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting
+                        continue
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(bid, amounts))
+
+        accepted = [result for result in results if result.accepted]
+        listing.refresh_from_db()
+        top_bid = Bid.objects.filter(listing=listing).order_by("-amount").first()
+        self.assertEqual(listing.current_bid, max(amounts))
+        self.assertEqual(listing.current_bid, top_bid.amount)
+        self.assertEqual(listing.highest_bidder_id, top_bid.user_id)
+        self.assertEqual(Bid.objects.filter(listing=listing).count(), len(accepted))
+
+
+class QueryPlanTests(TestCase):
+    '''
+    Runs every query issued by the browse views through EXPLAIN QUERY PLAN
+    against a million listings and fails on any scan of a whole table or index
+    '''
+    listing_count = 1000000
+    user_count = 10000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("seller", "seller@example.com", "password")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+                INSERT INTO auctions_user
+                    (password, is_superuser, username, first_name, last_name, email, is_staff, is_active, date_joined)
+                SELECT '', 0, 'user ' || n, '', '', '', 0, 1, '2021-01-01'
+                FROM seq
+                """,
+                [cls.user_count],
+            )
+            cursor.execute(
+                """
+                WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < 99)
+                INSERT INTO auctions_category (id, name, key, active_count, total_count)
+                SELECT n + 1, 'category ' || n, 'category ' || n, 0, 0
+                FROM seq
+                """
+            )
+            cursor.execute(
+                """
+                WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+                INSERT INTO auctions_listing
+                    (user_id, listing_title, listing_description, starting_bid, current_bid,
+                     listing_category, category_id, active, highest_bidder_id, bid_count, comment_count, updated_at)
+                SELECT (n %% %s) + 1, 'listing ' || n, 'description', 1, 1, 'category ' || (n %% 100),
+                    (n %% 100) + 1, n %% 10 != 0, %s, 0, 0, '2021-01-01 00:00:00'
+                FROM seq
+                """,
+                [cls.listing_count, cls.user_count, cls.user.id],
+            )
+            cursor.execute("ANALYZE")
+        cls.listing = Listing.objects.get(listing_title="listing 500")
+        Watchlist.objects.create(user=cls.user, listing=cls.listing)
+        Comment.objects.create(user=cls.user, listing=cls.listing, comment="Nice")
+        Bid.objects.create(user=cls.user, listing=cls.listing, amount=2)
+
+    @staticmethod
+    def is_rowid_walk(sql):
+        # SQLite calls reading an unfiltered table in primary key order a SCAN,
+        # though with a LIMIT it stops after that many rows
+        return " WHERE " not in sql and re.search(r'ORDER BY "\w+"\."id" (ASC|DESC) LIMIT \d+$', sql)
+
+    def assertNoFullScans(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, params)
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query["sql"].startswith("SELECT") or "auctions_" not in query["sql"]:
+                    continue
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    # A SCAN reads every row even through a covering index
+                    if detail.startswith("SCAN ") and not self.is_rowid_walk(query["sql"]):
+                        self.fail(f"{url} scans a whole table ({detail}): {query['sql']}")
+
+    def test_browse_views_use_indexes(self):
+        self.client.force_login(self.user)
+        self.assertNoFullScans(reverse("index"))
+        self.assertNoFullScans(reverse("index"), {"after": 1000})
+        self.assertNoFullScans(reverse("index"), {"before": 1000})
+        self.assertNoFullScans(reverse("inactive"))
+        self.assertNoFullScans(reverse("category_view", args=["category 5"]))
+        self.assertNoFullScans(reverse("watchlist_view"))
+        self.assertNoFullScans(reverse("listing", args=[self.listing.id]))
+        self.assertNoFullScans(reverse("bid_listing", args=[self.listing.id]))
+
+
+class ListingUrlTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("seller", "seller@example.com", "password")
+        self.listing = make_listing(self.user, "old lamp")
+
+    def test_listing_is_found_by_id(self):
+        response = self.client.get(reverse("listing", args=[self.listing.id]))
+        self.assertEqual(response.context["listing"]["listing_title"], "old lamp")
+        self.assertEqual(self.client.get(reverse("listing", args=[self.listing.id + 1])).status_code, 404)
+
+    def test_title_urls_redirect_permanently(self):
+        self.assertRedirects(self.client.get("/old lamp"), reverse("listing", args=[self.listing.id]), status_code=301)
+        self.assertRedirects(self.client.get("/bid/old lamp"), reverse("bid_listing", args=[self.listing.id]),
+            status_code=301, fetch_redirect_response=False)
+        self.assertEqual(self.client.get("/unknown").status_code, 404)
+
+    def test_named_routes_are_not_shadowed(self):
+        self.assertEqual(self.client.get(reverse("inactive")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("categories")).status_code, 200)
+
+
+class ListingSnapshotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = make_listing(self.seller, "old lamp")
+        self.url = reverse("listing", args=[self.listing.id])
+
+    def test_snapshot_is_served_from_cache(self):
+        self.client.get(self.url)
+        # Only the updated_at lookup behind the ETag
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["listing"]["user"], "seller")
+
+    def test_bid_comment_and_close_invalidate_the_snapshot(self):
+        self.client.get(self.url)
+        place_bid(self.bidder, self.listing, 20)
+        Comment.objects.create(user=self.bidder, listing=self.listing, comment="Shiny")
+        response = self.client.get(self.url)
+        snapshot = response.context["listing"]
+        self.assertEqual(snapshot["current_bid"], 20)
+        self.assertEqual(snapshot["bid_count"], 1)
+        self.assertEqual(snapshot["comments"], [{"user": "bidder", "comment": "Shiny"}])
+
+        self.client.force_login(self.seller)
+        self.client.post(reverse("close_auction", args=[self.listing.id]))
+        self.client.force_login(self.bidder)
+        response = self.client.get(self.url)
+        self.assertFalse(response.context["listing"]["active"])
+        self.assertEqual(response.context["message"], "Congratulations you are the winner of this auction")
+
+    def test_watchlist_flag_is_read_live(self):
+        self.client.force_login(self.bidder)
+        self.client.get(self.url)
+        Watchlist.objects.create(user=self.bidder, listing=self.listing)
+        self.assertTrue(self.client.get(self.url).context["on_watchlist"])
+
+
+class ViewQueryCountTests(TestCase):
+    '''
+    Pins every view to a fixed number of queries, checked before and after
+    the number of listings, bids, comments and watchlist entries grows
+    '''
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.listing = make_listing(self.user, "first", listing_category="toys")
+        Watchlist.objects.create(user=self.user, listing=self.listing)
+        self.populate(1)
+
+    def populate(self, count):
+        for i in range(count):
+            other = User.objects.create(username=f"user {User.objects.count()}")
+            listing = make_listing(other, f"listing {Listing.objects.count()}", listing_category="toys")
+            closed = make_listing(other, f"listing {Listing.objects.count()}", listing_category="toys", active=False)
+            for target in (self.listing, listing, closed):
+                Bid.objects.create(user=other, listing=target, amount=20 + i)
+                Comment.objects.create(user=other, listing=target, comment="Nice")
+            Watchlist.objects.create(user=self.user, listing=listing)
+
+    def assertQueriesStayAt(self, num, url, login=True):
+        if login:
+            self.client.force_login(self.user)
+        else:
+            self.client.logout()
+        for grow_by in (0, 10):
+            self.populate(grow_by)
+            cache.clear()
+            with self.assertNumQueries(num):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    def test_feeds(self):
+        # Session, user and the page of listings, plus the feed version for the index
+        # and the page of archived listings for the inactive feed
+        self.assertQueriesStayAt(4, reverse("index"))
+        self.assertQueriesStayAt(4, reverse("inactive"))
+        self.assertQueriesStayAt(3, reverse("category_view", args=["toys"]))
+        self.assertQueriesStayAt(3, reverse("watchlist_view"))
+        self.assertQueriesStayAt(3, reverse("categories"))
+        self.assertQueriesStayAt(2, reverse("index"), login=False)
+
+    def test_listing_pages(self):
+        # Session, user, the two snapshot queries and updated_at with the watchlist flag
+        self.assertQueriesStayAt(5, reverse("listing", args=[self.listing.id]))
+        self.assertQueriesStayAt(3, reverse("listing", args=[self.listing.id]), login=False)
+        self.assertQueriesStayAt(3, reverse("bid_listing", args=[self.listing.id]))
+        self.assertQueriesStayAt(3, reverse("comment", args=[self.listing.id]))
+
+    def test_admin_change_lists(self):
+        for model in ("listing", "bid", "watchlist", "comment"):
+            self.assertQueriesStayAt(5, reverse(f"admin:auctions_{model}_changelist"))
+
+
+class WatchlistTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.listings = [make_listing(self.seller, f"item {i}") for i in range(20)]
+        self.client.force_login(self.viewer)
+
+    def test_viewing_listings_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            for listing in self.listings:
+                self.client.get(reverse("listing", args=[listing.id]))
+        writes = [query["sql"] for query in queries if query["sql"].split()[0] in ("INSERT", "UPDATE", "DELETE")]
+        self.assertEqual(writes, [])
+        self.assertFalse(Watchlist.objects.exists())
+
+    def test_toggle_adds_and_removes_the_row(self):
+        url = reverse("watchlist", args=[self.listings[0].id])
+        self.client.get(url)
+        self.assertTrue(Watchlist.objects.filter(user=self.viewer, listing=self.listings[0]).exists())
+        self.assertTrue(self.client.get(reverse("listing", args=[self.listings[0].id])).context["on_watchlist"])
+        response = self.client.get(reverse("watchlist_view"))
+        self.assertEqual(list(response.context["watchlist"]), [self.listings[0]])
+
+        self.client.get(url)
+        self.assertFalse(Watchlist.objects.exists())
+
+
+class ListingEventTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = make_listing(self.seller, "old lamp")
+
+    def test_broker_fans_out_to_every_viewer_of_the_listing(self):
+        async def fan_out():
+            broker = InProcessBroker()
+            viewers = [broker.subscribe(self.listing.id) for _ in range(100)]
+            other = broker.subscribe(self.listing.id + 1)
+            delivered = broker.publish(self.listing.id, {"type": "bid", "current_bid": 20})
+            events = [await viewer.get(timeout=1) for viewer in viewers]
+            broker.unsubscribe(viewers[0])
+            return delivered, events, other.queue.empty(), broker.publish(self.listing.id, {})
+        delivered, events, other_empty, delivered_after = async_to_sync(fan_out)()
+        self.assertEqual(delivered, 100)
+        self.assertEqual({event["current_bid"] for event in events}, {20})
+        self.assertTrue(other_empty)
+        self.assertEqual(delivered_after, 99)
+
+    def test_stream_relays_bids_and_close(self):
+        loop = asyncio.new_event_loop()
+        stream = listing_event_stream(self.listing.id, get_listing_snapshot(self.listing.id), keepalive=1)
+        try:
+            state = loop.run_until_complete(stream.__anext__())
+            with self.captureOnCommitCallbacks(execute=True):
+                place_bid(self.bidder, self.listing, 25)
+            bid = loop.run_until_complete(stream.__anext__())
+            self.client.force_login(self.seller)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("close_auction", args=[self.listing.id]))
+            close = loop.run_until_complete(stream.__anext__())
+        finally:
+            loop.run_until_complete(stream.aclose())
+            loop.close()
+        self.assertTrue(state.startswith("event: state\n"))
+        self.assertEqual(bid, 'event: bid\ndata: {"type": "bid", "listing": %d, "current_bid": 25, "highest_bidder": "bidder"}\n\n' % self.listing.id)
+        self.assertTrue(close.startswith("event: close\n"))
+
+    def test_stream_is_only_served_under_asgi(self):
+        url = reverse("listing", args=[self.listing.id])
+        with self.settings(AUCTIONS_LIVE_UPDATES=False):
+            self.assertNotContains(self.client.get(url), "EventSource")
+            self.assertEqual(self.client.get(reverse("listing_events", args=[self.listing.id])).status_code, 204)
+        cache.clear()
+        with self.settings(AUCTIONS_LIVE_UPDATES=True):
+            self.assertContains(self.client.get(url), "EventSource")
+
+
+class AuctionClosingTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.now = timezone.now()
+
+    def test_due_auctions_are_closed_in_batches(self):
+        due = [make_listing(self.seller, f"due {i}", end_at=self.now - timedelta(minutes=i + 1)) for i in range(5)]
+        later = make_listing(self.seller, "later", end_at=self.now + timedelta(hours=1))
+        make_listing(self.seller, "open ended")
+        Listing.objects.filter(id=due[0].id).update(current_bid=50, highest_bidder=self.bidder)
+
+        self.assertEqual(close_due_auctions(now=self.now, batch_size=2), 5)
+        self.assertFalse(Listing.objects.filter(id__in=[listing.id for listing in due], active=True).exists())
+        self.assertEqual(Listing.objects.get(id=due[0].id).winner, self.bidder)
+        self.assertEqual(Listing.objects.get(id=due[1].id).winner, self.seller)
+        self.assertEqual(Listing.objects.active().count(), 2)
+        self.assertEqual(close_due_auctions(now=self.now), 0)
+
+    def test_a_listing_is_only_closed_once(self):
+        listing = make_listing(self.seller, "lamp", listing_category="lighting")
+        Category.recount()
+        place_bid(self.bidder, listing, 50)
+        Listing.objects.filter(pk=listing.pk).update(end_at=self.now - timedelta(seconds=1))
+        # The owner closing it races the auction closer
+        self.assertTrue(close_listing(listing.id))
+        self.assertEqual(close_due_auctions(now=self.now), 0)
+        self.assertFalse(close_listing(listing.id))
+        listing.refresh_from_db()
+        self.assertEqual((listing.active, listing.winner), (False, self.bidder))
+        self.assertEqual(Category.objects.values_list("active_count", "total_count").get(key="lighting"), (0, 1))
+
+    def test_only_the_owner_can_close_and_only_with_a_post(self):
+        listing = make_listing(self.seller, "lamp")
+        url = reverse("close_auction", args=[listing.id])
+        # Sent to log in
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.client.force_login(self.bidder)
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.client.force_login(self.seller)
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertTrue(Listing.objects.get(pk=listing.pk).active)
+        self.assertRedirects(self.client.post(url), reverse("index"))
+        self.assertFalse(Listing.objects.get(pk=listing.pk).active)
+
+    def test_bid_after_the_end_is_rejected(self):
+        listing = make_listing(self.seller, "ended", end_at=self.now - timedelta(seconds=1))
+        result = place_bid(self.bidder, listing, 50)
+        self.assertFalse(result.accepted)
+        self.assertFalse(result.active)
+
+    @override_settings(AUCTIONS_SOFT_CLOSE_SECONDS=300)
+    def test_late_bid_extends_the_end(self):
+        ending = make_listing(self.seller, "ending", end_at=self.now + timedelta(seconds=30))
+        far = make_listing(self.seller, "far", end_at=self.now + timedelta(hours=1))
+        place_bid(self.bidder, ending, 50)
+        place_bid(self.bidder, far, 50)
+        ending.refresh_from_db()
+        far.refresh_from_db()
+        self.assertGreater(ending.end_at, self.now + timedelta(seconds=290))
+        self.assertEqual(far.end_at, self.now + timedelta(hours=1))
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.now = timezone.now()
+        self.old = make_listing(self.seller, "old", listing_category="toys")
+        place_bid(self.bidder, self.old, 30)
+        place_proxy_bid(self.bidder, self.old, 50)
+        Comment.add(self.bidder, self.old, "Nice")
+        Watchlist.objects.create(user=self.bidder, listing=self.old)
+        self.recent = make_listing(self.seller, "recent", listing_category="toys")
+        self.open = make_listing(self.seller, "open", listing_category="toys")
+        Listing.objects.filter(id__in=[self.old.id, self.recent.id]).update(active=False, winner=self.bidder)
+        Category.recount()
+        Listing.objects.filter(id__in=[self.old.id, self.open.id]).update(updated_at=self.now - timedelta(days=100))
+        Listing.objects.filter(id=self.recent.id).update(updated_at=self.now - timedelta(days=10))
+
+    def test_old_closed_listings_move_with_their_bids_and_comments(self):
+        self.assertEqual(archive_closed_listings(older_than=timedelta(days=30), now=self.now), 1)
+        self.assertEqual(set(Listing.objects.values_list("listing_title", flat=True)), {"recent", "open"})
+        archived = ArchivedListing.objects.get()
+        self.assertEqual((archived.id, archived.listing_title, archived.current_bid, archived.winner_id, archived.comment_count),
+            (self.old.id, "old", 30, self.bidder.id, 1))
+        self.assertEqual(list(ArchivedBid.objects.values_list("listing_id", "amount")), [(self.old.id, 30)])
+        self.assertEqual(list(ArchivedComment.objects.values_list("comment", flat=True)), ["Nice"])
+        self.assertFalse(Bid.objects.exists() or Comment.objects.exists() or Watchlist.objects.exists()
+            or ProxyBid.objects.exists())
+        self.assertEqual(Category.objects.values_list("active_count", "total_count").get(), (1, 2))
+        self.assertEqual(archive_closed_listings(older_than=timedelta(days=30), now=self.now), 0)
+
+    def test_age_comes_from_the_setting_and_the_command(self):
+        with self.settings(AUCTIONS_ARCHIVE_AFTER_DAYS=5):
+            self.assertEqual(archive_closed_listings(now=self.now, batch_size=1), 2)
+        self.assertEqual(ArchivedListing.objects.count(), 2)
+        self.assertEqual(Listing.objects.get().listing_title, "open")
+
+        out = io.StringIO()
+        call_command("archive_listings", "--older-than", "1", stdout=out)
+        self.assertIn("Archived 0 listings", out.getvalue())
+
+    @override_settings(AUCTIONS_PAGE_SIZE=2)
+    def test_archived_listings_are_read_transparently(self):
+        self.client.force_login(self.bidder)
+        later = make_listing(self.seller, "later", active=False)
+        archive_closed_listings(older_than=timedelta(days=30), now=self.now)
+
+        # The closed feed pages through both tables in id order
+        response = self.client.get(reverse("inactive"), {"format": "json"})
+        self.assertEqual([row["title"] for row in response.json()["results"]], ["old", "recent"])
+        response = self.client.get(reverse("inactive"), {"after": response.json()["next"]})
+        self.assertEqual([listing.listing_title for listing in response.context["inactive_listings"]], ["later"])
+        response = self.client.get(reverse("inactive"), {"before": later.id, "format": "json"})
+        self.assertEqual([row["title"] for row in response.json()["results"]], ["old", "recent"])
+        self.assertIsNone(response.json()["prev"])
+
+        response = self.client.get(reverse("listing", args=[self.old.id]))
+        self.assertContains(response, "Final price: 30")
+        self.assertContains(response, "Nice")
+        self.assertEqual(self.client.get(reverse("listing", args=[self.old.id]), HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertContains(self.client.get(reverse("listing_bids", args=[self.old.id])), "<td>30</td>")
+        self.assertEqual(self.client.get(reverse("bid_listing", args=[self.old.id])).status_code, 404)
+
+        self.assertEqual(self.client.get(reverse("api_listing", args=[self.old.id])).json()["current_bid"], 30)
+        data = self.client.get(reverse("api_listings"), {"ids": f"{self.old.id},{self.open.id}"}).json()
+        self.assertEqual([(row["title"], row["active"]) for row in data["results"]], [("old", False), ("open", True)])
+        data = self.client.get(reverse("api_listing_comments", args=[self.old.id])).json()
+        self.assertEqual([comment["comment"] for comment in data["results"]], ["Nice"])
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.lamp = make_listing(self.seller, "Brass lamp", listing_description="An old desk light", listing_category="Lighting")
+        self.desk = make_listing(self.seller, "Oak desk", listing_description="Sturdy, fits a lamp", listing_category="Furniture")
+        self.chair = make_listing(self.seller, "Chair", listing_description="Wooden chair", listing_category="Furniture")
+
+    def search(self, query):
+        response = self.client.get(reverse("search"), {"q": query, "format": "json"})
+        return [row["title"] for row in response.json()["results"]]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search("lamp "), ["Brass lamp", "Oak desk"])
+
+    def test_prefix_and_category_queries(self):
+        self.assertEqual(self.search("bra"), ["Brass lamp"])
+        self.assertEqual(set(self.search("furniture ")), {"Oak desk", "Chair"})
+        self.assertEqual(self.search('oak" desk*'), ["Oak desk"])
+        self.assertEqual(self.search("   "), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.chair.listing_title = "Rocking chair"
+        self.chair.save()
+        self.assertEqual(self.search("rocking "), ["Rocking chair"])
+        self.lamp.delete()
+        self.assertEqual(self.search("lamp "), ["Oak desk"])
+
+    def test_search_page(self):
+        response = self.client.get(reverse("search"), {"q": "desk"})
+        self.assertEqual(response.context["results"], [self.desk, self.lamp])
+
+
+class CategoryTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.client.force_login(self.seller)
+
+    def create(self, title, category):
+        self.client.post(reverse("create"), {
+            "title": title, "description": "A description", "starting_bid": 5, "category": category, "active": True
+        })
+        return Listing.objects.get(listing_title=title)
+
+    def test_spellings_share_a_category(self):
+        first = self.create("lamp", "Home  Decor")
+        second = self.create("vase", " home decor")
+        self.assertEqual(first.category, second.category)
+        self.assertEqual(second.listing_category, "Home Decor")
+        self.assertIsNone(self.create("rock", "  ").category)
+        response = self.client.get(reverse("category_view", args=["HOME DECOR"]), {"format": "json"})
+        self.assertEqual([row["title"] for row in response.json()["results"]], ["lamp", "vase"])
+
+    def test_counts_follow_create_and_close(self):
+        lamp = self.create("lamp", "Lighting")
+        self.create("bulb", "lighting")
+        self.client.post(reverse("close_auction", args=[lamp.id]))
+        self.client.post(reverse("close_auction", args=[lamp.id]))
+        category = Category.objects.get(key="lighting")
+        self.assertEqual((category.active_count, category.total_count), (1, 2))
+
+        Listing.objects.filter(id=lamp.id).update(active=True, end_at=timezone.now() - timedelta(seconds=1))
+        Category.recount()
+        close_due_auctions()
+        category.refresh_from_db()
+        self.assertEqual((category.active_count, category.total_count), (1, 2))
+
+    def test_counts_follow_edits_and_deletes(self):
+        decor = Category.for_name("Decor")
+        lamp = make_listing(self.seller, "lamp", listing_category="Lighting")
+        make_listing(self.seller, "bulb", listing_category="Lighting", active=False)
+
+        def counts():
+            return dict(Category.objects.values_list("name", "active_count"))
+        self.assertEqual(counts(), {"Lighting": 1, "Decor": 0})
+
+        # As the admin edits it, on a freshly loaded listing
+        lamp = Listing.objects.get(pk=lamp.pk)
+        lamp.category = decor
+        lamp.save()
+        self.assertEqual(counts(), {"Lighting": 0, "Decor": 1})
+        lamp.active = False
+        lamp.save()
+        self.assertEqual(counts(), {"Lighting": 0, "Decor": 0})
+
+        Listing.objects.get(listing_title="bulb").delete()
+        self.client.logout()
+        response = self.client.get(reverse("categories"))
+        self.assertEqual([category.name for category in response.context["categories"]], ["Decor"])
+        lamp.delete()
+        self.assertEqual(Category.objects.filter(total_count__gt=0).count(), 0)
+
+    def test_categories_page_is_one_query(self):
+        self.create("lamp", "Lighting")
+        self.client.logout()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("categories"))
+        self.assertEqual([category.name for category in response.context["categories"]], ["Lighting"])
+
+
+class SeedTests(TestCase):
+
+    def test_seeded_data_is_consistent(self):
+        user_ids = seed(users=20, listings=50, batch_size=20)
+        self.assertEqual(len(user_ids), 20)
+        self.assertEqual(Listing.objects.count(), 50)
+        for listing in Listing.objects.annotate(top_bid=Max("bid_on_listing__amount")):
+            self.assertEqual(listing.current_bid, listing.top_bid or listing.starting_bid)
+        self.assertEqual(sum(Category.objects.values_list("total_count", flat=True)), 50)
+        self.assertTrue(self.client.get(reverse("search"), {"q": "lamp"}).context["results"])
+
+    def test_bench_routes_fills_every_route(self):
+        # The test database is already a scratch database
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch("auctions.management.commands.bench_routes.scratch_database", nullcontext):
+            report_path = os.path.join(directory, "report.json")
+            call_command("bench_routes", users=5, listings=10, requests=1, report=report_path, stdout=io.StringIO())
+            with open(report_path) as report:
+                routes = json.load(report)["routes"]
+        self.assertIn("users/<str:username>/bids", routes)
+        self.assertNotIn(500, {status for route in routes.values() for status in route["status"]})
+
+
+@override_settings(AUCTIONS_INSTRUMENTATION=True)
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        instrumentation_stats.reset()
+        self.user = User.objects.create_user("seller", "seller@example.com", "password")
+        self.admin = User.objects.create_user("admin", "admin@example.com", "password", is_staff=True)
+        self.listing = make_listing(self.user, "lamp")
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse("index"))
+        self.client.get(reverse("index"))
+        self.client.get(reverse("listing", args=[self.listing.id]))
+        views = instrumentation_stats.summary()
+        self.assertEqual(views["index"]["requests"], 2)
+        self.assertEqual(views["index"]["queries"], 4)
+        self.assertEqual(sum(views["index"]["buckets"].values()), 2)
+        self.assertEqual(views["listing"]["requests"], 1)
+        self.assertGreater(views["listing"]["sql_time"], 0)
+
+    def test_duplicate_queries_are_counted(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("index"))
+        # The session and user lookups differ, so an index page repeats nothing
+        self.assertEqual(instrumentation_stats.summary()["index"]["duplicate_queries"], 0)
+        self.client.post(reverse("close_auction", args=[self.listing.id]))
+        self.assertGreaterEqual(len(instrumentation_stats.slowest(10)), 2)
+
+    def test_endpoints_are_staff_only(self):
+        self.client.get(reverse("index"))
+        for name in ("instrumentation", "instrumentation_metrics", "instrumentation_slowest"):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 302)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(reverse("instrumentation")).json()["views"]["index"]["requests"], 1)
+        metrics = self.client.get(reverse("instrumentation_metrics")).content.decode()
+        self.assertIn('auctions_request_seconds_count{view="index"} 1', metrics)
+        self.assertIn('auctions_request_seconds_bucket{view="index",le="+Inf"} 1', metrics)
+        self.assertIn('auctions_request_queries_total{view="index"} 2', metrics)
+        self.assertEqual(len(self.client.get(reverse("instrumentation_slowest"), {"n": 1}).json()["requests"]), 1)
+        slowest = self.client.get(reverse("instrumentation_slowest"), {"n": 50}).json()["requests"]
+        index = next(request for request in slowest if request["view"] == "index")
+        self.assertIn("auctions_listing", index["queries"][0]["sql"])
+
+    @override_settings(AUCTIONS_INSTRUMENTATION=False)
+    def test_off_by_default(self):
+        self.client.get(reverse("index"))
+        self.assertEqual(instrumentation_stats.summary(), {})
+
+
+class SQLiteSettingsTests(TransactionTestCase):
+
+    @override_settings(AUCTIONS_SQLITE_PRAGMAS={"cache_size": -1234, "synchronous": "normal"})
+    def test_pragmas_run_on_new_connections(self):
+        new_connection = connections.create_connection("default")
+        try:
+            with new_connection.cursor() as cursor:
+                self.assertEqual(cursor.execute("PRAGMA cache_size").fetchone()[0], -1234)
+                self.assertEqual(cursor.execute("PRAGMA synchronous").fetchone()[0], 1)
+        finally:
+            new_connection.close()
+
+    def flaky(self, failures, message="database is locked"):
+        calls = []
+        @retry_on_locked
+        def write():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise OperationalError(message)
+            return len(calls)
+        return write, calls
+
+    @override_settings(AUCTIONS_SQLITE_LOCKED_RETRIES=3)
+    def test_locked_errors_are_retried(self):
+        write, calls = self.flaky(2)
+        self.assertEqual(write(), 3)
+        write, calls = self.flaky(5)
+        self.assertRaises(OperationalError, write)
+        self.assertEqual(len(calls), 4)
+        write, calls = self.flaky(1, "no such table: auctions_listing")
+        self.assertRaises(OperationalError, write)
+        self.assertEqual(len(calls), 1)
+
+    @override_settings(AUCTIONS_SQLITE_LOCKED_RETRIES=3)
+    def test_no_retry_inside_an_outer_transaction(self):
+        write, calls = self.flaky(1)
+        with transaction.atomic():
+            self.assertRaises(OperationalError, write)
+        self.assertEqual(len(calls), 1)
+
+
+# Added by commerce/settings_test.py, which manage.py runs the tests with
+HAS_REPLICA = "replica" in connections
+
+
+@skipUnless(HAS_REPLICA, "needs the replica database commerce/settings_test.py adds")
+@override_settings(AUCTIONS_READ_REPLICAS=["replica"])
+class ReplicaRoutingTests(TestCase):
+    databases = {"default", "replica"} if HAS_REPLICA else {"default"}
+
+    def setUp(self):
+        self.user = User.objects.create_user("seller", "seller@example.com", "password")
+        self.listing = make_listing(self.user, "on the primary")
+        # The replica is a separate database here, so what was read from where shows
+        replica_user = User.objects.using("replica").create(username="seller")
+        Listing.objects.using("replica").create(user=replica_user, listing_title="on the replica",
+            listing_description="", starting_bid=1, current_bid=1, active=True, highest_bidder=replica_user)
+
+    def titles(self, name="index"):
+        return [row["title"] for row in self.client.get(reverse(name), {"format": "json"}).json()["results"]]
+
+    def test_feeds_read_from_the_replica(self):
+        self.assertEqual(self.titles(), ["on the replica"])
+
+    def test_other_views_use_the_primary(self):
+        response = self.client.get(reverse("listing", args=[self.listing.id]))
+        self.assertEqual(response.context["listing"]["listing_title"], "on the primary")
+        # Outside the feeds, reads made by the code itself stay on the primary too
+        self.assertEqual(Listing.objects.get().listing_title, "on the primary")
+
+    def test_writers_read_their_own_writes(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("bid_listing", args=[self.listing.id]), {"bid": 50})
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+        self.assertEqual(Bid.objects.using("default").count(), 1)
+        self.assertEqual(Bid.objects.using("replica").count(), 0)
+        self.assertEqual(self.titles(), ["on the primary"])
+
+        self.client.cookies.pop(PRIMARY_COOKIE)
+        self.assertEqual(self.titles(), ["on the replica"])
+
+    def test_one_replica_serves_the_whole_request(self):
+        router = ReplicaRouter()
+
+        @read_from_replica
+        def view(request):
+            return {router.db_for_read(Listing) for _ in range(50)}
+
+        request = RequestFactory().get("/")
+        with self.settings(AUCTIONS_READ_REPLICAS=[f"replica {i}" for i in range(10)]):
+            picked = [view(request) for _ in range(20)]
+        self.assertTrue(all(len(aliases) == 1 for aliases in picked))
+        self.assertGreater(len(set.union(*picked)), 1)
+        self.assertEqual(router.db_for_read(Listing), "default")
+
+
+class ActivityCounterTests(TransactionTestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.users = [User.objects.create(username=f"user{i}") for i in range(8)]
+        self.listings = [make_listing(self.seller, f"item {i}") for i in range(3)]
+
+    def test_counters_stay_consistent_under_concurrent_writes(self):
+        amounts = random.sample(range(11, 100000), 600)
+
+        def write(amount):
+            listing = random.choice(self.listings)
+            try:
+                while True:
+                    try:
+                        if amount % 2:
+                            return place_bid(random.choice(self.users), listing, amount)
+                        return Comment.add(random.choice(self.users), listing, f"comment {amount}")
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting
+                        continue
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(write, amounts))
+
+        for listing in Listing.objects.all():
+            self.assertEqual(listing.bid_count, Bid.objects.filter(listing=listing).count())
+            self.assertEqual(listing.comment_count, Comment.objects.filter(listing=listing).count())
+        self.assertEqual(Comment.objects.count(), len([amount for amount in amounts if amount % 2 == 0]))
+
+    def test_views_count_bids_and_comments(self):
+        self.client.force_login(self.users[0])
+        listing = self.listings[0]
+        self.client.post(reverse("bid_listing", args=[listing.id]), {"bid": 50})
+        self.client.post(reverse("bid_listing", args=[listing.id]), {"bid": 40})
+        self.client.post(reverse("comment", args=[listing.id]), {"your_comment": "Nice"})
+        listing.refresh_from_db()
+        self.assertEqual((listing.bid_count, listing.comment_count), (1, 1))
+        page = self.client.get(reverse("index"), {"format": "json"}).json()["results"]
+        row = next(row for row in page if row["id"] == listing.id)
+        self.assertEqual((row["bid_count"], row["comment_count"]), (1, 1))
+
+    def test_recount_repairs_the_counters(self):
+        listing = self.listings[0]
+        Bid.objects.create(user=self.users[0], listing=listing, amount=20)
+        Comment.objects.create(user=self.users[0], listing=listing, comment="Added behind the counters' back")
+        Listing.objects.filter(pk=self.listings[1].pk).update(bid_count=7, comment_count=3)
+        call_command("recount_listings", batch_size=2, stdout=io.StringIO())
+        counts = dict((row[0], row[1:]) for row in Listing.objects.values_list("id", "bid_count", "comment_count"))
+        self.assertEqual(counts, {self.listings[0].id: (1, 1), self.listings[1].id: (0, 0), self.listings[2].id: (0, 0)})
+
+
+@override_settings(AUCTIONS_PAGE_SIZE=2)
+class BidHistoryTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.lamp = make_listing(self.seller, "lamp")
+        self.vase = make_listing(self.seller, "vase")
+        for amount in (11, 12, 13):
+            place_bid(self.bidder, self.lamp, amount)
+        place_bid(self.seller, self.vase, 20)
+
+    def test_listing_bids_are_paged(self):
+        url = reverse("listing_bids", args=[self.lamp.id])
+        first = self.client.get(url, {"format": "json"}).json()
+        self.assertEqual([bid["amount"] for bid in first["results"]], [11, 12])
+        second = self.client.get(url, {"format": "json", "after": first["next"]}).json()
+        self.assertEqual([bid["amount"] for bid in second["results"]], [13])
+        self.assertEqual(second["results"][0]["user"], "bidder")
+        self.assertContains(self.client.get(url), "Bids on lamp")
+
+    def test_user_bids(self):
+        results = self.client.get(reverse("user_bids", args=["seller"]), {"format": "json"}).json()["results"]
+        self.assertEqual([(bid["listing_title"], bid["amount"]) for bid in results], [("vase", 20)])
+        # The user, then the page of their bids and of their archived ones
+        with self.assertNumQueries(3):
+            self.client.get(reverse("user_bids", args=["bidder"]))
+        self.assertEqual(self.client.get(reverse("user_bids", args=["nobody"])).status_code, 404)
+
+    def export(self, table, export_format):
+        response = self.client.get(reverse("export", args=[table]), {"format": export_format})
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_exports_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse("export", args=["bids"])).status_code, 302)
+        self.client.force_login(User.objects.create_user("admin", "admin@example.com", "password", is_staff=True))
+        self.assertEqual(self.client.get(reverse("export", args=["users"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("export", args=["bids"]), {"format": "xml"}).status_code, 404)
+
+    def test_csv_and_ndjson_exports(self):
+        self.client.force_login(User.objects.create_user("admin", "admin@example.com", "password", is_staff=True))
+        Comment.add(self.bidder, self.lamp, 'Says "hi", twice')
+        rows = list(csv.DictReader(io.StringIO(self.export("bids", "csv"))))
+        self.assertEqual([(row["user__username"], row["amount"]) for row in rows],
+            [("bidder", "11"), ("bidder", "12"), ("bidder", "13"), ("seller", "20")])
+        comments = list(csv.reader(io.StringIO(self.export("comments", "csv"))))
+        self.assertEqual(comments[1][-1], 'Says "hi", twice')
+        listings = [json.loads(line) for line in self.export("listings", "ndjson").splitlines()]
+        self.assertEqual([(row["listing_title"], row["bid_count"]) for row in listings], [("lamp", 3), ("vase", 1)])
+
+    def test_archived_rows_stay_in_the_history_and_exports(self):
+        self.client.force_login(User.objects.create_user("admin", "admin@example.com", "password", is_staff=True))
+        Comment.add(self.bidder, self.lamp, "Nice")
+        Listing.objects.filter(pk=self.lamp.pk).update(active=False, updated_at=timezone.now() - timedelta(days=100))
+        self.assertEqual(archive_closed_listings(older_than=timedelta(days=30)), 1)
+        place_bid(self.bidder, self.vase, 30)
+
+        url = reverse("user_bids", args=["bidder"])
+        first = self.client.get(url, {"format": "json"}).json()
+        second = self.client.get(url, {"format": "json", "after": first["next"]}).json()
+        self.assertEqual([(bid["listing_title"], bid["amount"]) for bid in first["results"] + second["results"]],
+            [("lamp", 11), ("lamp", 12), ("lamp", 13), ("vase", 30)])
+
+        rows = list(csv.DictReader(io.StringIO(self.export("bids", "csv"))))
+        self.assertEqual([row["amount"] for row in rows], ["11", "12", "13", "20", "30"])
+        self.assertEqual([row["id"] for row in rows], sorted((row["id"] for row in rows), key=int))
+        listings = [json.loads(line) for line in self.export("listings", "ndjson").splitlines()]
+        self.assertEqual([(row["listing_title"], row["active"], row["bid_count"]) for row in listings],
+            [("lamp", False, 3), ("vase", True, 2)])
+        comments = list(csv.reader(io.StringIO(self.export("comments", "csv"))))
+        self.assertEqual([row[-1] for row in comments[1:]], ["Nice"])
+
+
+class ListingCardCacheTests(TestCase):
+
+    def setUp(self):
+        caches["template_fragments"].clear()
+        self.user = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = make_listing(self.user, "lamp")
+
+    def test_cards_are_cached_until_a_bid_or_close(self):
+        self.assertContains(self.client.get(reverse("index")), "Lamp")
+        # Changed behind the cache's back, so the cached card is still shown
+        Listing.objects.filter(pk=self.listing.pk).update(listing_title="brass lamp")
+        self.assertNotContains(self.client.get(reverse("index")), "Brass lamp")
+
+        place_bid(self.bidder, self.listing, 50)
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "Brass lamp")
+        self.assertContains(response, "Current price: 50")
+
+        self.assertContains(self.client.get(reverse("inactive")), "No inactive listings")
+        self.client.force_login(self.user)
+        self.client.post(reverse("close_auction", args=[self.listing.id]))
+        self.assertContains(self.client.get(reverse("inactive")), "Final price: 50")
+        self.assertContains(self.client.get(reverse("index")), "No active listings")
+
+    def test_production_settings_use_the_cached_loader(self):
+        from commerce import settings as base, settings_production as production
+        self.assertEqual(production.TEMPLATES[0]["OPTIONS"]["loaders"][0][0], "django.template.loaders.cached.Loader")
+        self.assertNotIn("loaders", base.TEMPLATES[0]["OPTIONS"])
+        self.assertEqual(base.DATABASES["default"].get("CONN_MAX_AGE", 0), 0)
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = make_listing(self.user, "lamp")
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_unchanged_pages_are_not_rendered_again(self):
+        for url in (reverse("index"), reverse("listing", args=[self.listing.id])):
+            response = self.client.get(url)
+            self.assertTrue(response.has_header("Last-Modified"))
+            with self.assertNumQueries(1), self.assertTemplateNotUsed("auctions/layout.html"):
+                self.assertEqual(self.revalidate(url, response).status_code, 304)
+            since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(since.status_code, 304)
+
+    def test_bids_comments_and_closing_change_the_version(self):
+        url = reverse("listing", args=[self.listing.id])
+        index = reverse("index")
+        for change in (
+            lambda: place_bid(self.bidder, self.listing, 50),
+            lambda: Comment.add(self.bidder, self.listing, "Nice"),
+            lambda: close_listing(self.listing.id),
+        ):
+            # Versions are timestamps, keep the change from landing in the same microsecond
+            Listing.objects.filter(pk=self.listing.pk).update(updated_at=timezone.now() - timedelta(seconds=1))
+            page, feed = self.client.get(url), self.client.get(index)
+            change()
+            self.assertEqual(self.revalidate(url, page).status_code, 200)
+            self.assertEqual(self.revalidate(index, feed).status_code, 200)
+
+    def test_deleting_a_listing_changes_the_feed_version(self):
+        make_listing(self.user, "vase")
+        Listing.objects.filter(pk=self.listing.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        index = reverse("index")
+        feed = self.client.get(index)
+        # Neither the newest listing nor the last changed one
+        self.listing.delete()
+        self.assertEqual(self.revalidate(index, feed).status_code, 200)
+
+    def test_deleting_a_closed_listing_keeps_the_feed_version(self):
+        closed = make_listing(self.user, "vase")
+        Listing.objects.filter(pk=closed.pk).update(active=False)
+        index = reverse("index")
+        feed = self.client.get(index)
+        closed.refresh_from_db()
+        closed.delete()
+        self.assertEqual(self.revalidate(index, feed).status_code, 304)
+
+    def test_pages_are_not_shared_between_viewers(self):
+        url = reverse("listing", args=[self.listing.id])
+        anonymous = self.client.get(url)
+        self.client.force_login(self.bidder)
+        response = self.revalidate(url, anonymous)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Cookie", response["Vary"])
+
+        watched = self.client.get(url)
+        self.client.get(reverse("watchlist", args=[self.listing.id]))
+        self.assertEqual(self.revalidate(url, watched).status_code, 200)
+
+
+def make_image(width, height, color="red"):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(output, "PNG")
+    return output.getvalue()
+
+
+class FakeFetcher:
+    '''Stands in for the network: serves responses, or raises FetchError for urls it has none for'''
+    responses = {}
+    calls = []
+
+    def fetch(self, url):
+        FakeFetcher.calls.append(url)
+        if url not in self.responses:
+            raise FetchError("unreachable")
+        return self.responses[url]
+
+
+class ThumbnailTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(AUCTIONS_IMAGE_FETCHER="auctions.tests.FakeFetcher", AUCTIONS_IMAGE_CACHE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        FakeFetcher.calls = []
+        self.user = User.objects.create_user("seller", "seller@example.com", "password")
+
+    @skipUnless(Image, "Resizing needs Pillow")
+    def test_images_are_resized_and_cached(self):
+        FakeFetcher.responses = {"http://example.com/lamp.png": (make_image(1600, 1200), "image/png")}
+        listing = make_listing(self.user, "lamp", listing_image_url="http://example.com/lamp.png")
+        self.assertContains(self.client.get(reverse("index")), reverse("thumbnail", args=[listing.id, "card"]))
+
+        response = self.client.get(reverse("thumbnail", args=[listing.id, "card"]))
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+        self.assertEqual(Image.open(io.BytesIO(response.content)).size, (400, 300))
+        small = self.client.get(reverse("thumbnail", args=[listing.id, "small"]))
+        self.assertEqual(Image.open(io.BytesIO(small.content)).size, (200, 150))
+
+        self.client.get(reverse("thumbnail", args=[listing.id, "card"]))
+        self.assertEqual(len(FakeFetcher.calls), 2)
+
+    def test_unreachable_images_fall_back_to_a_placeholder(self):
+        listing = make_listing(self.user, "lamp", listing_image_url="http://down.example.com/lamp.png")
+        for _ in range(3):
+            response = self.client.get(reverse("thumbnail", args=[listing.id, "card"]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "image/svg+xml")
+            self.assertIn("max-age=60", response["Cache-Control"])
+        # Not tried again for a while
+        self.assertEqual(len(FakeFetcher.calls), 1)
+        FakeFetcher.responses = {"http://example.com/page": (b"<html></html>", "text/html")}
+        listing = make_listing(self.user, "page", listing_image_url="http://example.com/page")
+        self.assertEqual(self.client.get(reverse("thumbnail", args=[listing.id, "card"]))["Content-Type"], "image/svg+xml")
+        self.assertEqual(self.client.get(reverse("thumbnail", args=[listing.id, "huge"])).status_code, 404)
+
+    def test_thumbnail_url_only_changes_with_the_image(self):
+        listing = make_listing(self.user, "lamp", listing_image_url="http://example.com/lamp.png")
+        bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        def thumbnail_src():
+            content = self.client.get(reverse("listing", args=[listing.id])).content.decode()
+            return re.search(r'src="([^"]*/thumbnail/card[^"]*)"', content).group(1)
+        before = thumbnail_src()
+        place_bid(bidder, listing, 50)
+        self.assertEqual(thumbnail_src(), before)
+        Listing.objects.filter(pk=listing.pk).update(listing_image_url="http://example.com/new-lamp.png")
+        cache.clear()
+        self.assertNotEqual(thumbnail_src(), before)
+
+    def test_fetcher_refuses_internal_addresses(self):
+        fetcher = URLFetcher(timeout=1)
+        for url in ("http://127.0.0.1:8000/admin", "http://localhost/", "http://169.254.169.254/latest/meta-data",
+                "http://10.0.0.1/", "http://[::1]/", "http://[::ffff:192.168.0.1]/", "http://0.0.0.0/"):
+            with self.assertRaisesRegex(FetchError, "not a public address"):
+                fetcher.fetch(url)
+        with self.assertRaisesRegex(FetchError, "non http"):
+            _HTTPRedirectHandler().redirect_request(None, None, 302, "Found", {}, "file:///etc/passwd")
+
+    def test_cache_is_content_addressed_and_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as directory:
+            image_cache = ImageCache(directory, max_bytes=250)
+            image_cache.put("http://a", "card", b"a" * 100, "image/png")
+            image_cache.put("http://copy-of-a", "card", b"a" * 100, "image/png")
+            image_cache.put("http://b", "card", b"b" * 100, "image/png")
+            blobs = [name for _, _, names in os.walk(os.path.join(directory, "blobs")) for name in names]
+            self.assertEqual(len(blobs), 2)
+
+            # Make a the older one, then read it so b becomes the least recently used
+            for url, age in (("http://a", 20), ("http://b", 10)):
+                path = image_cache._blob_path(hashlib.sha256(url[-1].encode() * 100).hexdigest())
+                os.utime(path, (time.time() - age, time.time() - age))
+            self.assertEqual(image_cache.get("http://copy-of-a", "card"), (b"a" * 100, "image/png"))
+            image_cache.put("http://c", "card", b"c" * 100, "image/png")
+            self.assertIsNotNone(image_cache.get("http://a", "card"))
+            self.assertIsNone(image_cache.get("http://b", "card"))
+            self.assertIsNotNone(image_cache.get("http://c", "card"))
+            # b's ref went with it
+            self.assertFalse(os.path.exists(image_cache._ref_path(image_cache._ref_key("http://b", "card"))))
+
+    def test_cache_only_walks_the_disk_to_evict(self):
+        with tempfile.TemporaryDirectory() as directory:
+            image_cache = ImageCache(directory, max_bytes=1000)
+            walks = []
+            blobs = image_cache._blobs
+            image_cache._blobs = lambda: walks.append(1) or blobs()
+            for i in range(9):
+                image_cache.put(f"http://{i}", "card", bytes([i]) * 100, "image/png")
+            # Once to start the running total
+            self.assertEqual(len(walks), 1)
+            image_cache.put("http://9", "card", b"9" * 100, "image/png")
+            image_cache.put("http://10", "card", b"x" * 100, "image/png")
+            self.assertEqual(len(walks), 2)
+            refs = [name for _, _, names in os.walk(os.path.join(directory, "refs")) for name in names]
+            self.assertEqual(len(refs), 9)
+
+
+@override_settings(AUCTIONS_PAGE_SIZE=2)
+class AsyncBrowseViewTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(browse_views(async_views=True))
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.listings = [make_listing(self.seller, f"item {i}", listing_category="toys") for i in range(3)]
+        self.closed = make_listing(self.seller, "closed", active=False, listing_category="toys")
+        Watchlist.objects.create(user=self.viewer, listing=self.listings[2])
+        Category.recount()
+
+    def test_browse_urls_are_served_by_async_views(self):
+        for url in (reverse("index"), reverse("inactive"), reverse("categories"), reverse("watchlist_view"),
+                reverse("category_view", args=["toys"]), reverse("listing", args=[self.closed.id])):
+            self.assertTrue(iscoroutinefunction(resolve(url).func), url)
+
+    async def test_feeds_page_like_the_sync_views(self):
+        response = await self.async_client.get(reverse("index"))
+        self.assertEqual(list(response.context["active_listings"]), self.listings[:2])
+        response = await self.async_client.get(reverse("index"), {"after": response.context["page"].next_cursor, "format": "json"})
+        self.assertEqual([row["title"] for row in response.json()["results"]], ["item 2"])
+        self.assertEqual(response.json()["prev"], self.listings[2].id)
+
+        response = await self.async_client.get(reverse("inactive"))
+        self.assertEqual(list(response.context["inactive_listings"]), [self.closed])
+        response = await self.async_client.get(reverse("category_view", args=["Toys"]), {"page_size": 10})
+        self.assertEqual(len(response.context["category_listings"]), 4)
+        response = await self.async_client.get(reverse("categories"))
+        self.assertContains(response, "3 active of 4")
+
+    async def test_archived_listings_are_read_like_the_sync_views(self):
+        await Listing.objects.filter(id=self.closed.id).aupdate(updated_at=timezone.now() - timedelta(days=100))
+        await sync_to_async(archive_closed_listings)(older_than=timedelta(days=30))
+        response = await self.async_client.get(reverse("inactive"))
+        self.assertEqual([listing.id for listing in response.context["inactive_listings"]], [self.closed.id])
+        response = await self.async_client.get(reverse("listing", args=[self.closed.id]))
+        self.assertContains(response, "Final price: 10")
+
+    async def test_signed_in_pages(self):
+        response = await self.async_client.get(reverse("watchlist_view"))
+        self.assertEqual(response.status_code, 302)
+
+        await self.async_client.aforce_login(self.viewer)
+        response = await self.async_client.get(reverse("watchlist_view"))
+        self.assertEqual(list(response.context["watchlist"]), [self.listings[2]])
+        self.assertContains(response, "Signed in as <strong>viewer</strong>")
+
+        response = await self.async_client.get(reverse("listing", args=[self.listings[2].id]))
+        self.assertTrue(response.context["on_watchlist"])
+        self.assertEqual(response.context["listing"]["listing_title"], "item 2")
+        response = await self.async_client.get(reverse("listing", args=[self.listings[0].id]))
+        self.assertFalse(response.context["on_watchlist"])
+        response = await self.async_client.get(reverse("listing", args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_unchanged_pages_are_not_rendered_again(self):
+        for url in (reverse("index"), reverse("listing", args=[self.listings[0].id])):
+            response = await self.async_client.get(url)
+            self.assertTrue(response.has_header("Last-Modified"))
+            self.assertIn("Cookie", response["Vary"])
+            again = await self.async_client.get(url, headers={"if-none-match": response["ETag"]})
+            self.assertEqual(again.status_code, 304)
+            since = await self.async_client.get(url, headers={"if-modified-since": response["Last-Modified"]})
+            self.assertEqual(since.status_code, 304)
+
+
+@override_settings(SESSION_ENGINE=settings_production.SESSION_ENGINE, MIDDLEWARE=settings_production.MIDDLEWARE)
+class CachedUserTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.listing = make_listing(self.user, "lamp")
+        self.client.login(username="viewer", password="password")
+
+    def test_signed_in_pages_skip_the_session_and_user_queries(self):
+        url = reverse("listing", args=[self.listing.id])
+        self.client.get(url)
+        # The updated_at and watchlist flag query only, the snapshot is cached too
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.context["user"], self.user)
+        with self.assertNumQueries(1):
+            self.client.get(reverse("watchlist_view"))
+
+    def test_saving_the_user_drops_the_cached_copy(self):
+        self.client.get(reverse("index"))
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        self.user.username = "renamed"
+        self.user.save()
+        self.assertContains(self.client.get(reverse("categories")), "Signed in as <strong>renamed</strong>")
+
+    def test_password_change_and_logout_sign_the_session_out(self):
+        self.client.get(reverse("index"))
+        self.user.set_password("changed")
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("watchlist_view")).status_code, 302)
+
+        self.client.login(username="viewer", password="changed")
+        self.client.get(reverse("index"))
+        self.client.get(reverse("logout"))
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        self.assertEqual(self.client.get(reverse("watchlist_view")).status_code, 302)
+
+    def test_async_views_read_the_cached_user(self):
+        with browse_views(async_views=True):
+            self.client.get(reverse("watchlist_view"))
+            self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse("watchlist_view"))
+        self.assertContains(response, "Signed in as <strong>viewer</strong>")
+
+
+class ApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.viewer = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.listings = [make_listing(self.seller, f"item {i}") for i in range(40)]
+        self.ids = [listing.id for listing in self.listings]
+
+    def get_json(self, name, *args, **params):
+        response = self.client.get(reverse(name, args=args), params)
+        self.assertEqual(response["Content-Type"], "application/json")
+        return response.status_code, response.json()
+
+    def post_json(self, name, data, *args):
+        response = self.client.post(reverse(name, args=args), json.dumps(data), content_type="application/json")
+        return response.status_code, response.json()
+
+    def test_batches_run_a_fixed_number_of_queries(self):
+        for count in (3, 30):
+            with self.assertNumQueries(1):
+                self.get_json("api_listings", ids=",".join(map(str, self.ids[:count])))
+            ids = ",".join(str(listing_id) for listing_id in [*self.ids[:count][::-1], 9999])
+            # An id missing from Listing is looked for in the archive
+            with self.assertNumQueries(2):
+                status, data = self.get_json("api_listings", ids=ids)
+            self.assertEqual([row["id"] for row in data["results"]], self.ids[:count][::-1])
+            self.assertEqual(data["missing"], [9999])
+            self.assertEqual(data["results"][0]["seller"], "seller")
+            with self.assertNumQueries(1):
+                status, data = self.get_json("api_prices", ids=ids)
+            self.assertEqual(len(data), count)
+
+        place_bid(self.viewer, self.listings[0], 25)
+        status, data = self.get_json("api_prices", ids=f"{self.ids[0]}")
+        self.assertEqual((data[str(self.ids[0])]["current_bid"], data[str(self.ids[0])]["highest_bidder"]), (25, "viewer"))
+
+    def test_bad_batches_are_rejected(self):
+        self.assertEqual(self.get_json("api_listings", ids="1,x")[0], 400)
+        with self.settings(AUCTIONS_API_MAX_BATCH=5):
+            status, data = self.get_json("api_prices", ids=",".join(map(str, self.ids[:6])))
+        self.assertEqual(status, 400)
+        self.assertIn("At most 5", data["error"])
+
+    def test_feeds_and_listing(self):
+        status, data = self.get_json("api_listings", page_size=5)
+        self.assertEqual([row["id"] for row in data["results"]], self.ids[:5])
+        self.assertEqual(data["next"], self.ids[4])
+        Comment.add(self.viewer, self.listings[0], "Nice")
+        place_bid(self.viewer, self.listings[0], 25)
+        status, data = self.get_json("api_listing", self.ids[0])
+        self.assertEqual((data["title"], data["current_bid"], data["comments"]), ("item 0", 25, [{"user": "viewer", "comment": "Nice"}]))
+        status, data = self.get_json("api_listing_bids", self.ids[0])
+        self.assertEqual([(bid["user"], bid["amount"]) for bid in data["results"]], [("viewer", 25)])
+        status, data = self.get_json("api_listing_comments", self.ids[0])
+        self.assertEqual(data["results"], [{"id": data["results"][0]["id"], "user": "viewer", "comment": "Nice"}])
+        self.assertEqual(self.get_json("api_listing", 9999), (404, {"error": "Not found"}))
+        self.assertEqual(self.get_json("api_listing_comments", 9999)[0], 404)
+
+    def test_watchlist_batch(self):
+        self.assertEqual(self.get_json("api_watchlist")[0], 401)
+        self.client.force_login(self.viewer)
+        Watchlist.objects.create(user=self.viewer, listing=self.listings[0])
+        Watchlist.objects.create(user=self.viewer, listing=self.listings[1])
+        changes = {"add": self.ids[2:20], "remove": [self.ids[1]], "toggle": [self.ids[0], self.ids[30], 9999]}
+        with CaptureQueriesContext(connection) as queries:
+            status, data = self.post_json("api_watchlist", changes)
+        statements = [query["sql"].split()[0] for query in queries if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))]
+        # Session, user, then the listings, the current entries, one DELETE and one INSERT
+        self.assertEqual(statements, ["SELECT", "SELECT", "SELECT", "SELECT", "DELETE", "INSERT"])
+        self.assertEqual(data["added"], sorted(self.ids[2:20] + [self.ids[30]]))
+        self.assertEqual(data["removed"], self.ids[:2])
+        self.assertEqual(data["missing"], [9999])
+        self.assertEqual(self.get_json("api_watchlist")[1]["listings"], sorted(self.ids[2:20] + [self.ids[30]]))
+        self.assertEqual(self.post_json("api_watchlist", {"add": "1"})[0], 400)
+
+    def test_bidding(self):
+        self.assertEqual(self.post_json("api_listing_bids", {"amount": 20}, self.ids[0])[0], 401)
+        self.client.force_login(self.viewer)
+        status, data = self.post_json("api_listing_bids", {"amount": 20}, self.ids[0])
+        self.assertEqual((data["accepted"], data["current_bid"]), (True, 20))
+        status, data = self.post_json("api_listing_bids", {"amount": 15}, self.ids[0])
+        self.assertEqual((data["accepted"], data["current_bid"]), (False, 20))
+        status, data = self.post_json("api_listing_bids", {"amount": 50, "automatic": True}, self.ids[1])
+        self.assertEqual((data["accepted"], data["current_bid"], data["highest_bidder_id"]), (True, 11, self.viewer.id))
+        self.assertEqual(self.post_json("api_listing_bids", {"amount": "lots"}, self.ids[0])[0], 400)
@@ -1,24 +1,49 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, async_views, views
+
+# The read only browse views, native async ones when served through commerce/asgi.py
+browse = async_views if settings.AUCTIONS_ASYNC_VIEWS else views
 
 urlpatterns = [
-    path("", views.index, name="index"),
-    path("inactive", views.inactive, name="inactive"),
-    path("categories", views.categories, name="categories"),
-    path("watchlist_view", views.watchlist_view, name="watchlist_view"),
-    path("category_view/<str:category>", views.category_view, name="category_view"),
-    path("category_view", views.category_view, name="category_view"),
+    path("", browse.index, name="index"),
+    path("inactive", browse.inactive, name="inactive"),
+    path("categories", browse.categories, name="categories"),
+    path("watchlist_view", browse.watchlist_view, name="watchlist_view"),
+    path("category_view/<str:category>", browse.category_view, name="category_view"),
+    path("category_view", browse.category_view, name="category_view"),
+    path("search", views.search, name="search"),
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
     path("create", views.create, name="create"),
-    path("<str:listing>", views.listing, name="listing"),
-    path("bid/<str:listing>", views.bid, name="bid_listing"),
-    path("bid", views.bid, name="bid"),
-    path("close/<str:listing>", views.close_auction, name="close_auction"),
-    path("watchlist/<str:listing>", views.watchlist, name="watchlist"),
-    path("comment/<str:listing>", views.comment, name="comment")
-    
+    path("listing/<int:listing_id>", browse.listing, name="listing"),
+    path("listing/<int:listing_id>/events", views.listing_events, name="listing_events"),
+    path("listing/<int:listing_id>/bids", views.listing_bids, name="listing_bids"),
+    path("listing/<int:listing_id>/thumbnail/<str:size>", views.thumbnail, name="thumbnail"),
+    path("users/<str:username>/bids", views.user_bids, name="user_bids"),
+    path("bid/<int:listing_id>", views.bid, name="bid_listing"),
+    path("close/<int:listing_id>", views.close_auction, name="close_auction"),
+    path("watchlist/<int:listing_id>", views.watchlist, name="watchlist"),
+    path("comment/<int:listing_id>", views.comment, name="comment"),
+    path("instrumentation", views.instrumentation, name="instrumentation"),
+    path("instrumentation/metrics", views.instrumentation_metrics, name="instrumentation_metrics"),
+    path("instrumentation/slowest", views.instrumentation_slowest, name="instrumentation_slowest"),
+    path("export/<str:table>", views.export, name="export"),
+
+    # JSON API, see auctions/api.py
+    path("api/v1/listings", api.listings, name="api_listings"),
+    path("api/v1/listings/<int:listing_id>", api.listing, name="api_listing"),
+    path("api/v1/listings/<int:listing_id>/bids", api.listing_bids, name="api_listing_bids"),
+    path("api/v1/listings/<int:listing_id>/comments", api.listing_comments, name="api_listing_comments"),
+    path("api/v1/prices", api.prices, name="api_prices"),
+    path("api/v1/watchlist", api.watchlist, name="api_watchlist"),
 
+    # Old title based urls, permanently redirected to the id based ones
+    path("bid/<str:listing>", views.legacy_listing_redirect, {"view_name": "bid_listing"}),
+    path("close/<str:listing>", views.legacy_listing_redirect, {"view_name": "close_auction"}),
+    path("watchlist/<str:listing>", views.legacy_listing_redirect, {"view_name": "watchlist"}),
+    path("comment/<str:listing>", views.legacy_listing_redirect, {"view_name": "comment"}),
+    path("<str:listing>", views.legacy_listing_redirect, {"view_name": "listing"}),
 ]
@@ -0,0 +1,87 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+
+def user_cache_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def _verified(user, backend_path, session_hash):
+    '''Whether a cached user may stand in for the one Django would load for this session'''
+    return (
+        backend_path in settings.AUTHENTICATION_BACKENDS
+        and session_hash is not None
+        and constant_time_compare(session_hash, user.get_session_auth_hash())
+    )
+
+
+def _timeout():
+    return getattr(settings, "AUCTIONS_USER_CACHE_TIMEOUT", 300)
+
+
+def get_cached_user(request):
+    '''
+    auth.get_user(), with the user read from the cache instead of the
+    database when the session's password hash still matches it. Anything
+    else (no cached user, a changed password, a rotated secret) goes
+    through auth.get_user(), which also puts it right in the session
+    '''
+    if not hasattr(request, "_cached_user"):
+        user_id = request.session.get(SESSION_KEY)
+        user = cache.get(user_cache_key(user_id)) if user_id is not None else None
+        if user is not None and _verified(user, request.session.get(BACKEND_SESSION_KEY),
+                request.session.get(HASH_SESSION_KEY)):
+            request._cached_user = user
+        else:
+            user = auth.get_user(request)
+            if user.is_authenticated:
+                cache.set(user_cache_key(user_id), user, _timeout())
+            request._cached_user = user
+    return request._cached_user
+
+
+async def aget_cached_user(request):
+    '''get_cached_user for async views'''
+    if not hasattr(request, "_acached_user"):
+        user_id = await request.session.aget(SESSION_KEY)
+        user = await cache.aget(user_cache_key(user_id)) if user_id is not None else None
+        if user is not None and _verified(user, await request.session.aget(BACKEND_SESSION_KEY),
+                await request.session.aget(HASH_SESSION_KEY)):
+            request._acached_user = user
+        else:
+            user = await auth.aget_user(request)
+            if user.is_authenticated:
+                await cache.aset(user_cache_key(user_id), user, _timeout())
+            request._acached_user = user
+    return request._acached_user
+
+
+def forget_user(user_id):
+    '''
+    Drops the cached user now and again once the current transaction
+    commits, so a request that read the old row meanwhile cannot put it back
+    '''
+    key = user_cache_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedUserMiddleware(AuthenticationMiddleware):
+    '''
+    AuthenticationMiddleware that reads the signed in user from the cache,
+    saving the user query on every authenticated request. Saving or
+    deleting a user, and logging out, drop the cached copy (see signals.py)
+    '''
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
+        request.auser = partial(aget_cached_user, request)
@@ -1,12 +1,32 @@
+import asyncio
+
 from django import forms
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.db import IntegrityError, models
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render, redirect
+from django.db import IntegrityError, models, transaction
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
-
-from .models import User, Listing, Bid, Watchlist, Comment
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_POST
+from django.views.decorators.vary import vary_on_cookie
+
+from .archive import get_listing
+from .bidding import place_bid, place_proxy_bid
+from .closing import close_listing
+from .conditional import feed_etag, feed_last_modified, listing_etag, listing_last_modified, listing_state
+from .events import get_broker, format_sse
+from .exports import EXPORTS, CONTENT_TYPES, stream_export
+from .images import PLACEHOLDER, THUMBNAIL_SIZES, get_thumbnail
+from .instrumentation import stats as instrumentation_stats
+from .models import User, Category, Listing, ArchivedListing, Bid, ArchivedBid, ProxyBid, Watchlist, Comment
+from .pagination import get_page_size, keyset_page
+from .routers import read_from_replica, stick_to_primary
+from .search import get_search_backend
+from .snapshots import aget_listing_snapshot, get_listing_snapshot
 
 
 class NewListingForm(forms.Form):
@@ -15,51 +35,121 @@ class NewListingForm(forms.Form):
     starting_bid = forms.IntegerField(widget=forms.TextInput(attrs={'class' : 'form-control'}))
     image_url = forms.URLField(required=False, widget=forms.TextInput(attrs={'class' : 'form-control'}))
     category = forms.CharField(required=False, widget=forms.TextInput(attrs={'class' : 'form-control'}))
+    end_at = forms.DateTimeField(required=False, label="Ends at", widget=forms.DateTimeInput(attrs={'class' : 'form-control', 'type': 'datetime-local'}))
     active = forms.BooleanField(required=False, widget=forms.HiddenInput(), initial=True)
 
 class NewBid(forms.Form):
     bid = forms.IntegerField(widget=forms.TextInput(attrs={'class' : 'form-control'}))
+    automatic = forms.BooleanField(required=False, label="Bid for me up to this amount")
 
 class NewComment(forms.Form):
     your_comment = forms.CharField(widget=forms.Textarea(attrs={'class' : 'form-control'}))
 
 
+def listing_to_dict(listing):
+    '''Returns the fields of a listing shown in the feeds as a JSON friendly dict'''
+    return {
+        "id": listing.id,
+        "title": listing.listing_title,
+        "description": listing.listing_description,
+        "current_bid": listing.current_bid,
+        "image_url": listing.listing_image_url,
+        "category": listing.listing_category,
+        "active": listing.active,
+        "bid_count": listing.bid_count,
+        "comment_count": listing.comment_count,
+    }
+
+
+def bid_to_dict(bid):
+    '''Returns a bid shown in a bid history as a JSON friendly dict'''
+    return {
+        "id": bid.id,
+        "listing": bid.listing_id,
+        "listing_title": bid.listing.listing_title,
+        "user": bid.user.username,
+        "amount": bid.amount,
+    }
+
+
+def render_feed(request, template, context_name, queryset, context=None, to_dict=listing_to_dict, archived=None):
+    '''
+    Renders one keyset paginated page of a feed, of listings unless another
+    to_dict is given, or its JSON variant when the request asks for ?format=json.
+    The rows of an archived queryset are shown in the same feed
+    '''
+    others = [archived] if archived is not None else []
+    page = keyset_page(request, queryset, *others)
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "results": [to_dict(row) for row in page],
+            "next": page.next_cursor,
+            "prev": page.prev_cursor,
+        })
+    context = dict(context or {})
+    context[context_name] = page.object_list
+    context["page"] = page
+    return render(request, template, context)
+
+
+@read_from_replica
+@vary_on_cookie
+@condition(etag_func=feed_etag, last_modified_func=feed_last_modified)
 def index(request):
-    '''Gives back all the active listings in the database'''
-    return render(request, "auctions/index.html", {
-        "active_listings": [listing for listing in Listing.objects.all().filter(active=True) ]
-    })
+    '''Gives back the active listings in the database, one page at a time'''
+    return render_feed(request, "auctions/index.html", "active_listings",
+        Listing.objects.active())
 
 
+@read_from_replica
 def inactive(request):
-    '''Gives back all the inactive listings in the database '''
-    return render(request, "auctions/inactive.html", {
-        "inactive_listings": [listing for listing in Listing.objects.all().filter(active=False) ]
-    })
+    '''Gives back the inactive listings in the database, archived ones included, one page at a time '''
+    return render_feed(request, "auctions/inactive.html", "inactive_listings",
+        Listing.objects.inactive(), archived=ArchivedListing.objects.all())
 
 
 
+@read_from_replica
 def categories(request):
     """
     A function that displays links to all listing categories avaliable 
     """
-    categories = Listing.objects.values('listing_category').distinct().exclude(listing_category__exact='')
+    categories = Category.objects.filter(total_count__gt=0).order_by('name')
     return render(request, "auctions/categories.html", {
     "categories": categories
 })  
 
 
-def category_view(request, category):
+@read_from_replica
+def category_view(request, category=None):
     '''
-    A function that returns a list of all listings under a specific category    
+    A function that returns the listings under a specific category, one page at a time
     '''
-    return render(request, "auctions/category_view.html", {
-        "category": category, 
-        "category_listings": [listing for listing in Listing.objects.all().filter(listing_category=category) ]
-    })
+    if category is None:
+        return redirect('categories')
+    return render_feed(request, "auctions/category_view.html", "category_listings",
+        Listing.objects.filter(category__key=Category.clean_name(category).casefold()), {"category": category})
+
 
 
+def search(request):
+    '''
+    A function that returns the listings best matching the words searched for,
+    the last word also matching as the start of a longer one
+    '''
+    query = request.GET.get("q", "")
+    ids = get_search_backend().search(query, get_page_size(request))
+    found = Listing.objects.in_bulk(ids)
+    results = [found[listing_id] for listing_id in ids if listing_id in found]
+    if request.GET.get("format") == "json":
+        return JsonResponse({"query": query, "results": [listing_to_dict(listing) for listing in results]})
+    return render(request, "auctions/search.html", {
+        "query": query,
+        "results": results
+    })
 
+
+@stick_to_primary
 def login_view(request):
     if request.method == "POST":
 
@@ -80,11 +170,13 @@ def login_view(request):
         return render(request, "auctions/login.html")
 
 
+@stick_to_primary
 def logout_view(request):
     logout(request)
     return HttpResponseRedirect(reverse("index"))
 
 
+@stick_to_primary
 def register(request):
     if request.method == "POST":
         username = request.POST["username"]
@@ -112,6 +204,7 @@ def register(request):
         return render(request, "auctions/register.html")
 
 @login_required
+@stick_to_primary
 def create(request):
     ''' A function to create a new listing '''
 
@@ -124,118 +217,133 @@ def create(request):
             starting_bid = form.cleaned_data['starting_bid']
             current_bid = form.cleaned_data['starting_bid']
             image_url = form.cleaned_data['image_url']
-            category = form.cleaned_data['category']
+            category = Category.for_name(form.cleaned_data['category'])
             active = form.cleaned_data['active']
+            end_at = form.cleaned_data['end_at']
             highest_bidder = user
             if Listing.objects.filter(listing_title=title).exists():
                 return render(request, "auctions/create.html", {
                     "form": form,
                     "message": "A Listing with that name already exists, try naming it differently."
                 })
+            elif end_at is not None and end_at <= timezone.now():
+                return render(request, "auctions/create.html", {
+                    "form": form,
+                    "message": "The end time of a listing must be in the future."
+                })
             else:
-                listing = Listing(user= user, listing_title= title, listing_description= description, starting_bid= starting_bid, listing_image_url= image_url, listing_category= category, active= active, current_bid=current_bid, highest_bidder=highest_bidder)
+                listing = Listing(user= user, listing_title= title, listing_description= description, starting_bid= starting_bid, listing_image_url= image_url, listing_category= category.name if category else "", category= category, active= active, current_bid=current_bid, highest_bidder=highest_bidder, end_at=end_at)
                 listing.save()
-                return render(request, "auctions/index.html", {
-                    "active_listings": [listing for listing in Listing.objects.all().filter(active=True) ]
-                })
+                return redirect('index')
     return render(request, "auctions/create.html",{
         "form": NewListingForm()
     })
 
 
 
-def listing(request, listing):
-    '''A function used to present a certain listing'''
-    user = request.user
-    listing = Listing.objects.get(listing_title=listing)
-    comments = Comment.objects.all().filter(listing=listing)
+def render_listing(request, listing, user, on_watchlist):
+    '''Renders the page of a listing snapshot for user'''
+    live_updates = getattr(settings, "AUCTIONS_LIVE_UPDATES", False)
     if not user.is_authenticated:
         return render(request, "auctions/listing_no_login.html", {
             "listing": listing,
-            "comments": comments
+            "comments": listing["comments"],
+            "live_updates": live_updates,
         })
     else:
-        
-        watchlist = Watchlist.objects.all().filter(user=user, listing=listing)
-        
-        if watchlist:
-            on_watchlist_id = watchlist[0].id
-            on_watchlist = Watchlist.objects.get(id=on_watchlist_id)
-        else:
-            watchlist = Watchlist.create(user, listing, False)
-            watchlist.save()
-            watchlist = Watchlist.objects.all().filter(user=user, listing=listing)
-            on_watchlist_id = watchlist[0].id
-            on_watchlist = Watchlist.objects.get(id=on_watchlist_id)
-            
-        Listing.refresh_from_db(listing)  
-        if listing.winner == user:
+        if listing["winner_id"] == user.id:
             message = "Congratulations you are the winner of this auction"
             return render(request, "auctions/listing.html", {
             "listing": listing,
             "user": user,
             "message": message,
-            "on_watchlist": on_watchlist.on_watchlist,
-            "comments": comments,
+            "on_watchlist": on_watchlist,
+            "comments": listing["comments"],
+            "live_updates": live_updates,
             })
         return render(request, "auctions/listing.html", {
             "listing": listing,
             "user": user,
-            "on_watchlist": on_watchlist.on_watchlist,
-            "comments": comments,
+            "on_watchlist": on_watchlist,
+            "comments": listing["comments"],
+            "live_updates": live_updates,
         })
 
+
+@vary_on_cookie
+@condition(etag_func=listing_etag, last_modified_func=listing_last_modified)
+def listing(request, listing_id):
+    '''A function used to present a certain listing'''
+    user = request.user
+    # Everything but the user's own watchlist flag comes from the cached snapshot
+    listing = get_listing_snapshot(listing_id)
+    on_watchlist = False
+    if user.is_authenticated:
+        # Read along with the ETag, in the same query
+        state = listing_state(request, listing_id)
+        on_watchlist = bool(state and state[1])
+    return render_listing(request, listing, user, on_watchlist)
+
+def own_maximum(user):
+    '''The hidden maximum user has on a listing, None if they have none, to annotate listings with'''
+    return models.Subquery(ProxyBid.objects.filter(user=user, listing=models.OuterRef("pk")).values("max_amount")[:1])
+
+
 @login_required
-def bid(request, listing):
-    '''A function used to place a bid '''
+@stick_to_primary
+def bid(request, listing_id):
+    '''A function used to place a bid, or a maximum to be bid automatically up to '''
 
-    listing = Listing.objects.get(listing_title=listing)
+    listing = get_object_or_404(Listing.objects.annotate(own_maximum=own_maximum(request.user)), pk=listing_id)
     current_bid = listing.current_bid
     if request.method == "POST":
         form = NewBid(request.POST)
         if form.is_valid():
-            new_bid = form.cleaned_data['bid']
-            # Check that the bid placed is higher than the current bid
-            if new_bid < current_bid:
-                message = "Bid must be higher than current bid."
-                return render(request, "auctions/bid.html", {
-                    "listing": listing,
-                    "form": NewBid(),
-                    "current_bid": current_bid,
-                    "message": message
-                })
-            # In case the bid is higher we save the bid and update the database of the new highest bid    
+            # The bid is only saved if it is still higher than the current bid when it reaches the database
+            if form.cleaned_data['automatic']:
+                result = place_proxy_bid(request.user, listing, form.cleaned_data['bid'])
             else:
-                user = request.user
-                bid_to_save = Bid(user=user, listing=listing, amount=new_bid)
-                bid_to_save.save()
-                update_listing = Listing.objects.get(listing_title=listing.listing_title)
-                update_listing.current_bid = new_bid
-                update_listing.highest_bidder = user
-                update_listing.save()
-                Listing.refresh_from_db(listing)
-                return redirect('listing', listing=listing.listing_title)
-    
-    Listing.refresh_from_db(listing)            
+                result = place_bid(request.user, listing, form.cleaned_data['bid'])
+            if not result.accepted:
+                if not result.active:
+                    message = "This listing is no longer active."
+                elif form.cleaned_data['automatic']:
+                    message = "Maximum must be higher than the current bid and your last maximum."
+                else:
+                    message = "Bid must be higher than current bid."
+            elif result.highest_bidder_id != request.user.id:
+                message = "Another bidder's maximum is higher, you have been outbid."
+                if form.cleaned_data['automatic']:
+                    listing.own_maximum = form.cleaned_data['bid']
+            else:
+                return redirect('listing', listing_id=listing.id)
+            return render(request, "auctions/bid.html", {
+                "listing": listing,
+                "form": NewBid(),
+                "current_bid": result.current_bid,
+                "max_amount": listing.own_maximum,
+                "message": message
+            })
+
     return render(request, "auctions/bid.html", {
         "listing": listing,
         "form": NewBid(),
-        "current_bid": current_bid
+        "current_bid": current_bid,
+        "max_amount": listing.own_maximum,
     })
 
 
-def comment(request, listing):
+@stick_to_primary
+def comment(request, listing_id):
     '''A function used to add comments to a listing '''
 
-    listing = Listing.objects.get(listing_title=listing)
+    listing = get_object_or_404(Listing, pk=listing_id)
     if request.method == "POST":
         form = NewComment(request.POST)
         if form.is_valid():
             comment = form.cleaned_data['your_comment']
-            user = request.user
-            comment_to_save = Comment(user=user, listing=listing, comment=comment)
-            comment_to_save.save()
-            return redirect('listing', listing=listing.listing_title)
+            Comment.add(request.user, listing, comment)
+            return redirect('listing', listing_id=listing.id)
 
     else:   
         return render(request, "auctions/comment.html", {
@@ -244,48 +352,172 @@ def comment(request, listing):
         })
 
 
-def close_auction(request, listing):
-    ''' A function used to close an auction and declare a winner '''
-    listing = Listing.objects.get(listing_title=listing)
-    update_listing = Listing.objects.get(listing_title=listing.listing_title)
-    update_listing.winner = listing.highest_bidder
-    update_listing.active = False
-    update_listing.save()
-    Listing.refresh_from_db(listing)  
+@login_required
+@require_POST
+@stick_to_primary
+def close_auction(request, listing_id):
+    ''' A function used by its owner to close an auction and declare a winner '''
+    get_object_or_404(Listing.objects.only("id"), pk=listing_id, user=request.user)
+    close_listing(listing_id)
     return redirect('index')
 
-def watchlist(request, listing):
+async def listing_event_stream(listing_id, snapshot, keepalive=15):
+    '''
+    Yields the current state of a listing followed by every bid and close
+    event published for it, as Server-Sent Events
+    '''
+    broker = get_broker()
+    subscription = broker.subscribe(listing_id)
+    try:
+        yield format_sse({
+            "type": "state",
+            "listing": listing_id,
+            "current_bid": snapshot["current_bid"],
+            "active": snapshot["active"],
+        })
+        while True:
+            try:
+                event = await subscription.get(timeout=keepalive)
+            except asyncio.TimeoutError:
+                # Comment line so proxies do not close an idle connection
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def listing_events(request, listing_id):
+    '''
+    A view that pushes price changes and the closing of a listing to its viewers.
+    It holds its connection open, so it is only served with AUCTIONS_LIVE_UPDATES
+    on, through commerce/asgi.py. A WSGI server would buffer the endless stream
+    and tie up a worker for good, so it answers 204, which stops EventSource reconnecting
+    '''
+    if not getattr(settings, "AUCTIONS_LIVE_UPDATES", False):
+        return HttpResponse(status=204)
+    snapshot = await aget_listing_snapshot(listing_id)
+    response = StreamingHttpResponse(listing_event_stream(listing_id, snapshot), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+@stick_to_primary
+def watchlist(request, listing_id):
     '''A function that adds or removes a listing from a user's watchlist '''
-    the_listing = Listing.objects.get(listing_title=listing)
+    the_listing = get_object_or_404(Listing, pk=listing_id)
     user = request.user
-    watchlist = Watchlist.objects.all().filter(listing=the_listing, user=user)
-    on_watchlist_id = watchlist[0].id
-    on_watchlist = Watchlist.objects.get(id=on_watchlist_id)
 
     # If the listing is on the user's watchlist we remove it
-    if on_watchlist.on_watchlist == True:
-        on_watchlist.on_watchlist = False
-        on_watchlist.save()
+    removed, _ = Watchlist.objects.filter(listing=the_listing, user=user).delete()
 
     # If it is not on the user's watchlist we add it
-    elif on_watchlist.on_watchlist == False:
-        on_watchlist.on_watchlist = True
-        on_watchlist.save()
+    if not removed:
+        try:
+            with transaction.atomic():
+                Watchlist.create(user, the_listing).save()
+        except IntegrityError:
+            # Added by another request from the same user in the meantime
+            pass
+
+    return redirect('listing', listing_id=the_listing.id)
 
-    return redirect('listing', listing=listing)
+
+def thumbnail(request, listing_id, size):
+    '''
+    Serves a listing's image resized to one of the THUMBNAIL_SIZES from the
+    local image cache, or a placeholder when the image cannot be fetched.
+    The templates put a hash of the image url in the url, so it can be cached for good
+    '''
+    if size not in THUMBNAIL_SIZES:
+        raise Http404("No such thumbnail size")
+    image_url = get_listing(listing_id, ["listing_image_url"]).listing_image_url
+    if not image_url:
+        raise Http404("Listing has no image")
+    image = get_thumbnail(image_url, size)
+    if image is None:
+        response = HttpResponse(PLACEHOLDER, content_type="image/svg+xml")
+        patch_cache_control(response, public=True, max_age=60)
+        return response
+    response = HttpResponse(image[0], content_type=image[1])
+    patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+    return response
+
+
+def legacy_listing_redirect(request, listing, view_name):
+    '''Permanently redirects an old title based listing url to its id based one'''
+    the_listing = get_object_or_404(Listing.objects.only("id"), listing_title=listing)
+    return redirect(view_name, listing_id=the_listing.id, permanent=True)
+
+
+def bid_history(bids):
+    '''Bids with the usernames and listing titles a bid history shows, in one query'''
+    return bids.select_related("user", "listing").only(
+        "id", "amount", "listing__id", "listing__listing_title", "user__id", "user__username")
+
+
+@read_from_replica
+def listing_bids(request, listing_id):
+    '''Every bid placed on a listing, archived or not, oldest first, one page at a time'''
+    the_listing = get_listing(listing_id, ["id", "listing_title"])
+    return render_feed(request, "auctions/bids.html", "bids", bid_history(the_listing.bid_on_listing.all()),
+        {"heading": f"Bids on {the_listing.listing_title}"}, to_dict=bid_to_dict)
+
+
+@read_from_replica
+def user_bids(request, username):
+    '''Every bid a user has placed, on archived listings too, oldest first, one page at a time'''
+    bidder = get_object_or_404(User.objects.only("id", "username"), username=username)
+    return render_feed(request, "auctions/bids.html", "bids", bid_history(Bid.objects.filter(user=bidder)),
+        {"heading": f"Bids by {bidder.username}"}, to_dict=bid_to_dict,
+        archived=bid_history(ArchivedBid.objects.filter(user=bidder)))
 
 
+@login_required
+@read_from_replica
 def watchlist_view(request):
     """
-    A view that shows all of the items on the current user's watchlist
+    A view that shows the items on the current user's watchlist, one page at a time
     """
     user = request.user
-    listed_in_watchlist = Watchlist.objects.all().filter(user=user, on_watchlist=True).values_list('listing', flat=True)
-    return render(request, "auctions/watchlist_view.html", {
-        "watchlist": [listing for listing in Listing.objects.all().filter(id__in=listed_in_watchlist)]
-        
-    })
-
-
-
-
+    listed_in_watchlist = Watchlist.objects.filter(user=user).values('listing')
+    return render_feed(request, "auctions/watchlist_view.html", "watchlist",
+        Listing.objects.filter(id__in=listed_in_watchlist))
+
+
+@staff_member_required
+def instrumentation(request):
+    '''Per view request time histograms, query counts and SQL time recorded by InstrumentationMiddleware'''
+    return JsonResponse({"enabled": settings.AUCTIONS_INSTRUMENTATION, "views": instrumentation_stats.summary()})
+
+
+@staff_member_required
+def instrumentation_metrics(request):
+    '''The same statistics in the Prometheus text exposition format, for scraping'''
+    return HttpResponse(instrumentation_stats.prometheus(), content_type="text/plain; version=0.0.4")
+
+
+@staff_member_required
+def instrumentation_slowest(request):
+    '''Downloads the slowest ?n= requests seen by this process with every query they ran'''
+    try:
+        count = max(1, int(request.GET.get("n", 10)))
+    except ValueError:
+        count = 10
+    response = JsonResponse({"requests": instrumentation_stats.slowest(count)}, json_dumps_params={"indent": 2})
+    response["Content-Disposition"] = 'attachment; filename="slowest_requests.json"'
+    return response
+
+
+@staff_member_required
+def export(request, table):
+    '''Streams every row of bids, listings or comments as ?format=csv (the default) or ndjson'''
+    export_format = request.GET.get("format", "csv")
+    if table not in EXPORTS or export_format not in CONTENT_TYPES:
+        raise Http404("No such export")
+    content_type, chunks = stream_export(table, export_format)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{table}.{export_format}"'
+    return response
@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
+# Serve the browse pages with the native async views, see AUCTIONS_ASYNC_VIEWS
+os.environ.setdefault('AUCTIONS_ASYNC_VIEWS', '1')
+# Stream price changes to the listing pages, see AUCTIONS_LIVE_UPDATES
+os.environ.setdefault('AUCTIONS_LIVE_UPDATES', '1')
 
 application = get_asgi_application()
@@ -31,7 +31,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'auctions',
+    'auctions.apps.AuctionsConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctions.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +84,142 @@ DATABASES = {
 
 AUTH_USER_MODEL = 'auctions.User'
 
+
+# Pragmas run on every new SQLite connection, and how many times a bid is
+# retried when SQLite reports "database is locked". settings_production
+# turns on WAL and persistent connections
+AUCTIONS_SQLITE_PRAGMAS = {}
+
+AUCTIONS_SQLITE_LOCKED_RETRIES = 3
+
+
+# Read replicas
+# The browse feeds read from a random one of AUCTIONS_READ_REPLICAS, copies
+# of the default database kept up to date outside of Django. After writing
+# something a user reads from the primary for AUCTIONS_REPLICA_LAG_SECONDS,
+# so they always see their own changes. Each replica is an alias added to
+# DATABASES for a real copy, commerce/settings_test.py adds one for the tests
+
+DATABASE_ROUTERS = ['auctions.routers.ReplicaRouter']
+
+AUCTIONS_READ_REPLICAS = []
+
+AUCTIONS_REPLICA_LAG_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered listing cards, used by {% cache %}. Cards are keyed by
+    # Listing.card_version, so a bid or close renders a fresh card and the old
+    # one is simply never read again. Room for a few full pages of cards
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+# Seconds auctions.users.CachedUserMiddleware, used by settings_production,
+# keeps a signed in user in the cache. Saving the user or logging out drops
+# it straight away
+AUCTIONS_USER_CACHE_TIMEOUT = 300
+
+# Seconds a listing page snapshot may be served from the cache. Bids, comments
+# and closing an auction drop the snapshot straight away, this only bounds
+# how stale anything else (like an owner renaming themselves) can get
+LISTING_SNAPSHOT_TIMEOUT = 300
+
+
+# Live listing updates
+# When on, the listing pages keep an EventSource open on /listing/<id>/events
+# for the price. The stream holds its connection open, which only an ASGI
+# server can do, so commerce/asgi.py turns it on. Under WSGI the stream
+# answers 204 and the pages do not open it
+AUCTIONS_LIVE_UPDATES = os.environ.get('AUCTIONS_LIVE_UPDATES') == '1'
+
+# Broker that fans bid and close events out to the viewers of a listing.
+# The in-process broker only reaches viewers connected to the same process
+
+AUCTIONS_EVENT_BROKER = 'auctions.events.InProcessBroker'
+
+
+# Auction end times
+# A bid placed this many seconds or less before a listing ends moves its end
+# time to this many seconds after the bid. Due auctions are closed by
+# `manage.py close_auctions`, run from cron or with --loop
+
+AUCTIONS_SOFT_CLOSE_SECONDS = 300
+
+
+# Archive
+# `manage.py archive_listings`, run from cron, moves listings closed for
+# longer than this many days, with their bids and comments, into the archive
+# tables. The closed listings feed and the listing pages read from both
+
+AUCTIONS_ARCHIVE_AFTER_DAYS = 90
+
+
+# Proxy bidding
+# Users may leave a hidden maximum instead of a bid. Each bid is answered by
+# the highest maximum on the listing, bidding this much above the next
+# highest, or the current bid, up to its maximum
+
+AUCTIONS_BID_INCREMENT = 1
+
+
+# Search
+# Full-text index behind the search page, auctions.search.PostgresSearchBackend
+# when running on PostgreSQL
+
+AUCTIONS_SEARCH_BACKEND = 'auctions.search.SQLiteSearchBackend'
+
+
+# Listing images
+# Listing images are fetched by the server, resized and kept on disk, and the
+# pages link to /listing/<id>/thumbnail/<size> instead of the original url.
+# The least recently used thumbnails are deleted once they take more than
+# AUCTIONS_IMAGE_CACHE_MAX_BYTES. An image that cannot be fetched within
+# AUCTIONS_IMAGE_FETCH_TIMEOUT seconds is shown as a placeholder and not
+# tried again for AUCTIONS_IMAGE_RETRY_SECONDS. Resizing needs Pillow,
+# without it images are served at their original size
+
+AUCTIONS_IMAGE_FETCHER = 'auctions.images.URLFetcher'
+
+AUCTIONS_IMAGE_CACHE_DIR = os.path.join(BASE_DIR, 'image_cache')
+
+AUCTIONS_IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+AUCTIONS_IMAGE_FETCH_TIMEOUT = 3
+
+AUCTIONS_IMAGE_RETRY_SECONDS = 300
+
+
+# Request instrumentation
+# When on, every request's wall time, query count, SQL time and repeated
+# queries are recorded per view, for staff at /instrumentation,
+# /instrumentation/metrics (Prometheus) and /instrumentation/slowest?n=.
+# The middleware removes itself when off. Statistics are per process
+
+AUCTIONS_INSTRUMENTATION = os.environ.get('AUCTIONS_INSTRUMENTATION') == '1'
+
+# Number of slowest requests, with their SQL, kept for /instrumentation/slowest
+AUCTIONS_INSTRUMENTATION_SLOWEST = 50
+
+
+# Async browse views
+# When on, the index, inactive, categories, category, watchlist and listing
+# pages are served by the native async views in auctions/async_views.py,
+# which wait on the database without holding a thread. commerce/asgi.py
+# turns it on, under WSGI the sync views are faster. The instrumentation
+# middleware is sync only, so it runs the views in a thread when it is on
+
+AUCTIONS_ASYNC_VIEWS = os.environ.get('AUCTIONS_ASYNC_VIEWS') == '1'
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -120,3 +257,15 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Listing feeds
+# Number of listings per page on the index, inactive, category and watchlist
+# feeds, and the largest ?page_size= a client may ask for
+
+AUCTIONS_PAGE_SIZE = 20
+
+AUCTIONS_MAX_PAGE_SIZE = 100
+
+# Most listing ids one /api/v1/ batch request may name
+AUCTIONS_API_MAX_BATCH = 100
@@ -0,0 +1,69 @@
+"""
+Production settings for commerce, run with DJANGO_SETTINGS_MODULE=commerce.settings_production.
+
+Everything not set here comes from commerce/settings.py.
+"""
+
+import copy
+
+from .settings import *
+
+# Copied so changing them here never reaches back into commerce.settings
+DATABASES = copy.deepcopy(DATABASES)
+
+TEMPLATES = copy.deepcopy(TEMPLATES)
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',')
+
+
+# SQLite
+# Connections are kept for a minute instead of opened per request, and wait
+# up to 20 seconds for a lock before failing with "database is locked".
+# WAL lets readers carry on while a bid is being written, and with WAL a
+# synchronous=NORMAL commit can only be lost to a power cut, never corrupted.
+# cache_size is in KiB when negative
+
+DATABASES['default']['CONN_MAX_AGE'] = 60
+
+DATABASES['default']['OPTIONS'] = {'timeout': 20}
+
+AUCTIONS_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'temp_store': 'memory',
+}
+
+AUCTIONS_SQLITE_LOCKED_RETRIES = 5
+
+
+# Templates
+# Each template is read and compiled once per process instead of on every render
+
+TEMPLATES[0]['APP_DIRS'] = False
+
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+
+# Sessions and users
+# Sessions are read from the cache and only written through to the database,
+# and the signed in user is cached too, so an authenticated page view does
+# not start with a session query and a user query. Both need a cache shared
+# by every process, the default locmem cache only works with a single one
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+MIDDLEWARE = [
+    'auctions.users.CachedUserMiddleware' if name == 'django.contrib.auth.middleware.AuthenticationMiddleware' else name
+    for name in MIDDLEWARE
+]
@@ -0,0 +1,23 @@
+"""
+Test settings for commerce, which manage.py uses for the test command.
+
+Everything not set here comes from commerce/settings.py.
+"""
+
+import copy
+
+from .settings import *
+
+# Copied so changing them here never reaches back into commerce.settings
+DATABASES = copy.deepcopy(DATABASES)
+
+
+# Read replicas
+# A second database for ReplicaRoutingTests to send the feed reads to, so
+# what was read from where shows. In memory, so no test run leaves a
+# database file behind
+
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': ':memory:',
+}
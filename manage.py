@@ -5,7 +5,9 @@ import sys
 
 
 def main():
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
+    # The tests also need the replica database commerce/settings_test.py adds
+    test = sys.argv[1:2] == ['test']
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings_test' if test else 'commerce.settings')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: